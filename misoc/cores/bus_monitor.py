@@ -0,0 +1,87 @@
+"""
+Wishbone bus performance monitor.
+
+The monitor passively taps a Wishbone interface and counts, over a window of
+``2**period_bits`` cycles:
+  * transactions (a single access, or a complete burst)
+  * read and write transactions
+  * data beats (acknowledged accesses, including burst beats)
+  * wait cycles, i.e. cycles where the master is requesting but the slave
+    has not acknowledged yet
+  * errors
+
+At the end of each window, the counters are latched and reset. Writing to
+``update`` copies the latched values of the last complete window into the
+status CSRs.
+"""
+
+from migen import *
+
+from misoc.interconnect.csr import *
+
+
+class WindowCounters(Module):
+    """Counts events over windows of ``2**period_bits`` cycles.
+
+    ``events`` is a list of (CSRStatus, event) pairs. The counts of each
+    window are latched at its end, and copied into the CSRs when ``update``
+    is asserted. Counters are ``period_bits + 1`` wide, so that an event
+    present in every cycle of a window does not wrap.
+    """
+    def __init__(self, update, events, period_bits):
+        counter = Signal(period_bits)
+        period = Signal()
+        self.sync += Cat(counter, period).eq(counter + 1)
+
+        for csr, event in events:
+            count = Signal(period_bits + 1)
+            count_r = Signal(period_bits + 1)
+            self.sync += [
+                If(period,
+                    count_r.eq(count),
+                    count.eq(event)
+                ).Elif(event,
+                    count.eq(count + 1)
+                ),
+                If(update,
+                    csr.status.eq(count_r)
+                )
+            ]
+
+
+class WishboneMonitor(Module, AutoCSR):
+    def __init__(self, bus, period_bits=24):
+        self._update = CSR()
+        self._transactions = CSRStatus(period_bits + 1)
+        self._reads = CSRStatus(period_bits + 1)
+        self._writes = CSRStatus(period_bits + 1)
+        self._beats = CSRStatus(period_bits + 1)
+        self._wait_cycles = CSRStatus(period_bits + 1)
+        self._errors = CSRStatus(period_bits + 1)
+
+        ###
+
+        request = Signal()
+        ack = Signal()
+        err = Signal()
+        we = Signal()
+        last = Signal()
+        self.sync += [
+            request.eq(bus.cyc & bus.stb),
+            ack.eq(bus.cyc & bus.stb & bus.ack),
+            err.eq(bus.cyc & bus.stb & bus.err),
+            we.eq(bus.we),
+            last.eq((bus.cti == 0) | (bus.cti == 7))
+        ]
+        done = Signal()
+        self.comb += done.eq((ack & last) | err)
+
+        events = [
+            (self._transactions, done),
+            (self._reads, done & ~we),
+            (self._writes, done & we),
+            (self._beats, ack),
+            (self._wait_cycles, request & ~ack & ~err),
+            (self._errors, err)
+        ]
+        self.submodules += WindowCounters(self._update.re, events, period_bits)
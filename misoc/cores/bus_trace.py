@@ -0,0 +1,199 @@
+"""
+On-chip bus transaction trace buffer.
+
+The trace core taps a list of Wishbone and/or LASMI master interfaces and
+records each completed access into a block RAM, together with a timestamp,
+the latency of the access and the index of the bus it was seen on. For
+Wishbone, every acknowledged beat is an access; for LASMI, every accepted
+request.
+
+Addresses, both recorded and in ``trigger_address``, are the word addresses
+of each bus (``adr``), not byte addresses: on a 32-bit Wishbone bus, the byte
+address divided by 4.
+
+Writing to ``arm`` clears the buffer and the timestamp counter, and starts
+waiting for the trigger. The trigger fires on the first access whose address
+matches ``trigger_address`` on the bits set in ``trigger_mask``, and whose
+type is enabled in ``trigger_type`` (bit 0: reads, bit 1: writes). The
+triggering access and all the following ones are then recorded until the
+buffer is full. Entries are stored in timestamp order. ``count`` gives the
+number of recorded entries, and ``dropped`` the number of accesses that could
+not be recorded (all of them, even when several buses lose one in the same
+cycle), because several buses completed accesses at the same time for too
+long, or because they were still queued when the buffer became full.
+
+Software reads the entries back through the ``mem`` CSR memory. Each entry
+is 128 bits wide, with the fields given by ``entry_layout`` (LSB first).
+The CSR bus only maps 512 words of a memory at a time, so deeper buffers
+are paged: the ``mem_page`` CSR (e.g. ``bus_trace_mem_page``) selects the
+page, which holds ``misoc.tools.bustrace.entries_per_page(csr_data_width)``
+entries (32 with 8-bit CSRs). The ``misoc.tools.bustrace`` host tool decodes
+a dump of this memory, made by concatenating the pages.
+"""
+
+from migen import *
+from migen.genlib.fifo import SyncFIFO
+
+from misoc.interconnect.csr import *
+
+
+entry_layout = [
+    ("timestamp", 32),
+    ("latency",   16),
+    ("master",     8),
+    ("we",         1),
+    ("err",        1),
+    ("reserved",   6),
+    ("address",   32),
+    ("padding",   32)
+]
+
+
+def _tap(bus):
+    # returns (request, done, address, we, err)
+    if hasattr(bus, "req_ack"):
+        return bus.stb, bus.stb & bus.req_ack, bus.adr, bus.we, 0
+    else:
+        request = bus.cyc & bus.stb
+        return request, request & (bus.ack | bus.err), bus.adr, bus.we, bus.err
+
+
+class BusTrace(Module, AutoCSR):
+    def __init__(self, buses, depth=512, fifo_depth=4):
+        self._arm = CSR()
+        self._trigger_address = CSRStorage(32)
+        self._trigger_mask = CSRStorage(32)
+        self._trigger_type = CSRStorage(2, reset=0b11)
+        self._triggered = CSRStatus()
+        self._count = CSRStatus(bits_for(depth))
+        self._dropped = CSRStatus(16)
+
+        self.mem = Memory(128, depth)
+
+        ###
+
+        port = self.mem.get_port(write_capable=True)
+        self.specials += self.mem, port
+
+        armed = Signal()
+        triggered = Signal()
+        timestamp = Signal(32)
+        count = self._count.status
+        dropped = self._dropped.status
+        full = Signal()
+        discarded = Signal()
+        self.comb += [
+            full.eq(count == depth),
+            self._triggered.status.eq(triggered)
+        ]
+        self.sync += [
+            timestamp.eq(timestamp + 1),
+            If(self._arm.re,
+                timestamp.eq(0)
+            )
+        ]
+
+        # capture
+        fifos = []
+        matches = []
+        dropping = []
+        recording = Signal()
+        for n, bus in enumerate(buses):
+            request, done, address, we, err = _tap(bus)
+
+            latency = Signal(16)
+            self.sync += \
+                If(done | ~request,
+                    latency.eq(0)
+                ).Elif(latency != 2**16-1,
+                    latency.eq(latency + 1)
+                )
+
+            match = Signal()
+            self.comb += match.eq(done &
+                (((address ^ self._trigger_address.storage) &
+                  self._trigger_mask.storage) == 0) &
+                Mux(we, self._trigger_type.storage[1],
+                        self._trigger_type.storage[0]))
+            matches.append(match)
+
+            entry = Record(entry_layout)
+            fifo = SyncFIFO(len(entry), fifo_depth)
+            self.submodules += fifo
+            fifos.append(fifo)
+            self.comb += [
+                entry.timestamp.eq(timestamp),
+                entry.latency.eq(latency + 1),
+                entry.master.eq(n),
+                entry.we.eq(we),
+                entry.err.eq(err),
+                entry.address.eq(address),
+                fifo.din.eq(entry.raw_bits()),
+                fifo.we.eq(done & recording)
+            ]
+            dropping.append(fifo.we & ~fifo.writable)
+
+        trigger = Signal()
+        self.comb += [
+            trigger.eq(armed & (Cat(*matches) != 0)),
+            recording.eq(armed & ~full & (triggered | trigger))
+        ]
+        self.sync += [
+            If(self._arm.re,
+                armed.eq(1),
+                triggered.eq(0),
+                dropped.eq(0)
+            ).Else(
+                If(trigger,
+                    triggered.eq(1)
+                ),
+                If(full,
+                    armed.eq(0)
+                ),
+                dropped.eq(dropped + sum(dropping) + discarded)
+            )
+        ]
+
+        # store, oldest entry first so that timestamps are in order.
+        # Entries still queued when the buffer is full are dropped.
+        heads = [Record(entry_layout) for fifo in fifos]
+        sel = 0
+        sel_readable = 0
+        sel_timestamp = 0
+        for n, (fifo, head) in enumerate(zip(fifos, heads)):
+            self.comb += head.raw_bits().eq(fifo.dout)
+            take = Signal()
+            new_sel = Signal(max=max(2, len(fifos)))
+            new_readable = Signal()
+            new_timestamp = Signal(32)
+            self.comb += [
+                take.eq(fifo.readable & (~sel_readable | (head.timestamp < sel_timestamp))),
+                If(take,
+                    new_sel.eq(n),
+                    new_readable.eq(1),
+                    new_timestamp.eq(head.timestamp)
+                ).Else(
+                    new_sel.eq(sel),
+                    new_readable.eq(sel_readable),
+                    new_timestamp.eq(sel_timestamp)
+                )
+            ]
+            sel, sel_readable, sel_timestamp = new_sel, new_readable, new_timestamp
+
+        self.comb += [
+            port.adr.eq(count),
+            port.dat_w.eq(Array(fifo.dout for fifo in fifos)[sel]),
+            port.we.eq(sel_readable & ~full),
+            discarded.eq(sel_readable & full)
+        ]
+        for n, fifo in enumerate(fifos):
+            self.comb += fifo.re.eq(sel_readable & (sel == n))
+        self.sync += \
+            If(self._arm.re,
+                count.eq(0)
+            ).Elif(port.we,
+                count.eq(count + 1)
+            )
+
+    def get_memories(self):
+        return [(True, self.mem)]
@@ -1,7 +1,11 @@
+from functools import reduce
+from operator import or_
+
 from migen import *
 from migen.genlib.roundrobin import *
 from migen.genlib.fsm import FSM, NextState
 from migen.genlib.fifo import SyncFIFO
+from migen.genlib.misc import WaitTimer
 
 from misoc.cores.lasmicon.multiplexer import *
 
@@ -26,6 +30,87 @@ class _AddressSlicer:
             return Cat(Replicate(0, self.address_align), address[:split])
 
 
+class _LookaheadQueue(Module):
+    # Request queue presenting on dout the oldest request among the first
+    # `lookahead` ones that has its hit bit set and no older pending request
+    # with the same tag (so that each master is served in order), or the
+    # head if there is none. Once the head has been bypassed max_age times,
+    # it is always presented. re removes the presented request.
+    def __init__(self, layout, depth, lookahead, max_age, tagbits):
+        lookahead = min(lookahead, depth)
+        self.din = Record(layout)
+        self.we = Signal()
+        self.writable = Signal()
+        self.dout = Record(layout)
+        self.readable = Signal()
+        self.re = Signal()
+        self.window = [Record(layout) for i in range(lookahead)]
+        self.hit = Signal(lookahead)
+        self.pending = Signal(2**tagbits)
+
+        ###
+
+        entries = [Record(layout) for i in range(depth)]
+        valid = Signal(depth)
+        self.comb += [
+            self.writable.eq(~valid[-1]),
+            self.readable.eq(valid[0])
+        ]
+        self.comb += [w.eq(e) for w, e in zip(self.window, entries)]
+        for t in range(2**tagbits):
+            self.comb += self.pending[t].eq(reduce(or_,
+                [v & (e.tag == t) for v, e in zip(valid, entries)]))
+
+        # selection
+        age = Signal(max=max_age+1)
+        expired = Signal()
+        self.comb += expired.eq(age == max_age)
+        sel = Signal(max=max(lookahead, 2))
+        for k in reversed(range(1, lookahead)):
+            older_same_tag = reduce(or_, [valid[j] & (entries[j].tag == entries[k].tag)
+                                          for j in range(k)])
+            self.comb += If(~expired & valid[k] & self.hit[k] & ~older_same_tag & ~self.hit[0],
+                sel.eq(k))
+        self.comb += self.dout.raw_bits().eq(Array(e.raw_bits() for e in self.window)[sel])
+        self.sync += \
+            If(self.re,
+                If(sel == 0,
+                    age.eq(0)
+                ).Elif(~expired,
+                    age.eq(age + 1)
+                )
+            )
+
+        # removal and insertion, keeping entries compacted at the head
+        shifted = [Record(layout) for i in range(depth)]
+        shifted_valid = Signal(depth)
+        for i in range(depth):
+            if i + 1 < depth:
+                next_entry, next_valid = entries[i+1].raw_bits(), valid[i+1]
+            else:
+                next_entry, next_valid = 0, 0
+            self.comb += \
+                If(self.re & (i >= sel),
+                    shifted[i].raw_bits().eq(next_entry),
+                    shifted_valid[i].eq(next_valid)
+                ).Else(
+                    shifted[i].raw_bits().eq(entries[i].raw_bits()),
+                    shifted_valid[i].eq(valid[i])
+                )
+            if i:
+                free = shifted_valid[i-1] & ~shifted_valid[i]
+            else:
+                free = ~shifted_valid[i]
+            self.sync += \
+                If(self.we & self.writable & free,
+                    entries[i].raw_bits().eq(self.din.raw_bits()),
+                    valid[i].eq(1)
+                ).Else(
+                    entries[i].raw_bits().eq(shifted[i].raw_bits()),
+                    valid[i].eq(shifted_valid[i])
+                )
+
+
 class BankMachine(Module):
     def __init__(self, geom_settings, timing_settings, controller_settings, address_align, bankn, req):
         self.refresh_req = Signal()
@@ -34,35 +119,61 @@ class BankMachine(Module):
 
         ###
 
-        # Request FIFO
-        layout = [("we", 1), ("adr", len(req.adr))]
-        req_in = Record(layout)
-        reqf = Record(layout)
-        self.submodules.req_fifo = SyncFIFO(layout_len(layout),
-                                            controller_settings.req_queue_size)
-        self.comb += [
-            self.req_fifo.din.eq(req_in.raw_bits()),
-            reqf.raw_bits().eq(self.req_fifo.dout)
-        ]
-        self.comb += [
-            req_in.we.eq(req.we),
-            req_in.adr.eq(req.adr),
-            self.req_fifo.we.eq(req.stb),
-            req.req_ack.eq(self.req_fifo.writable),
-
-            self.req_fifo.re.eq(req.dat_w_ack | req.dat_r_ack),
-            req.lock.eq(self.req_fifo.readable)
-        ]
-
         slicer = _AddressSlicer(geom_settings.colbits, address_align)
 
         # Row tracking
         has_openrow = Signal()
         openrow = Signal(geom_settings.rowbits)
-        hit = Signal()
-        self.comb += hit.eq(openrow == slicer.row(reqf.adr))
         track_open = Signal()
         track_close = Signal()
+
+        # Request queue
+        layout = [("we", 1), ("adr", len(req.adr))]
+        if controller_settings.lookahead > 1:
+            layout.append(("tag", len(req.tag)))
+        reqf = Record(layout)
+        if controller_settings.lookahead > 1:
+            # serve row hits first
+            self.submodules.req_queue = _LookaheadQueue(layout,
+                controller_settings.req_queue_size, controller_settings.lookahead,
+                controller_settings.max_age, len(req.tag))
+            self.comb += [
+                self.req_queue.din.we.eq(req.we),
+                self.req_queue.din.adr.eq(req.adr),
+                self.req_queue.din.tag.eq(req.tag),
+                self.req_queue.we.eq(req.stb),
+                req.req_ack.eq(self.req_queue.writable),
+
+                reqf.eq(self.req_queue.dout),
+                self.req_queue.re.eq(req.dat_w_ack | req.dat_r_ack),
+                req.ack_tag.eq(reqf.tag),
+                req.lock.eq(self.req_queue.pending)
+            ]
+            self.comb += [self.req_queue.hit[i].eq(has_openrow &
+                              (openrow == slicer.row(entry.adr)))
+                          for i, entry in enumerate(self.req_queue.window)]
+            req_readable = self.req_queue.readable
+        else:
+            req_in = Record(layout)
+            self.submodules.req_fifo = SyncFIFO(layout_len(layout),
+                                                controller_settings.req_queue_size)
+            self.comb += [
+                self.req_fifo.din.eq(req_in.raw_bits()),
+                reqf.raw_bits().eq(self.req_fifo.dout)
+            ]
+            self.comb += [
+                req_in.we.eq(req.we),
+                req_in.adr.eq(req.adr),
+                self.req_fifo.we.eq(req.stb),
+                req.req_ack.eq(self.req_fifo.writable),
+
+                self.req_fifo.re.eq(req.dat_w_ack | req.dat_r_ack),
+                req.lock.eq(self.req_fifo.readable)
+            ]
+            req_readable = self.req_fifo.readable
+
+        hit = Signal()
+        self.comb += hit.eq(openrow == slicer.row(reqf.adr))
         self.sync += [
             If(track_open,
                 has_openrow.eq(1),
@@ -75,23 +186,31 @@ class BankMachine(Module):
 
         # Address generation
         s_row_adr = Signal()
+        auto_precharge = Signal()
         self.comb += [
             self.cmd.ba.eq(bankn),
             If(s_row_adr,
                 self.cmd.a.eq(slicer.row(reqf.adr))
             ).Else(
-                self.cmd.a.eq(slicer.col(reqf.adr))
+                self.cmd.a.eq(slicer.col(reqf.adr)),
+                If(auto_precharge, self.cmd.a[10].eq(1))
             )
         ]
 
-        # Respect write-to-precharge specification
+        # Respect write-to-precharge and read-to-precharge specifications
         precharge_ok = Signal()
         t_unsafe_precharge = 2 + timing_settings.tWR - 1
-        unsafe_precharge_count = Signal(max=t_unsafe_precharge+1)
+        t_read_precharge = 0
+        if timing_settings.tRTP is not None:
+            t_read_precharge = timing_settings.tRTP - 1
+        unsafe_precharge_count = Signal(max=max(t_unsafe_precharge, t_read_precharge)+1)
         self.comb += precharge_ok.eq(unsafe_precharge_count == 0)
         self.sync += [
             If(self.cmd.stb & self.cmd.ack & self.cmd.is_write,
                 unsafe_precharge_count.eq(t_unsafe_precharge)
+            ).Elif(self.cmd.stb & self.cmd.ack & self.cmd.is_read &
+                   (unsafe_precharge_count < t_read_precharge),
+                unsafe_precharge_count.eq(t_read_precharge)
             ).Elif(~precharge_ok,
                 unsafe_precharge_count.eq(unsafe_precharge_count-1)
             )
@@ -100,10 +219,25 @@ class BankMachine(Module):
         # Control and command generation FSM
         fsm = FSM()
         self.submodules += fsm
+
+        # Page policy
+        page_policy = controller_settings.page_policy
+        if page_policy == "closed":
+            assert geom_settings.addressbits > 10
+            self.comb += auto_precharge.eq(1)
+        close_idle = Signal()
+        if page_policy == "adaptive":
+            idle_timer = WaitTimer(controller_settings.page_timeout)
+            self.submodules += idle_timer
+            self.comb += [
+                idle_timer.wait.eq(fsm.ongoing("REGULAR") & has_openrow & ~req_readable),
+                close_idle.eq(idle_timer.done)
+            ]
+
         fsm.act("REGULAR",
             If(self.refresh_req,
                 NextState("REFRESH")
-            ).Elif(self.req_fifo.readable,
+            ).Elif(req_readable,
                 If(has_openrow,
                     If(hit,
                         # NB: write-to-read specification is enforced by multiplexer
@@ -113,23 +247,50 @@ class BankMachine(Module):
                         self.cmd.is_read.eq(~reqf.we),
                         self.cmd.is_write.eq(reqf.we),
                         self.cmd.cas_n.eq(0),
-                        self.cmd.we_n.eq(~reqf.we)
+                        self.cmd.we_n.eq(~reqf.we),
+                        If(self.cmd.ack & auto_precharge,
+                            track_close.eq(1),
+                            NextState("AUTOPRECHARGE")
+                        )
                     ).Else(
                         NextState("PRECHARGE")
                     )
                 ).Else(
                     NextState("ACTIVATE")
                 )
+            ).Elif(close_idle,
+                NextState("CLOSE")
+            )
+        )
+        fsm.act("AUTOPRECHARGE",
+            # the precharge starts once write recovery is complete
+            If(precharge_ok, NextState("TRP-CLOSE"))
+        )
+        fsm.act("CLOSE",
+            If(self.refresh_req,
+                NextState("REFRESH")
+            ).Elif(req_readable,
+                NextState("REGULAR")
+            ).Elif(precharge_ok,
+                self.cmd.stb.eq(1),
+                If(self.cmd.ack,
+                    track_close.eq(1),
+                    NextState("TRP-CLOSE")
+                ),
+                self.cmd.ras_n.eq(0),
+                self.cmd.we_n.eq(0),
+                self.cmd.is_cmd.eq(1)
             )
         )
         fsm.act("PRECHARGE",
-            # Notes:
-            # 1. we are presenting the column address, A10 is always low
-            # 2. since we always go to the ACTIVATE state, we do not need
-            # to assert track_close.
+            # Note: we are presenting the column address, A10 is always low
             If(precharge_ok,
                 self.cmd.stb.eq(1),
-                If(self.cmd.ack, NextState("TRP")),
+                If(self.cmd.ack,
+                    # so that the request queue presents the head again
+                    track_close.eq(1),
+                    NextState("TRP")
+                ),
                 self.cmd.ras_n.eq(0),
                 self.cmd.we_n.eq(0),
                 self.cmd.is_cmd.eq(1)
@@ -150,4 +311,5 @@ class BankMachine(Module):
             If(~self.refresh_req, NextState("REGULAR"))
         )
         fsm.delayed_enter("TRP", "ACTIVATE", timing_settings.tRP-1)
+        fsm.delayed_enter("TRP-CLOSE", "REGULAR", timing_settings.tRP-1)
         fsm.delayed_enter("TRCD", "REGULAR", timing_settings.tRCD-1)
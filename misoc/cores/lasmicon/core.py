@@ -1,18 +1,15 @@
+from functools import reduce
+from operator import or_
+
 from migen import *
 
 from misoc.interconnect import dfi, lasmi_bus
+from misoc.cores.sdram_settings import ControllerSettings
 from misoc.cores.lasmicon.refresher import *
 from misoc.cores.lasmicon.bankmachine import *
 from misoc.cores.lasmicon.multiplexer import *
 
 
-class ControllerSettings:
-    def __init__(self, req_queue_size=8, read_time=32, write_time=16):
-        self.req_queue_size = req_queue_size
-        self.read_time = read_time
-        self.write_time = write_time
-
-
 class LASMIcon(Module):
     def __init__(self, phy_settings, geom_settings, timing_settings,
                  controller_settings=None):
@@ -23,6 +20,10 @@ class LASMIcon(Module):
         elif phy_settings.memtype in ["DDR", "LPDDR", "DDR2", "DDR3"]:
             burst_length = phy_settings.nphases*2  # command multiplication*DDR
         address_align = log2_int(burst_length)
+        if controller_settings.lookahead > 1:
+            tagbits = max(log2_int(controller_settings.max_masters, False), 1)
+        else:
+            tagbits = 0
 
         self.dfi = dfi.Interface(geom_settings.addressbits,
             geom_settings.bankbits,
@@ -34,13 +35,19 @@ class LASMIcon(Module):
             nbanks=2**geom_settings.bankbits,
             req_queue_size=controller_settings.req_queue_size,
             read_latency=phy_settings.read_latency+1,
-            write_latency=phy_settings.write_latency+1)
+            write_latency=phy_settings.write_latency+1,
+            tagbits=tagbits,
+            address_mapping=controller_settings.address_mapping)
         self.nrowbits = geom_settings.colbits - address_align
 
         ###
 
         self.submodules.refresher = Refresher(geom_settings.addressbits, geom_settings.bankbits,
-            timing_settings.tRP, timing_settings.tREFI, timing_settings.tRFC)
+            timing_settings.tRP, timing_settings.tREFI, timing_settings.tRFC,
+            controller_settings.refresh_postpone)
+        banks = [getattr(self.lasmic, "bank"+str(i)) for i in range(2**geom_settings.bankbits)]
+        self.comb += self.refresher.idle.eq(~reduce(or_,
+            [bank.stb | (bank.lock != 0) for bank in banks]))
         self.submodules.bank_machines = [BankMachine(geom_settings, timing_settings, controller_settings, address_align, i,
                 getattr(self.lasmic, "bank"+str(i)))
             for i in range(2**geom_settings.bankbits)]
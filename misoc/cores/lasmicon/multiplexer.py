@@ -1,5 +1,6 @@
 from functools import reduce
-from operator import or_, and_
+from operator import or_, and_, add
+from math import ceil
 
 from migen import *
 from migen.genlib.roundrobin import *
@@ -27,11 +28,18 @@ class CommandRequestRW(CommandRequest):
         self.is_write = Signal()
 
 
+def _is_activate(req):
+    return req.is_cmd & ~req.ras_n & req.cas_n & req.we_n
+
+
 class _CommandChooser(Module):
     def __init__(self, requests):
         self.want_reads = Signal()
         self.want_writes = Signal()
         self.want_cmds = Signal()
+        # cleared when timings across banks forbid activates/reads/writes
+        self.want_activates = Signal(reset=1)
+        self.want_cas = Signal(reset=1)
         # NB: cas_n/ras_n/we_n are 1 when stb is inactive
         self.cmd = CommandRequestRW(len(requests[0].a), len(requests[0].ba))
 
@@ -40,11 +48,14 @@ class _CommandChooser(Module):
         rr = RoundRobin(len(requests), SP_CE)
         self.submodules += rr
 
-        self.comb += [rr.request[i].eq(req.stb & ((req.is_cmd & self.want_cmds) | ((req.is_read == self.want_reads) | (req.is_write == self.want_writes))))
+        allowed = [(self.want_activates | ~_is_activate(req)) &
+                   (self.want_cas | ~(req.is_read | req.is_write))
+                   for req in requests]
+        self.comb += [rr.request[i].eq(req.stb & allowed[i] & ((req.is_cmd & self.want_cmds) | ((req.is_read == self.want_reads) | (req.is_write == self.want_writes))))
             for i, req in enumerate(requests)]
 
         stb = Signal()
-        self.comb += stb.eq(Array(req.stb for req in requests)[rr.grant])
+        self.comb += stb.eq(Array(req.stb & a for req, a in zip(requests, allowed))[rr.grant])
         for name in ["a", "ba", "is_read", "is_write", "is_cmd"]:
             choices = Array(getattr(req, name) for req in requests)
             self.comb += getattr(self.cmd, name).eq(choices[rr.grant])
@@ -94,6 +105,68 @@ class _Steerer(Module):
             ]
 
 
+class _tXXDController(Module):
+    # ready is deasserted during the t-1 cycles following valid, so that
+    # commands are at least t cycles apart
+    def __init__(self, t):
+        self.valid = Signal()
+        self.ready = Signal(reset=1)
+
+        ###
+
+        if t is not None and t > 1:
+            count = Signal(max=t)
+            self.sync += \
+                If(self.valid,
+                    count.eq(t - 1),
+                    self.ready.eq(0)
+                ).Elif(~self.ready,
+                    count.eq(count - 1),
+                    If(count == 1, self.ready.eq(1))
+                )
+
+
+class _tFAWController(Module):
+    # at most 4 commands in any window of t cycles
+    def __init__(self, t):
+        self.valid = Signal()
+        self.ready = Signal(reset=1)
+
+        ###
+
+        if t is not None and t > 4:
+            window = Signal(t - 1)
+            self.sync += window.eq(Cat(self.valid, window))
+            count = Signal(max=t)
+            self.comb += [
+                count.eq(reduce(add, [window[i] for i in range(t - 1)])),
+                self.ready.eq(count < 4)
+            ]
+
+
+def _read_to_write(phy_settings, tCCD):
+    # Minimum number of cycles between a read and a write command, so that
+    # write data is driven two memory clocks after the end of read data
+    # (tRTW = RL + tCCD + 2 - WL).
+    # Never longer than the PHY read latency, the previous limit.
+    nphases = phy_settings.nphases
+    if phy_settings.memtype == "SDR":
+        data_clocks, cwl = 1, 0
+    else:
+        data_clocks = nphases
+        cwl = {
+            "DDR":   1,
+            "LPDDR": 1,
+            "DDR2":  phy_settings.cl - 1,
+            "DDR3":  phy_settings.cwl
+        }[phy_settings.memtype]
+    if tCCD is not None:
+        data_clocks = max(data_clocks, tCCD*nphases)
+    t = phy_settings.cl + data_clocks + 2 - cwl
+    t += max(phy_settings.rdphase - phy_settings.wrphase, 0)
+    return max(min(ceil(t/nphases), phy_settings.read_latency), 1)
+
+
 class Multiplexer(Module, AutoCSR):
     def __init__(self, phy_settings, geom_settings, timing_settings, controller_settings, bank_machines, refresher, dfi, lasmic):
         assert(phy_settings.nphases == len(dfi.phases))
@@ -113,6 +186,28 @@ class Multiplexer(Module, AutoCSR):
                 choose_req.want_cmds.eq(1)
             ]
 
+        # Timings across banks
+        trrdcon = _tXXDController(timing_settings.tRRD)
+        tfawcon = _tFAWController(timing_settings.tFAW)
+        tccdcon = _tXXDController(timing_settings.tCCD)
+        self.submodules += trrdcon, tfawcon, tccdcon
+        activates = [c.cmd.stb & c.cmd.ack & _is_activate(c.cmd)
+                     for c in (choose_cmd, choose_req)]
+        cas = [c.cmd.stb & c.cmd.ack & (c.cmd.is_read | c.cmd.is_write)
+               for c in (choose_cmd, choose_req)]
+        self.comb += [
+            trrdcon.valid.eq(reduce(or_, activates)),
+            tfawcon.valid.eq(reduce(or_, activates)),
+            tccdcon.valid.eq(reduce(or_, cas)),
+            choose_req.want_activates.eq(trrdcon.ready & tfawcon.ready),
+            choose_req.want_cas.eq(tccdcon.ready)
+        ]
+        # at most one activate/CAS per cycle, choose_req has priority
+        if timing_settings.tRRD is not None or timing_settings.tFAW is not None:
+            self.comb += choose_cmd.want_activates.eq(trrdcon.ready & tfawcon.ready & ~activates[1])
+        if timing_settings.tCCD is not None:
+            self.comb += choose_cmd.want_cas.eq(tccdcon.ready & ~cas[1])
+
         # Command steering
         nop = CommandRequest(geom_settings.addressbits, geom_settings.bankbits)
         commands = [nop, choose_cmd.cmd, choose_req.cmd, refresher.cmd]  # nop must be 1st
@@ -184,10 +279,16 @@ class Multiplexer(Module, AutoCSR):
                 r.append(s)
             return r
 
+        # with a single phase, commands are only issued through choose_req
+        if phy_settings.nphases > 1:
+            cmd_ack = choose_cmd.cmd.ack.eq(1)
+        else:
+            cmd_ack = []
+
         fsm.act("READ",
             read_time_en.eq(1),
             choose_req.want_reads.eq(1),
-            choose_cmd.cmd.ack.eq(1),
+            cmd_ack,
             choose_req.cmd.ack.eq(1),
             steerer_sel(steerer, phy_settings, "read"),
             If(write_available,
@@ -199,7 +300,7 @@ class Multiplexer(Module, AutoCSR):
         fsm.act("WRITE",
             write_time_en.eq(1),
             choose_req.want_writes.eq(1),
-            choose_cmd.cmd.ack.eq(1),
+            cmd_ack,
             choose_req.cmd.ack.eq(1),
             steerer_sel(steerer, phy_settings, "write"),
             If(read_available,
@@ -212,5 +313,5 @@ class Multiplexer(Module, AutoCSR):
             refresher.ack.eq(1),
             If(~refresher.req, NextState("READ"))
         )
-        fsm.delayed_enter("RTW", "WRITE", phy_settings.read_latency-1)  # FIXME: reduce this, actual limit is around (cl+1)/nphases
+        fsm.delayed_enter("RTW", "WRITE", _read_to_write(phy_settings, timing_settings.tCCD)-1)
         fsm.delayed_enter("WTR", "READ", timing_settings.tWTR-1)
@@ -6,16 +6,24 @@ from misoc.cores.lasmicon.multiplexer import *
 
 
 class Refresher(Module):
-    def __init__(self, a, ba, tRP, tREFI, tRFC):
+    # postpone: number of refreshes that can be postponed while the
+    # controller is busy (JEDEC allows up to 8). Postponed refreshes are
+    # issued in a batch once the controller is idle, or when the limit is
+    # reached.
+    def __init__(self, a, ba, tRP, tREFI, tRFC, postpone=0):
         self.req = Signal()
         self.ack = Signal()  # 1st command 1 cycle after assertion of ack
+        self.idle = Signal()  # no pending requests in the controller
         self.cmd = CommandRequest(a, ba)
 
         ###
 
         # Refresh sequence generator:
         # PRECHARGE ALL --(tRP)--> AUTO REFRESH --(tRFC)--> done
+        # Batched refreshes:
+        # AUTO REFRESH --(tRFC)--> done
         seq_start = Signal()
+        ref_start = Signal()
         seq_done = Signal()
         self.sync += [
             self.cmd.a.eq(2**10),
@@ -38,6 +46,16 @@ class Refresher(Module):
                 seq_done.eq(1)
             ])
         ])
+        if postpone:
+            self.sync += timeline(ref_start, [
+                (1, [
+                    self.cmd.cas_n.eq(0),
+                    self.cmd.ras_n.eq(0)
+                ]),
+                (1+tRFC, [
+                    seq_done.eq(1)
+                ])
+            ])
 
         # Periodic refresh counter
         counter = Signal(max=tREFI)
@@ -52,10 +70,30 @@ class Refresher(Module):
             )
         ]
 
+        # Refreshes due. A refresh is urgent above postpone, the counter
+        # holds one more tREFI period of grant delay and saturates beyond,
+        # rather than wrapping and forgetting the refreshes due.
+        debt_max = postpone + 2
+        debt = Signal(max=debt_max+1)
+        self.sync += \
+            If(start & ~seq_done,
+                If(debt != debt_max, debt.eq(debt + 1))
+            ).Elif(~start & seq_done,
+                debt.eq(debt - 1)
+            )
+        # a refresh is needed/possible once the current one is done
+        debt_next = Signal(max=debt_max+2)
+        self.comb += debt_next.eq(debt + start - seq_done)
+        urgent = Signal()
+        batch = Signal()
+        self.comb += urgent.eq(debt_next > postpone)
+        if postpone:
+            self.comb += batch.eq(urgent | ((debt_next != 0) & self.idle))
+
         # Control FSM
         fsm = FSM()
         self.submodules += fsm
-        fsm.act("IDLE", If(start, NextState("WAIT_GRANT")))
+        fsm.act("IDLE", If(urgent | ((debt_next != 0) & self.idle), NextState("WAIT_GRANT")))
         fsm.act("WAIT_GRANT",
             self.req.eq(1),
             If(self.ack,
@@ -65,5 +103,11 @@ class Refresher(Module):
         )
         fsm.act("WAIT_SEQ",
             self.req.eq(1),
-            If(seq_done, NextState("IDLE"))
+            If(seq_done,
+                If(batch,
+                    ref_start.eq(1)
+                ).Else(
+                    NextState("IDLE")
+                )
+            )
         )
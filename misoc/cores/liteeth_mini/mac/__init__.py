@@ -12,8 +12,10 @@ class LiteEthMAC(Module, AutoCSR):
                  endianness="big",
                  with_preamble_crc=True,
                  nrxslots=2,
-                 ntxslots=2):
-        self.submodules.core = LiteEthMACCore(phy, dw, endianness, with_preamble_crc)
+                 ntxslots=2,
+                 cdc_buffered=False):
+        self.submodules.core = LiteEthMACCore(phy, dw, endianness, with_preamble_crc,
+                                              cdc_buffered=cdc_buffered)
         self.csrs = []
         if interface == "wishbone":
             self.submodules.interface = LiteEthMACWishboneInterface(dw, nrxslots, ntxslots)
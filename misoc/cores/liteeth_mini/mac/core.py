@@ -9,12 +9,13 @@ from misoc.cores.liteeth_mini.mac import gap, preamble, crc, padding, last_be
 class LiteEthMACCore(Module, AutoCSR):
     def __init__(self, phy, dw, endianness="big",
             with_preamble_crc=True,
-            with_padding=True):
+            with_padding=True,
+            cdc_buffered=False):
         if dw < phy.dw:
             raise ValueError("Core data width({}) must be larger than PHY data width({})".format(dw, phy.dw))
 
-        rx_pipeline = [phy]
-        tx_pipeline = [phy]
+        rx_pipeline = [("phy", phy)]
+        tx_pipeline = [("phy", phy)]
 
         # Interpacket gap
         tx_gap_inserter = gap.LiteEthMACGap(phy.dw)
@@ -22,8 +23,8 @@ class LiteEthMACCore(Module, AutoCSR):
         self.submodules += ClockDomainsRenamer("eth_tx")(tx_gap_inserter)
         self.submodules += ClockDomainsRenamer("eth_rx")(rx_gap_checker)
 
-        tx_pipeline += [tx_gap_inserter]
-        rx_pipeline += [rx_gap_checker]
+        tx_pipeline += [("gap", tx_gap_inserter)]
+        rx_pipeline += [("gap", rx_gap_checker)]
 
         # Preamble / CRC
         if with_preamble_crc:
@@ -40,8 +41,8 @@ class LiteEthMACCore(Module, AutoCSR):
             self.submodules += ClockDomainsRenamer("eth_tx")(crc32_inserter)
             self.submodules += ClockDomainsRenamer("eth_rx")(crc32_checker)
 
-            tx_pipeline += [preamble_inserter, crc32_inserter]
-            rx_pipeline += [preamble_checker, crc32_checker]
+            tx_pipeline += [("preamble", preamble_inserter), ("crc", crc32_inserter)]
+            rx_pipeline += [("preamble", preamble_checker), ("crc", crc32_checker)]
 
         # Padding
         if with_padding:
@@ -50,8 +51,8 @@ class LiteEthMACCore(Module, AutoCSR):
             self.submodules += ClockDomainsRenamer("eth_tx")(padding_inserter)
             self.submodules += ClockDomainsRenamer("eth_rx")(padding_checker)
 
-            tx_pipeline += [padding_inserter]
-            rx_pipeline += [padding_checker]
+            tx_pipeline += [("padding", padding_inserter)]
+            rx_pipeline += [("padding", padding_checker)]
 
         # Delimiters
         if dw != 8:
@@ -60,8 +61,8 @@ class LiteEthMACCore(Module, AutoCSR):
             self.submodules += ClockDomainsRenamer("eth_tx")(tx_last_be)
             self.submodules += ClockDomainsRenamer("eth_rx")(rx_last_be)
 
-            tx_pipeline += [tx_last_be]
-            rx_pipeline += [rx_last_be]
+            tx_pipeline += [("last_be", tx_last_be)]
+            rx_pipeline += [("last_be", rx_last_be)]
 
         # Converters
         if dw != phy.dw:
@@ -75,22 +76,19 @@ class LiteEthMACCore(Module, AutoCSR):
             self.submodules += ClockDomainsRenamer("eth_tx")(tx_converter)
             self.submodules += ClockDomainsRenamer("eth_rx")(rx_converter)
 
-            tx_pipeline += [tx_converter]
-            rx_pipeline += [rx_converter]
+            tx_pipeline += [("converter", tx_converter)]
+            rx_pipeline += [("converter", rx_converter)]
 
         # Cross Domain Crossing
-        tx_cdc = stream.AsyncFIFO(eth_phy_layout(dw), 64)
-        rx_cdc = stream.AsyncFIFO(eth_phy_layout(dw), 64)
+        tx_cdc = stream.AsyncFIFO(eth_phy_layout(dw), 64, buffered=cdc_buffered)
+        rx_cdc = stream.AsyncFIFO(eth_phy_layout(dw), 64, buffered=cdc_buffered)
         self.submodules += ClockDomainsRenamer({"write": "sys", "read": "eth_tx"})(tx_cdc)
         self.submodules += ClockDomainsRenamer({"write": "eth_rx", "read": "sys"})(rx_cdc)
 
-        tx_pipeline += [tx_cdc]
-        rx_pipeline += [rx_cdc]
+        tx_pipeline += [("cdc", tx_cdc)]
+        rx_pipeline += [("cdc", rx_cdc)]
 
-        tx_pipeline_r = list(reversed(tx_pipeline))
-        for s, d in zip(tx_pipeline_r, tx_pipeline_r[1:]):
-            self.comb += s.source.connect(d.sink)
-        for s, d in zip(rx_pipeline, rx_pipeline[1:]):
-            self.comb += s.source.connect(d.sink)
-        self.sink = tx_pipeline[-1].sink
-        self.source = rx_pipeline[-1].source
+        self.submodules.tx_pipeline = stream.Pipeline(*reversed(tx_pipeline), source=False)
+        self.submodules.rx_pipeline = stream.Pipeline(*rx_pipeline, sink=False)
+        self.sink = self.tx_pipeline.sink
+        self.source = self.rx_pipeline.source
@@ -0,0 +1,214 @@
+"""
+Memory-to-memory copy and fill engine.
+
+The engine is a Wishbone bus master that moves data between two memory
+regions, or fills a region with a 32-bit pattern, without involving the CPU.
+Reads are grouped into bursts of up to ``fifo_depth`` words that are buffered
+before being written back, which reduces bus turnarounds compared with a
+word-by-word copy.
+
+A transfer is programmed either directly through the ``source``,
+``destination``, ``length``, ``pattern`` and ``fill`` CSRs, or through a
+chain of descriptors in memory when ``chain`` is set. In the latter case,
+``descriptor`` holds the address of the first descriptor, made of four
+words:
+  * address of the next descriptor, or 0 to end the chain
+  * source address (pattern in fill mode)
+  * destination address
+  * length, with bit 31 selecting fill mode
+
+Writing to ``start`` launches the transfer. The ``done`` event is triggered
+when the transfer (or the whole chain) has completed.
+
+All sizes/addresses in bytes, and must be multiples of 4.
+"""
+
+from migen import *
+from migen.genlib.fsm import FSM, NextState
+from migen.genlib.fifo import SyncFIFO
+
+from misoc.interconnect import wishbone
+from misoc.interconnect.csr import *
+from misoc.interconnect.csr_eventmanager import *
+
+
+class MemCopy(Module, AutoCSR):
+    def __init__(self, fifo_depth=16):
+        self.bus = bus = wishbone.Interface()
+
+        self.source = CSRStorage(32, alignment_bits=2)
+        self.destination = CSRStorage(32, alignment_bits=2)
+        self.length = CSRStorage(32, alignment_bits=2)
+        self.pattern = CSRStorage(32)
+        self.fill = CSRStorage()
+        self.chain = CSRStorage()
+        self.descriptor = CSRStorage(32, alignment_bits=2)
+        self.start = CSR()
+        self.busy = CSRStatus()
+
+        self.submodules.ev = EventManager()
+        self.ev.done = EventSourcePulse()
+        self.ev.finalize()
+
+        # # #
+
+        fifo = SyncFIFO(32, fifo_depth)
+        self.submodules += fifo
+
+        fill = Signal()
+        pattern = Signal(32)
+        rd_adr = Signal(30)
+        wr_adr = Signal(30)
+        rd_remaining = Signal(30)
+        wr_remaining = Signal(30)
+        load_csrs = Signal()
+        rd_done = Signal()
+        wr_done = Signal()
+        self.comb += [
+            rd_done.eq(rd_remaining == 0),
+            wr_done.eq(wr_remaining == 0)
+        ]
+
+        # descriptor fetch
+        desc_adr = Signal(30)
+        desc_next = Signal(30)
+        desc_words = [Signal(32) for i in range(3)]
+        desc_count = Signal(2)
+        desc_reset = Signal()
+        desc_load = Signal()
+        desc_ack = Signal()
+        self.sync += [
+            If(desc_reset,
+                desc_count.eq(0)
+            ).Elif(desc_ack,
+                desc_count.eq(desc_count + 1),
+                Case(desc_count, {
+                    0: desc_next.eq(bus.dat_r[2:]),
+                    1: desc_words[0].eq(bus.dat_r),
+                    2: desc_words[1].eq(bus.dat_r),
+                    3: desc_words[2].eq(bus.dat_r)
+                })
+            )
+        ]
+
+        # address generation
+        rd_ack = Signal()
+        wr_ack = Signal()
+        self.sync += [
+            If(load_csrs,
+                fill.eq(self.fill.storage),
+                pattern.eq(self.pattern.storage),
+                rd_adr.eq(self.source.storage),
+                wr_adr.eq(self.destination.storage),
+                rd_remaining.eq(self.length.storage),
+                wr_remaining.eq(self.length.storage),
+                desc_adr.eq(0)
+            ).Elif(desc_load,
+                fill.eq(desc_words[2][31]),
+                pattern.eq(desc_words[0]),
+                rd_adr.eq(desc_words[0][2:]),
+                wr_adr.eq(desc_words[1][2:]),
+                rd_remaining.eq(desc_words[2][2:31]),
+                wr_remaining.eq(desc_words[2][2:31]),
+                desc_adr.eq(desc_next)
+            ).Else(
+                If(rd_ack,
+                    rd_adr.eq(rd_adr + 1),
+                    rd_remaining.eq(rd_remaining - 1)
+                ),
+                If(wr_ack,
+                    wr_adr.eq(wr_adr + 1),
+                    wr_remaining.eq(wr_remaining - 1)
+                )
+            ),
+            If(self.start.re & self.chain.storage,
+                desc_adr.eq(self.descriptor.storage)
+            )
+        ]
+
+        self.comb += [
+            bus.sel.eq(0xf),
+            fifo.din.eq(bus.dat_r),
+            If(fill,
+                bus.dat_w.eq(pattern)
+            ).Else(
+                bus.dat_w.eq(fifo.dout)
+            )
+        ]
+
+        # control FSM
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            desc_reset.eq(1),
+            If(self.start.re,
+                If(self.chain.storage,
+                    NextState("FETCH_DESCRIPTOR")
+                ).Else(
+                    load_csrs.eq(1),
+                    NextState("START")
+                )
+            )
+        )
+        fsm.act("FETCH_DESCRIPTOR",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.adr.eq(desc_adr + desc_count),
+            If(bus.ack,
+                desc_ack.eq(1),
+                If(desc_count == 3,
+                    NextState("LOAD_DESCRIPTOR")
+                )
+            )
+        )
+        fsm.act("LOAD_DESCRIPTOR",
+            desc_load.eq(1),
+            NextState("START")
+        )
+        fsm.act("START",
+            If(fill,
+                NextState("WRITE")
+            ).Else(
+                NextState("READ")
+            )
+        )
+        fsm.act("READ",
+            If(rd_done | ~fifo.writable,
+                NextState("WRITE")
+            ).Else(
+                bus.cyc.eq(1),
+                bus.stb.eq(1),
+                bus.adr.eq(rd_adr),
+                If(bus.ack,
+                    fifo.we.eq(1),
+                    rd_ack.eq(1)
+                )
+            )
+        )
+        fsm.act("WRITE",
+            If(wr_done | (~fill & ~fifo.readable),
+                If(wr_done,
+                    NextState("NEXT")
+                ).Else(
+                    NextState("READ")
+                )
+            ).Else(
+                bus.cyc.eq(1),
+                bus.stb.eq(1),
+                bus.we.eq(1),
+                bus.adr.eq(wr_adr),
+                If(bus.ack,
+                    fifo.re.eq(~fill),
+                    wr_ack.eq(1)
+                )
+            )
+        )
+        fsm.act("NEXT",
+            desc_reset.eq(1),
+            If(desc_adr != 0,
+                NextState("FETCH_DESCRIPTOR")
+            ).Else(
+                self.ev.done.trigger.eq(1),
+                NextState("IDLE")
+            )
+        )
+        self.comb += self.busy.status.eq(~fsm.ongoing("IDLE"))
@@ -1,35 +1,50 @@
 from functools import reduce
-from operator import or_
+from operator import or_, and_
 
 from migen import *
 from migen.genlib.fsm import FSM, NextState
 from migen.genlib.misc import WaitTimer
+from migen.genlib.fifo import SyncFIFO
 
 from misoc.interconnect import dfi as dfibus
 from misoc.interconnect import wishbone
+from misoc.cores.sdram_settings import ControllerSettings
 
 
 class _AddressSlicer:
-    def __init__(self, colbits, bankbits, rowbits, address_align):
+    # address_mapping: "rbc" (row, bank, column from MSB to LSB), "brc"
+    # (bank, row, column) or "bank_xor" (as rbc, with the bank XORed with
+    # the low bits of the row, so that power-of-two strides spread over the
+    # banks)
+    def __init__(self, colbits, bankbits, rowbits, address_align, address_mapping="rbc"):
         self.colbits = colbits
         self.bankbits = bankbits
         self.rowbits = rowbits
         self.address_align = address_align
+        self.address_mapping = address_mapping
         self.addressbits = colbits - address_align + bankbits + rowbits
 
-    def row(self, address):
-        split = self.bankbits + self.colbits - self.address_align
+    def _field(self, address, split, n):
         if isinstance(address, int):
-            return address >> split
+            return (address >> split) & (2**n - 1)
         else:
-            return address[split:self.addressbits]
+            return address[split:split+n]
+
+    def row(self, address):
+        split = self.colbits - self.address_align
+        if self.address_mapping != "brc":
+            split += self.bankbits
+        return self._field(address, split, self.rowbits)
 
     def bank(self, address):
         split = self.colbits - self.address_align
-        if isinstance(address, int):
-            return (address & (2**(split + self.bankbits) - 1)) >> split
-        else:
-            return address[split:split+self.bankbits]
+        if self.address_mapping == "brc":
+            split += self.rowbits
+        bank = self._field(address, split, self.bankbits)
+        if self.address_mapping == "bank_xor":
+            n = min(self.bankbits, self.rowbits)
+            bank = bank ^ self._field(self.row(address), 0, n)
+        return bank
 
     def col(self, address):
         split = self.colbits - self.address_align
@@ -47,21 +62,30 @@ class _Bank(Module):
         self.row = Signal(geom_settings.rowbits)
 
         self.idle = Signal(reset=1)
-        self.hit = Signal()
+        self.open_row = Signal(geom_settings.rowbits)
 
         # # #
 
-        row = Signal(geom_settings.rowbits)
         self.sync += \
             If(self.open,
                 self.idle.eq(0),
-                row.eq(self.row)
+                self.open_row.eq(self.row)
             )
-        self.comb += self.hit.eq(~self.idle & (self.row == row))
 
 
 class Minicon(Module):
-    def __init__(self, phy_settings, geom_settings, timing_settings):
+    # Only the page policy, address mapping and pipelined mode of
+    # controller_settings are used.
+    #
+    # In pipelined mode, row hits are issued directly from the IDLE state and
+    # reads start a read-ahead stream: the following addresses are read
+    # while the current one is in flight, activating the next bank when the
+    # stream crosses a row boundary. Any other access flushes the stream.
+    def __init__(self, phy_settings, geom_settings, timing_settings,
+                 controller_settings=None):
+        if controller_settings is None:
+            controller_settings = ControllerSettings()
+        page_policy = controller_settings.page_policy
         if phy_settings.memtype in ["SDR"]:
             burst_length = phy_settings.nphases*1  # command multiplication*SDR
         elif phy_settings.memtype in ["DDR", "LPDDR", "DDR2", "DDR3"]:
@@ -82,6 +106,7 @@ class Minicon(Module):
         wrphase = phy_settings.wrphase
 
         precharge_all = Signal()
+        auto_precharge = Signal()
         activate = Signal()
         refresh = Signal()
         write = Signal()
@@ -91,19 +116,24 @@ class Minicon(Module):
         slicer = _AddressSlicer(geom_settings.colbits,
                                 geom_settings.bankbits,
                                 geom_settings.rowbits,
-                                address_align)
+                                address_align,
+                                controller_settings.address_mapping)
 
-        # Manage banks
-        bank_idle = Signal()
-        bank_hit = Signal()
+        # Address of the current command: the bus address, or the read-ahead
+        # address in pipelined mode
+        ahead = Signal(len(bus.adr))
+        ahead_cmd = Signal()
+        adr = Signal(len(bus.adr))
+        self.comb += adr.eq(Mux(ahead_cmd, ahead, bus.adr))
 
+        # Manage banks
         banks = []
         for i in range(2**geom_settings.bankbits):
             bank = _Bank(geom_settings)
             self.comb += [
                 bank.open.eq(activate),
-                bank.reset.eq(precharge_all),
-                bank.row.eq(slicer.row(bus.adr))
+                bank.reset.eq(precharge_all | (auto_precharge & bank.ce)),
+                bank.row.eq(slicer.row(adr))
             ]
             banks.append(bank)
         self.submodules += banks
@@ -111,12 +141,20 @@ class Minicon(Module):
         cases = {}
         for i, bank in enumerate(banks):
             cases[i] = [bank.ce.eq(1)]
-        self.comb += Case(slicer.bank(bus.adr), cases)
+        self.comb += Case(slicer.bank(adr), cases)
 
-        self.comb += [
-            bank_hit.eq(reduce(or_, [bank.hit & bank.ce for bank in banks])),
-            bank_idle.eq(reduce(or_, [bank.idle & bank.ce for bank in banks])),
-        ]
+        def bank_status(address):
+            hit = Signal()
+            idle = Signal()
+            bank_idles = Array(bank.idle for bank in banks)
+            bank_rows = Array(bank.open_row for bank in banks)
+            self.comb += [
+                idle.eq(bank_idles[slicer.bank(address)]),
+                hit.eq(~idle & (bank_rows[slicer.bank(address)] == slicer.row(address)))
+            ]
+            return hit, idle
+
+        bank_hit, bank_idle = bank_status(bus.adr)
 
         # Timings
         write2precharge_timer = WaitTimer(2 + timing_settings.tWR - 1)
@@ -129,25 +167,164 @@ class Minicon(Module):
 
         # Main FSM
         self.submodules.fsm = fsm = FSM()
-        fsm.act("IDLE",
-            If(refresh_timer.done,
-                NextState("PRECHARGE-ALL")
-            ).Elif(bus.stb & bus.cyc,
-                If(bank_hit,
-                    If(bus.we,
-                        NextState("WRITE")
-                    ).Else(
-                        NextState("READ")
+
+        # Page policy
+        activate_ok = Signal(reset=1)
+        close_idle = Signal()
+        if page_policy == "closed":
+            assert geom_settings.addressbits > 10
+            self.comb += auto_precharge.eq(read | write)
+            # rows are closed tWR after writes, and a precharge takes tRP
+            precharge_timer = WaitTimer(timing_settings.tRP)
+            self.submodules += precharge_timer
+            self.comb += [
+                precharge_timer.wait.eq(write2precharge_timer.done & ~auto_precharge),
+                activate_ok.eq(precharge_timer.done)
+            ]
+        elif page_policy == "adaptive":
+            idle_timer = WaitTimer(controller_settings.page_timeout)
+            self.submodules += idle_timer
+            self.comb += [
+                idle_timer.wait.eq(fsm.ongoing("IDLE") & ~(bus.stb & bus.cyc)),
+                close_idle.eq(idle_timer.done & ~reduce(and_, [bank.idle for bank in banks]))
+            ]
+
+        if controller_settings.pipelined:
+            # Read-ahead stream
+            depth = phy_settings.read_latency + 2
+            fifo = ResetInserter()(SyncFIFO(burst_width, depth))
+            self.submodules += fifo
+
+            stream = Signal()
+            stream_start = Signal()
+            flush = Signal()
+            head = Signal(len(bus.adr))
+            pending = Signal(max=depth+1)  # reads issued, data not received
+            count = Signal(max=depth+1)    # reads issued, data not consumed
+            ahead_read = Signal()
+            ahead_hit, ahead_idle = bank_status(ahead)
+
+            rddata_valid = dfi.phases[rdphase].rddata_valid
+            self.comb += [
+                fifo.din.eq(Cat(phase.rddata for phase in dfi.phases)),
+                fifo.we.eq(rddata_valid),
+                fifo.reset.eq(flush)
+            ]
+            self.sync += [
+                If(stream_start,
+                    stream.eq(1),
+                    head.eq(bus.adr),
+                    ahead.eq(bus.adr)
+                ).Elif(flush,
+                    stream.eq(0)
+                ).Else(
+                    If(ahead_read, ahead.eq(ahead + 1)),
+                    If(fifo.re, head.eq(head + 1))
+                ),
+                pending.eq(pending + ahead_read - rddata_valid),
+                If(flush,
+                    count.eq(0)
+                ).Else(
+                    count.eq(count + ahead_read - fifo.re)
+                )
+            ]
+
+            # Writes are acked with the command when data goes with it
+            if phy_settings.write_latency == 0:
+                write_ack = bus.ack.eq(1)
+            else:
+                write_ack = NextState("WRITE-LATENCY")
+
+            # Rows opened by the stream are not followed by the TRCD state
+            trcd_timer = WaitTimer(timing_settings.tRCD-1)
+            self.submodules += trcd_timer
+            self.comb += trcd_timer.wait.eq(~activate)
+
+            # Flush the stream on refresh, page close, writes, reads elsewhere,
+            # and when its next row is not open
+            leave = Signal()
+            self.comb += leave.eq(stream & (refresh_timer.done | close_idle |
+                (bus.stb & bus.cyc & (bus.we | (bus.adr != head) |
+                                      ((count == 0) & ~ahead_hit & ~ahead_idle)))))
+
+            fsm.act("IDLE",
+                If(leave,
+                    NextState("FLUSH")
+                ).Elif(stream,
+                    If(bus.stb & bus.cyc & fifo.readable,
+                        bus.ack.eq(1),
+                        fifo.re.eq(1)
+                    ),
+                    If(ahead_hit & (count < depth) & trcd_timer.done,
+                        ahead_cmd.eq(1),
+                        ahead_read.eq(1),
+                        read.eq(1),
+                        dfi.phases[rdphase].ras_n.eq(1),
+                        dfi.phases[rdphase].cas_n.eq(0),
+                        dfi.phases[rdphase].we_n.eq(1),
+                        dfi.phases[rdphase].rddata_en.eq(1)
+                    ).Elif(ahead_idle & activate_ok,
+                        ahead_cmd.eq(1),
+                        activate.eq(1),
+                        dfi.phases[0].ras_n.eq(0),
+                        dfi.phases[0].cas_n.eq(1),
+                        dfi.phases[0].we_n.eq(1)
                     )
-                ).Elif(~bank_idle,
-                    If(write2precharge_timer.done,
-                        NextState("PRECHARGE")
+                ).Elif(refresh_timer.done,
+                    NextState("PRECHARGE-ALL")
+                ).Elif(bus.stb & bus.cyc,
+                    If(bank_hit,
+                        If(bus.we,
+                            If(trcd_timer.done,
+                                write.eq(1),
+                                dfi.phases[wrphase].ras_n.eq(1),
+                                dfi.phases[wrphase].cas_n.eq(0),
+                                dfi.phases[wrphase].we_n.eq(0),
+                                dfi.phases[wrphase].wrdata_en.eq(1),
+                                write_ack
+                            )
+                        ).Else(
+                            stream_start.eq(1)
+                        )
+                    ).Elif(~bank_idle,
+                        If(write2precharge_timer.done,
+                            NextState("PRECHARGE")
+                        )
+                    ).Elif(activate_ok,
+                        NextState("ACTIVATE")
                     )
-                ).Else(
-                    NextState("ACTIVATE")
+                ).Elif(close_idle & write2precharge_timer.done,
+                    NextState("PRECHARGE-IDLE")
+                )
+            )
+            fsm.act("FLUSH",
+                If(pending == 0,
+                    flush.eq(1),
+                    NextState("IDLE")
+                )
+            )
+        else:
+            fsm.act("IDLE",
+                If(refresh_timer.done,
+                    NextState("PRECHARGE-ALL")
+                ).Elif(bus.stb & bus.cyc,
+                    If(bank_hit,
+                        If(bus.we,
+                            NextState("WRITE")
+                        ).Else(
+                            NextState("READ")
+                        )
+                    ).Elif(~bank_idle,
+                        If(write2precharge_timer.done,
+                            NextState("PRECHARGE")
+                        )
+                    ).Elif(activate_ok,
+                        NextState("ACTIVATE")
+                    )
+                ).Elif(close_idle & write2precharge_timer.done,
+                    NextState("PRECHARGE-IDLE")
                 )
             )
-        )
         fsm.act("READ",
             read.eq(1),
             dfi.phases[rdphase].ras_n.eq(1),
@@ -181,6 +358,13 @@ class Minicon(Module):
             dfi.phases[rdphase].we_n.eq(0),
             NextState("PRE-REFRESH")
         )
+        fsm.act("PRECHARGE-IDLE",
+            precharge_all.eq(1),
+            dfi.phases[rdphase].ras_n.eq(0),
+            dfi.phases[rdphase].cas_n.eq(1),
+            dfi.phases[rdphase].we_n.eq(0),
+            NextState("TRP-IDLE")
+        )
         fsm.act("PRECHARGE",
             # do no reset bank since we are going to re-open it
             dfi.phases[0].ras_n.eq(0),
@@ -204,6 +388,7 @@ class Minicon(Module):
         )
         fsm.delayed_enter("WRITE-LATENCY", "WRITE-ACK", phy_settings.write_latency-1)
         fsm.delayed_enter("TRP", "ACTIVATE", timing_settings.tRP-1)
+        fsm.delayed_enter("TRP-IDLE", "IDLE", timing_settings.tRP-1)
         fsm.delayed_enter("TRCD", "IDLE", timing_settings.tRCD-1)
         fsm.delayed_enter("PRE-REFRESH", "REFRESH", timing_settings.tRP-1)
         fsm.delayed_enter("POST-REFRESH", "IDLE", timing_settings.tRFC-1)
@@ -217,19 +402,23 @@ class Minicon(Module):
             self.comb += [
                 phase.cke.eq(1),
                 phase.cs_n.eq(0),
-                phase.bank.eq(slicer.bank(bus.adr)),
+                phase.bank.eq(slicer.bank(adr)),
                 If(precharge_all,
                     phase.address.eq(2**10)
                 ).Elif(activate,
-                     phase.address.eq(slicer.row(bus.adr))
+                     phase.address.eq(slicer.row(adr))
                 ).Elif(write | read,
-                    phase.address.eq(slicer.col(bus.adr))
+                    phase.address.eq(slicer.col(adr)),
+                    If(auto_precharge, phase.address[10].eq(1))
                 )
             ]
 
         # DFI datapath
+        if controller_settings.pipelined:
+            self.comb += bus.dat_r.eq(fifo.dout)
+        else:
+            self.comb += bus.dat_r.eq(Cat(phase.rddata for phase in dfi.phases))
         self.comb += [
-            bus.dat_r.eq(Cat(phase.rddata for phase in dfi.phases)),
             Cat(phase.wrdata for phase in dfi.phases).eq(bus.dat_w),
             Cat(phase.wrdata_mask for phase in dfi.phases).eq(~bus.sel),
         ]
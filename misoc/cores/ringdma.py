@@ -0,0 +1,160 @@
+"""
+Ring buffer DMA engines.
+
+``RingWriter`` continuously stores the data received on its ``sink`` stream
+endpoint into a ring buffer in memory, and ``RingReader`` continuously sends
+the contents of a ring buffer to its ``source``. Both are built on
+``dma_lasmi``.
+
+The ring is located at ``base`` and is ``size`` bytes long. Two pointers,
+given as byte offsets from ``base``, delimit the data in the ring:
+  * for ``RingWriter``, the hardware pointer ``hw_ptr`` is where the next
+    word will be written and the software pointer ``sw_ptr`` where software
+    will read next. The writer stalls its sink when the ring is full.
+  * for ``RingReader``, the software pointer ``sw_ptr`` is where software
+    will write next and ``hw_ptr`` where the reader will read next.
+``hw_ptr`` only moves past data once it has been written to (resp. read
+from) memory. As usual for ring buffers, the ring is empty when both
+pointers are equal, so at most ``size`` minus one word can be used.
+
+``level`` is the number of bytes between the pointers that software has to
+process (data to read for ``RingWriter``, free space to fill for
+``RingReader``). The ``threshold`` event is a level-sensitive interrupt
+that is asserted as long as ``level`` is at least ``threshold``, so that
+software only has to move ``sw_ptr`` once per batch.
+
+Clearing ``enable`` stops the engine and resets ``hw_ptr`` to 0; software
+should reset ``sw_ptr`` at the same time.
+
+All sizes/addresses in bytes, and must be multiples of the bus word size.
+"""
+
+from migen import *
+
+from misoc.interconnect import stream, dma_lasmi
+from misoc.interconnect.csr import *
+from misoc.interconnect.csr_eventmanager import *
+
+
+class _Ring(Module, AutoCSR):
+    def __init__(self, lasmim):
+        word_bits = log2_int(lasmim.dw//8)
+
+        self.enable = CSRStorage()
+        self.base = CSRStorage(lasmim.aw + word_bits, alignment_bits=word_bits)
+        self.size = CSRStorage(lasmim.aw + word_bits, alignment_bits=word_bits)
+        self.sw_ptr = CSRStorage(lasmim.aw + word_bits, alignment_bits=word_bits)
+        self.hw_ptr = CSRStatus(lasmim.aw + word_bits)
+        self.level = CSRStatus(lasmim.aw + word_bits)
+        self.threshold = CSRStorage(lasmim.aw + word_bits, alignment_bits=word_bits)
+
+        self.submodules.ev = EventManager()
+        self.ev.threshold = EventSourceLevel()
+        self.ev.finalize()
+
+        # # #
+
+        # hardware pointer for requests, and hardware pointer for data
+        # that has reached/left memory
+        self.issue_ptr = Signal(lasmim.aw)
+        self.done_ptr = Signal(lasmim.aw)
+        self.issue = Signal()
+        self.done = Signal()
+
+        size = self.size.storage
+        sw_ptr = self.sw_ptr.storage
+
+        def inc(ptr):
+            return If(ptr == size - 1,
+                ptr.eq(0)
+            ).Else(
+                ptr.eq(ptr + 1)
+            )
+
+        self.sync += [
+            If(~self.enable.storage,
+                self.issue_ptr.eq(0),
+                self.done_ptr.eq(0)
+            ).Else(
+                If(self.issue, inc(self.issue_ptr)),
+                If(self.done, inc(self.done_ptr))
+            )
+        ]
+
+        self.issue_next = Signal(lasmim.aw)
+        self.comb += \
+            If(self.issue_ptr == size - 1,
+                self.issue_next.eq(0)
+            ).Else(
+                self.issue_next.eq(self.issue_ptr + 1)
+            )
+
+        self.hw_level = Signal(lasmim.aw)  # words from sw_ptr to done_ptr
+        self.comb += [
+            If(self.done_ptr >= sw_ptr,
+                self.hw_level.eq(self.done_ptr - sw_ptr)
+            ).Else(
+                self.hw_level.eq(self.done_ptr + size - sw_ptr)
+            ),
+            self.hw_ptr.status.eq(self.done_ptr << word_bits),
+            self.ev.threshold.trigger.eq(self.enable.storage &
+                (self.level.status >= self.threshold.storage << word_bits))
+        ]
+
+
+class RingWriter(_Ring):
+    def __init__(self, lasmim):
+        _Ring.__init__(self, lasmim)
+        self.sink = stream.Endpoint([("data", lasmim.dw)])
+
+        # # #
+
+        word_bits = log2_int(lasmim.dw//8)
+        writer = dma_lasmi.Writer(lasmim)
+        self.submodules += writer
+
+        full = Signal()
+        self.comb += [
+            full.eq(self.issue_next == self.sw_ptr.storage),
+            writer.address_data.stb.eq(self.sink.stb & self.enable.storage & ~full),
+            writer.address_data.a.eq(self.base.storage + self.issue_ptr),
+            writer.address_data.d.eq(self.sink.data),
+            self.issue.eq(writer.address_data.stb & writer.address_data.ack),
+            self.sink.ack.eq(self.issue),
+            self.done.eq(lasmim.dat_w_ack),
+
+            self.level.status.eq(self.hw_level << word_bits)
+        ]
+
+
+class RingReader(_Ring):
+    def __init__(self, lasmim):
+        _Ring.__init__(self, lasmim)
+        self.source = stream.Endpoint([("data", lasmim.dw)])
+
+        # # #
+
+        word_bits = log2_int(lasmim.dw//8)
+        reader = dma_lasmi.Reader(lasmim)
+        self.submodules += reader
+
+        # free space in the ring, for software to fill
+        free = Signal(lasmim.aw)
+        self.comb += [
+            reader.address.stb.eq(self.enable.storage &
+                                  (self.issue_ptr != self.sw_ptr.storage)),
+            reader.address.a.eq(self.base.storage + self.issue_ptr),
+            self.issue.eq(reader.address.stb & reader.address.ack),
+
+            self.source.stb.eq(reader.data.stb),
+            self.source.data.eq(reader.data.d),
+            reader.data.ack.eq(self.source.ack),
+            self.done.eq(self.source.stb & self.source.ack),
+
+            If(self.hw_level == 0,
+                free.eq(self.size.storage - 1)
+            ).Else(
+                free.eq(self.hw_level - 1)
+            ),
+            self.level.status.eq(free << word_bits)
+        ]
@@ -6,10 +6,13 @@
 # TODO:
 # - add $display support to Migen and manage timing violations?
 
+from functools import reduce
+from operator import or_
+
 from migen import *
 from migen.fhdl.specials import *
-from misoc.mem.sdram.phy.dfi import *
-from misoc.mem import sdram
+
+from misoc.interconnect.dfi import *
 
 
 class Bank(Module):
@@ -39,17 +42,19 @@ class Bank(Module):
                 row.eq(self.activate_row)
             )
 
+        # columns are aligned to bursts
+        burst_shift = log2_int(burst_length)
         self.specials.mem = mem = Memory(data_width, nrows*ncols//burst_length)
         self.specials.write_port = write_port = mem.get_port(write_capable=True,
                                                              we_granularity=8)
         self.specials.read_port = read_port = mem.get_port(async_read=True)
         self.comb += [
             If(active,
-                write_port.adr.eq(row*ncols | self.write_col),
+                write_port.adr.eq((row*ncols | self.write_col) >> burst_shift),
                 write_port.dat_w.eq(self.write_data),
                 write_port.we.eq(Replicate(self.write, data_width//8) & ~self.write_mask),
                 If(self.read,
-                    read_port.adr.eq(row*ncols | self.read_col),
+                    read_port.adr.eq((row*ncols | self.read_col) >> burst_shift),
                     self.read_data.eq(read_port.dat_r)
                 )
             )
@@ -73,6 +78,7 @@ class DFIPhase(Module):
         self.precharge = Signal()
         self.write = Signal()
         self.read = Signal()
+        self.auto_precharge = Signal()
 
         ###
         self.comb += [
@@ -82,7 +88,8 @@ class DFIPhase(Module):
             ),
             If(~phase.cs_n & phase.ras_n & ~phase.cas_n,
                 self.write.eq(~phase.we_n),
-                self.read.eq(phase.we_n)
+                self.read.eq(phase.we_n),
+                self.auto_precharge.eq(phase.address[10])
             )
         ]
 
@@ -140,6 +147,11 @@ class SDRAMPHYSim(Module):
                     bank.precharge.eq((phase.bank == nb) | phase.address[10])
                 ]
             self.comb += Case(precharges, cases)
+            # reads/writes with auto-precharge close the row after the access
+            self.comb += If(reduce(or_, [phase.auto_precharge & (phase.bank == nb)
+                                         for phase in phases]),
+                bank.precharge.eq(1)
+            )
 
             # bank writes
             writes = Signal(len(phases))
@@ -171,8 +183,8 @@ class SDRAMPHYSim(Module):
         banks_read = Signal()
         banks_read_data = Signal(data_width)
         self.comb += [
-            banks_read.eq(optree("|", [bank.read for bank in banks])),
-            banks_read_data.eq(optree("|", [bank.read_data for bank in banks]))
+            banks_read.eq(reduce(or_, [bank.read for bank in banks])),
+            banks_read_data.eq(reduce(or_, [bank.read_data for bank in banks]))
         ]
         # simulate read latency
         for i in range(self.settings.read_latency):
@@ -12,7 +12,49 @@ GeomSettingsT = namedtuple("_GeomSettings", "bankbits rowbits colbits addressbit
 def GeomSettings(bankbits, rowbits, colbits):
     return GeomSettingsT(bankbits, rowbits, colbits, max(rowbits, colbits))
 
-TimingSettings = namedtuple("TimingSettings", "tRP tRCD tWR tWTR tREFI tRFC")
+# tRRD, tFAW, tCCD and tRTP are optional (None: not constrained)
+TimingSettings = namedtuple("TimingSettings", "tRP tRCD tWR tWTR tREFI tRFC tRRD tFAW tCCD tRTP")
+TimingSettings.__new__.__defaults__ = (None,)*4
+
+
+class ControllerSettings:
+    # page_policy: "open" (rows stay open until another row is requested),
+    # "closed" (each access closes its row with an auto-precharge) or
+    # "adaptive" (rows are closed after page_timeout idle cycles).
+    # address_mapping: "rbc" (row, bank, column from MSB to LSB), "brc"
+    # (bank, row, column) or "bank_xor" (rbc, with the bank XORed with the
+    # low row bits).
+    # LASMIcon only:
+    # lookahead: number of requests at the head of each bank queue among
+    # which the bank machine picks the oldest row hit (1: in order).
+    # max_age: number of times the head request can be bypassed.
+    # max_masters: crossbar masters supported when lookahead > 1.
+    # refresh_postpone: number of refreshes that can be postponed while the
+    # controller is busy, then issued back-to-back when it is idle (0-8).
+    # Minicon only:
+    # pipelined: issue row hits without an extra cycle and read ahead of
+    # sequential reads.
+    def __init__(self, req_queue_size=8, read_time=32, write_time=16,
+                 lookahead=1, max_age=16, max_masters=8,
+                 page_policy="open", page_timeout=16, refresh_postpone=0,
+                 pipelined=False, address_mapping="rbc"):
+        if page_policy not in ("open", "closed", "adaptive"):
+            raise ValueError("Unknown page policy " + page_policy)
+        if address_mapping not in ("rbc", "brc", "bank_xor"):
+            raise ValueError("Unknown address mapping " + address_mapping)
+        if not 0 <= refresh_postpone <= 8:
+            raise ValueError("refresh_postpone must be between 0 and 8")
+        self.req_queue_size = req_queue_size
+        self.read_time = read_time
+        self.write_time = write_time
+        self.lookahead = lookahead
+        self.max_age = max_age
+        self.max_masters = max_masters
+        self.page_policy = page_policy
+        self.page_timeout = page_timeout
+        self.refresh_postpone = refresh_postpone
+        self.pipelined = pipelined
+        self.address_mapping = address_mapping
 
 
 # TODO:
@@ -27,6 +69,11 @@ TimingSettings = namedtuple("TimingSettings", "tRP tRCD tWR tWTR tREFI tRFC")
 
 
 class SDRAMModule:
+    tRRD = None
+    tFAW = None
+    tCCD = None  # in memory clock cycles
+    tRTP = None
+
     def __init__(self, clk_freq, rate):
         self.clk_freq = clk_freq
         self.rate = rate
@@ -41,9 +88,22 @@ class SDRAMModule:
             tWR=self.ns(self.tWR),
             tWTR=self.tWTR,
             tREFI=self.ns(self.tREFI, False),
-            tRFC=self.ns(self.tRFC)
+            tRFC=self.ns(self.tRFC),
+            tRRD=None if self.tRRD is None else self.ns(self.tRRD),
+            tFAW=None if self.tFAW is None else self.ns(self.tFAW),
+            tCCD=None if self.tCCD is None else self.ck(self.tCCD),
+            tRTP=None if self.tRTP is None else self.ns(self.tRTP)
         )
 
+    def ck(self, t):
+        # memory clock cycles to controller cycles
+        ratios = {
+            "1:1": 1,
+            "1:2": 2,
+            "1:4": 4
+        }
+        return ceil(t/ratios[self.rate])
+
     def ns(self, t, margin=True):
         clk_period_ns = 1000000000/self.clk_freq
         if margin:
@@ -148,6 +208,10 @@ class MT47H128M8(SDRAMModule):
     tWTR  = 2
     tREFI = 7800
     tRFC  = 127.5
+    tRRD  = 7.5
+    tFAW  = 37.5
+    tCCD  = 2
+    tRTP  = 7.5
 
 
 class P3R1GE4JGF(SDRAMModule):
@@ -163,6 +227,10 @@ class P3R1GE4JGF(SDRAMModule):
     tWTR  = 3
     tREFI = 7800
     tRFC  = 127.5
+    tRRD  = 7.5
+    tFAW  = 37.5
+    tCCD  = 2
+    tRTP  = 7.5
 
 
 # DDR3
@@ -179,6 +247,10 @@ class MT8JTF12864(SDRAMModule):
     tWTR  = 2
     tREFI = 7800
     tRFC  = 70
+    tRRD  = 6
+    tFAW  = 30
+    tCCD  = 4
+    tRTP  = 7.5
 
 
 class MT41J128M16(SDRAMModule):
@@ -194,3 +266,7 @@ class MT41J128M16(SDRAMModule):
     tWTR  = 3
     tREFI = 64*1000*1000/16384
     tRFC  = 260
+    tRRD  = 10
+    tFAW  = 50
+    tCCD  = 4
+    tRTP  = 7.5
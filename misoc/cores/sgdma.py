@@ -0,0 +1,229 @@
+"""
+Scatter-gather DMA engines.
+
+``SGReader`` moves data from memory to its ``source`` stream endpoint, and
+``SGWriter`` from its ``sink`` stream endpoint to memory, following a chain
+of descriptors stored in memory. The engines access memory through DMA
+ports with the interface of ``dma_lasmi.Reader``/``Writer``, so they work
+with both Wishbone (``dma_wishbone``) and LASMI (``dma_lasmi``) ports.
+Consecutive words of a buffer are requested back to back, so that the ports
+can keep their bus busy.
+
+A descriptor is 128 bits long (read as one or several bus words, first word
+in the least significant bits) and is made of four 32-bit fields:
+  * address of the buffer
+  * length of the buffer
+  * address of the next descriptor
+  * flags: bit 0 (LAST) ends the chain after this descriptor, bit 1 (IRQ)
+    triggers the ``descriptor`` event when this descriptor completes,
+    bit 2 (EOP) ends the buffer with an end of packet. For ``SGReader``,
+    eop is asserted on the last word; for ``SGWriter``, the buffer is
+    completed early when a word with eop is received.
+
+Addresses and lengths are in bytes, in the address space of the DMA port,
+and must be multiples of the bus word size. The engines take ownership of
+the DMA ports passed to them (they are added as submodules). Writing to ``start`` launches
+the chain at ``descriptor``. ``completed`` counts the descriptors completed
+since the start, and ``SGWriter.length`` gives the number of bytes written
+into the buffer of the last completed descriptor. The ``done`` event is
+triggered at the end of the chain.
+"""
+
+from migen import *
+from migen.genlib.fsm import FSM, NextState
+
+from misoc.interconnect import stream
+from misoc.interconnect.csr import *
+from misoc.interconnect.csr_eventmanager import *
+
+
+FLAG_LAST = 0b001
+FLAG_IRQ = 0b010
+FLAG_EOP = 0b100
+
+
+descriptor_layout = [
+    ("address", 32),
+    ("length", 32),
+    ("next", 32),
+    ("flags", 32)
+]
+
+
+class _SGDMA(Module, AutoCSR):
+    def __init__(self, reader):
+        self.submodules.reader = reader
+        dw = len(reader.data.d)
+        aw = len(reader.address.a)
+        self.word_bits = word_bits = log2_int(dw//8)
+
+        self.descriptor = CSRStorage(32, alignment_bits=word_bits)
+        self.start = CSR()
+        self.busy = CSRStatus()
+        self.completed = CSRStatus(32)
+
+        self.submodules.ev = EventManager()
+        self.ev.descriptor = EventSourcePulse()
+        self.ev.done = EventSourcePulse()
+        self.ev.finalize()
+
+        # # #
+
+        # descriptor fetch, through the reader
+        nwords = max(1, 128//dw)
+        desc_adr = Signal(aw)
+        desc_raw = Signal(nwords*dw)
+        desc_issued = Signal(max=nwords+1)
+        desc_received = Signal(max=nwords+1)
+        self.fetch = Signal()
+        self.fetched = Signal()
+        self.comb += self.fetched.eq(desc_received == nwords)
+        self.sync += \
+            If(~self.fetch,
+                desc_issued.eq(0),
+                desc_received.eq(0)
+            ).Else(
+                If(reader.address.stb & reader.address.ack,
+                    desc_issued.eq(desc_issued + 1)
+                ),
+                If(reader.data.stb & reader.data.ack,
+                    desc_received.eq(desc_received + 1),
+                    desc_raw.eq(Cat(desc_raw[dw:], reader.data.d))
+                )
+            )
+        self.fetch_statements = [
+            reader.address.stb.eq(desc_issued != nwords),
+            reader.address.a.eq(desc_adr + desc_issued),
+            reader.data.ack.eq(1)
+        ]
+
+        # current descriptor
+        desc = Record(descriptor_layout)
+        self.comb += desc.raw_bits().eq(desc_raw[:128])
+        self.load = Signal()
+        self.buf_adr = Signal(aw)
+        self.buf_length = Signal(32 - word_bits)
+        self.buf_flags = Signal(3)
+        self.sync += [
+            If(self.start.re,
+                desc_adr.eq(self.descriptor.storage),
+                self.completed.status.eq(0)
+            ),
+            If(self.load,
+                self.buf_adr.eq(desc.address[word_bits:]),
+                self.buf_length.eq(desc.length[word_bits:]),
+                self.buf_flags.eq(desc.flags),
+                desc_adr.eq(desc.next[word_bits:])
+            )
+        ]
+
+        # descriptor completion
+        self.desc_done = Signal()
+        self.sync += If(self.desc_done,
+            self.completed.status.eq(self.completed.status + 1))
+        self.comb += [
+            self.ev.descriptor.trigger.eq(self.desc_done & self.buf_flags[1]),
+            self.ev.done.trigger.eq(self.desc_done & self.buf_flags[0])
+        ]
+
+    def add_fsm(self, transfer_state):
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(self.start.re,
+                NextState("FETCH")
+            )
+        )
+        fsm.act("FETCH",
+            self.fetch.eq(1),
+            self.fetch_statements,
+            If(self.fetched,
+                NextState("LOAD")
+            )
+        )
+        fsm.act("LOAD",
+            self.load.eq(1),
+            NextState("TRANSFER")
+        )
+        fsm.act("TRANSFER", *transfer_state)
+        fsm.act("DESCRIPTOR_DONE",
+            self.desc_done.eq(1),
+            If(self.buf_flags[0],
+                NextState("IDLE")
+            ).Else(
+                NextState("FETCH")
+            )
+        )
+        self.comb += self.busy.status.eq(~fsm.ongoing("IDLE"))
+
+
+class SGReader(_SGDMA):
+    def __init__(self, reader):
+        _SGDMA.__init__(self, reader)
+        self.source = stream.Endpoint([("data", len(reader.data.d))])
+
+        # # #
+
+        issued = Signal(32 - self.word_bits)
+        received = Signal(32 - self.word_bits)
+        self.sync += [
+            If(self.load,
+                issued.eq(0),
+                received.eq(0)
+            ).Else(
+                If(reader.address.stb & reader.address.ack,
+                    issued.eq(issued + 1)
+                ),
+                If(self.source.stb & self.source.ack,
+                    received.eq(received + 1)
+                )
+            )
+        ]
+
+        self.add_fsm([
+            reader.address.stb.eq(issued != self.buf_length),
+            reader.address.a.eq(self.buf_adr + issued),
+            self.source.stb.eq(reader.data.stb),
+            self.source.eop.eq(self.buf_flags[2] & (received == self.buf_length - 1)),
+            self.source.data.eq(reader.data.d),
+            reader.data.ack.eq(self.source.ack),
+            If(received == self.buf_length,
+                NextState("DESCRIPTOR_DONE")
+            )
+        ])
+
+
+class SGWriter(_SGDMA):
+    def __init__(self, reader, writer):
+        _SGDMA.__init__(self, reader)
+        self.submodules.writer = writer
+        self.sink = stream.Endpoint([("data", len(writer.address_data.d))])
+        self.length = CSRStatus(32)
+
+        # # #
+
+        written = Signal(32 - self.word_bits)
+        eop = Signal()
+        self.sync += [
+            If(self.load,
+                written.eq(0),
+                eop.eq(0)
+            ).Elif(self.sink.stb & self.sink.ack,
+                written.eq(written + 1),
+                eop.eq(self.sink.eop & self.buf_flags[2])
+            ),
+            If(self.desc_done,
+                self.length.status.eq(written << self.word_bits)
+            )
+        ]
+
+        complete = Signal()
+        self.comb += complete.eq((written == self.buf_length) | eop)
+        self.add_fsm([
+            writer.address_data.stb.eq(self.sink.stb & ~complete),
+            writer.address_data.a.eq(self.buf_adr + written),
+            writer.address_data.d.eq(self.sink.data),
+            self.sink.ack.eq(writer.address_data.stb & writer.address_data.ack),
+            If(complete & ~writer.busy,
+                NextState("DESCRIPTOR_DONE")
+            )
+        ])
@@ -0,0 +1,67 @@
+"""
+Stream endpoint probes.
+
+``StreamProbe`` passively taps a stream endpoint and counts, over a window of
+``2**period_bits`` cycles:
+  * transfers (``stb & ack``)
+  * stalls, i.e. cycles where data is available but not accepted
+    (``stb & ~ack``)
+  * idle cycles (``~stb``)
+  * packets (transfers with ``eop``)
+
+At the end of each window, the counters are latched and reset. Writing to
+``update`` copies the latched values of the last complete window into the
+status CSRs.
+
+``PipelineProbes`` attaches a probe to each connection between the stages of
+a ``stream.Pipeline``, named after the upstream stage (e.g. ``crc_update``).
+Probes run in the sys clock domain, so only stages in that domain should be
+probed.
+"""
+
+from migen import *
+
+from misoc.interconnect.csr import *
+from misoc.cores.bus_monitor import WindowCounters
+
+
+class StreamProbe(Module, AutoCSR):
+    def __init__(self, endpoint, period_bits=24):
+        self._update = CSR()
+        self._transfers = CSRStatus(period_bits + 1)
+        self._stalls = CSRStatus(period_bits + 1)
+        self._idles = CSRStatus(period_bits + 1)
+        self._packets = CSRStatus(period_bits + 1)
+
+        ###
+
+        stb = Signal()
+        ack = Signal()
+        eop = Signal()
+        self.sync += [
+            stb.eq(endpoint.stb),
+            ack.eq(endpoint.ack),
+            eop.eq(endpoint.eop)
+        ]
+
+        events = [
+            (self._transfers, stb & ack),
+            (self._stalls, stb & ~ack),
+            (self._idles, ~stb),
+            (self._packets, stb & ack & eop)
+        ]
+        self.submodules += WindowCounters(self._update.re, events, period_bits)
+
+
+class PipelineProbes(Module, AutoCSR):
+    # stages: names of the upstream stages of the connections to probe,
+    # defaults to all the connections.
+    def __init__(self, pipeline, period_bits=24, stages=None):
+        if stages is None:
+            stages = list(pipeline.connections.keys())
+        self.probes = dict()
+        for name in stages:
+            probe = StreamProbe(pipeline.connections[name], period_bits)
+            self.submodules += probe
+            setattr(self, name, probe)
+            self.probes[name] = probe
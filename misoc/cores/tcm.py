@@ -0,0 +1,83 @@
+"""
+Tightly-coupled memory.
+
+A private block RAM is connected directly to the CPU data bus (and optionally
+to the instruction bus). Accesses falling within its address window are
+served by the block RAM without going through the shared arbiter and address
+decoder, and are acked one cycle after they are issued. All other accesses
+are forwarded unchanged to the output buses.
+
+The memory is private to the CPU: other bus masters cannot access it.
+
+To keep the null pointer and stack probing checks, the data bus should be
+taken after the TMPU (i.e. pass ``tmpu.output_bus`` as ``dbus``). Like the
+TMPU, this module does not use Wishbone combinatorial feedback.
+
+All sizes in bytes.
+"""
+
+from migen import *
+
+from misoc.interconnect import wishbone
+
+
+class _TCMPort(Module):
+    def __init__(self, input_bus, output_bus, port, address_decoder):
+        hit = Signal()
+        ack = Signal()
+        self.comb += [
+            hit.eq(address_decoder(input_bus.adr)),
+
+            output_bus.adr.eq(input_bus.adr),
+            output_bus.dat_w.eq(input_bus.dat_w),
+            output_bus.sel.eq(input_bus.sel),
+            output_bus.cyc.eq(input_bus.cyc & ~hit),
+            output_bus.stb.eq(input_bus.stb & ~hit),
+            output_bus.we.eq(input_bus.we),
+            output_bus.cti.eq(input_bus.cti),
+            output_bus.bte.eq(input_bus.bte),
+
+            port.adr.eq(input_bus.adr[:len(port.adr)]),
+            If(hit,
+                input_bus.dat_r.eq(port.dat_r),
+                input_bus.ack.eq(ack),
+                input_bus.err.eq(0)
+            ).Else(
+                input_bus.dat_r.eq(output_bus.dat_r),
+                input_bus.ack.eq(output_bus.ack),
+                input_bus.err.eq(output_bus.err)
+            )
+        ]
+        if port.we is not None:
+            self.comb += [
+                port.dat_w.eq(input_bus.dat_w),
+                [port.we[i].eq(input_bus.cyc & input_bus.stb & input_bus.we &
+                               input_bus.sel[i] & hit)
+                    for i in range(len(port.we))]
+            ]
+        self.sync += ack.eq(input_bus.cyc & input_bus.stb & hit & ~ack)
+
+
+class TCM(Module):
+    def __init__(self, size, address_decoder, dbus, ibus=None, init=None):
+        self.dbus_output = wishbone.Interface.like(dbus)
+        if ibus is not None:
+            self.ibus_output = wishbone.Interface.like(ibus)
+        else:
+            self.ibus_output = None
+
+        data_width = len(dbus.dat_w)
+        self.mem = Memory(data_width, size//(data_width//8), init=init)
+
+        # # #
+
+        dport = self.mem.get_port(write_capable=True, we_granularity=8)
+        self.specials += self.mem, dport
+        self.submodules += _TCMPort(dbus, self.dbus_output, dport,
+                                    address_decoder)
+
+        if ibus is not None:
+            iport = self.mem.get_port()
+            self.specials += iport
+            self.submodules += _TCMPort(ibus, self.ibus_output, iport,
+                                        address_decoder)
@@ -2,7 +2,8 @@ from operator import itemgetter
 
 from migen import *
 
-from misoc.cores import lm32, mor1kx, tmpu, identifier, timer, uart
+from misoc.cores import (lm32, mor1kx, tmpu, tcm, identifier, timer, uart,
+                         memcopy, bus_monitor, bus_trace)
 from misoc.interconnect import wishbone, csr_bus, wishbone2csr
 
 
@@ -17,6 +18,7 @@ class SoCCore(Module):
     mem_map = {
         "rom":      0x00000000,  # (default shadow @0x80000000)
         "sram":     0x10000000,  # (default shadow @0x90000000)
+        "tcm":      0x20000000,  # (default shadow @0xa0000000)
         "main_ram": 0x40000000,  # (default shadow @0xc0000000)
         "csr":      0x60000000,  # (default shadow @0xe0000000)
     }
@@ -25,11 +27,18 @@ class SoCCore(Module):
                 integrated_rom_size=0,
                 integrated_sram_size=4096,
                 integrated_main_ram_size=16*1024,
+                integrated_sram_banks=1,
+                integrated_main_ram_banks=1,
+                wishbone_crossbar=False,
+                tcm_size=0, tcm_on_ibus=False,
                 shadow_base=0x80000000,
                 csr_data_width=8, csr_address_width=14,
                 with_uart=True, uart_baudrate=115200,
                 ident="",
-                with_timer=True):
+                with_timer=True,
+                with_memcopy=False,
+                with_bus_monitors=False,
+                with_bus_trace=False):
         self.platform = platform
         self.clk_freq = clk_freq
 
@@ -41,6 +50,11 @@ class SoCCore(Module):
         self.integrated_rom_size = integrated_rom_size
         self.integrated_sram_size = integrated_sram_size
         self.integrated_main_ram_size = integrated_main_ram_size
+        self.tcm_size = tcm_size
+
+        self.wishbone_crossbar = wishbone_crossbar
+        self.with_bus_monitors = with_bus_monitors
+        self.with_bus_trace = with_bus_trace
 
         self.with_uart = with_uart
         self.uart_baudrate = uart_baudrate
@@ -75,21 +89,39 @@ class SoCCore(Module):
         else:
             raise ValueError("Unsupported CPU type: {}".format(cpu_type))
         self.submodules.tmpu = tmpu.TMPU(self.cpu.dbus)
-        self.add_wb_master(self.cpu.ibus)
-        self.add_wb_master(self.tmpu.output_bus)
+        if tcm_size:
+            self.submodules.tcm = tcm.TCM(tcm_size,
+                mem_decoder(self.mem_map["tcm"]), self.tmpu.output_bus,
+                self.cpu.ibus if tcm_on_ibus else None)
+            self.add_memory_region("tcm", self.mem_map["tcm"], tcm_size)
+            self.add_wb_master(self.tcm.ibus_output if tcm_on_ibus else self.cpu.ibus)
+            self.add_wb_master(self.tcm.dbus_output)
+        else:
+            self.add_wb_master(self.cpu.ibus)
+            self.add_wb_master(self.tmpu.output_bus)
 
         if integrated_rom_size:
             self.submodules.rom = wishbone.SRAM(integrated_rom_size, read_only=True)
             self.register_rom(self.rom.bus, integrated_rom_size)
 
         if integrated_sram_size:
-            self.submodules.sram = wishbone.SRAM(integrated_sram_size)
-            self.register_mem("sram", self.mem_map["sram"], self.sram.bus, integrated_sram_size)
+            if integrated_sram_banks > 1:
+                self.submodules.sram = wishbone.InterleavedSRAM(
+                    integrated_sram_size, integrated_sram_banks)
+                self.register_interleaved_mem("sram", self.mem_map["sram"], self.sram, integrated_sram_size)
+            else:
+                self.submodules.sram = wishbone.SRAM(integrated_sram_size)
+                self.register_mem("sram", self.mem_map["sram"], self.sram.bus, integrated_sram_size)
 
         # Note: Main Ram can be used when no external SDRAM is available and use SDRAM mapping.
         if integrated_main_ram_size:
-            self.submodules.main_ram = wishbone.SRAM(integrated_main_ram_size)
-            self.register_mem("main_ram", self.mem_map["main_ram"], self.main_ram.bus, integrated_main_ram_size)
+            if integrated_main_ram_banks > 1:
+                self.submodules.main_ram = wishbone.InterleavedSRAM(
+                    integrated_main_ram_size, integrated_main_ram_banks)
+                self.register_interleaved_mem("main_ram", self.mem_map["main_ram"], self.main_ram, integrated_main_ram_size)
+            else:
+                self.submodules.main_ram = wishbone.SRAM(integrated_main_ram_size)
+                self.register_mem("main_ram", self.mem_map["main_ram"], self.main_ram.bus, integrated_main_ram_size)
 
         self.submodules.wishbone2csr = wishbone2csr.WB2CSR(
             bus_csr=csr_bus.Interface(csr_data_width, csr_address_width))
@@ -109,6 +141,12 @@ class SoCCore(Module):
             self.submodules.timer0 = timer.Timer()
             self.interrupt_devices.append("timer0")
 
+        if with_memcopy:
+            self.submodules.memcopy = memcopy.MemCopy()
+            self.add_wb_master(self.memcopy.bus)
+            self.csr_devices.append("memcopy")
+            self.interrupt_devices.append("memcopy")
+
     def initialize_rom(self, data):
         self.rom.mem.init = data
 
@@ -136,6 +174,12 @@ class SoCCore(Module):
         if size is not None:
             self.add_memory_region(name, address, size)
 
+    def register_interleaved_mem(self, name, address, interleaved, size=None):
+        for decoder, interface in interleaved.get_slaves(mem_decoder(address)):
+            self.add_wb_slave(decoder, interface)
+        if size is not None:
+            self.add_memory_region(name, address, size)
+
     def register_rom(self, interface, rom_size=0xa000):
         self.add_wb_slave(mem_decoder(self.mem_map["rom"]), interface)
         self.add_memory_region("rom", self.cpu_reset_address, rom_size)
@@ -177,8 +221,21 @@ class SoCCore(Module):
                 raise FinalizeError("CPU needs a {} to be registered with register_mem()".format(mem))
 
         # Wishbone
-        self.submodules.wishbonecon = wishbone.InterconnectShared(self._wb_masters,
-            self._wb_slaves, register=True)
+        if self.with_bus_monitors:
+            # masters 0 and 1 are the CPU instruction and data buses
+            for n, master in enumerate(self._wb_masters):
+                name = "bus_monitor" + str(n)
+                setattr(self.submodules, name, bus_monitor.WishboneMonitor(master))
+                self.csr_devices.append(name)
+        if self.with_bus_trace:
+            self.submodules.bus_trace = bus_trace.BusTrace(self._wb_masters)
+            self.csr_devices += ["bus_trace", "bus_trace_mem"]
+        if self.wishbone_crossbar:
+            self.submodules.wishbonecon = wishbone.Crossbar(self._wb_masters,
+                self._wb_slaves, register=True)
+        else:
+            self.submodules.wishbonecon = wishbone.InterconnectShared(self._wb_masters,
+                self._wb_slaves, register=True)
 
         # CSR
         self.submodules.csrbankarray = csr_bus.CSRBankArray(self,
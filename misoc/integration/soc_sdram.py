@@ -34,22 +34,41 @@ class SoCSDRAM(SoCCore):
             raise FinalizeError
         self._cpulevel_sdram_ifs.append(interface)
 
-    def get_native_sdram_if(self):
+    def get_native_sdram_if(self, data_width=None):
         """Creates and registers a native SDRAM interface, tightly coupled to
         the controller.
 
+        With LASMIcon, each interface is an independent port of the LASMI
+        crossbar. With Minicon, interfaces are Wishbone and share the
+        controller through an arbiter.
+
+        If ``data_width`` is given and differs from the controller data
+        width, a Wishbone interface of that width is returned, converted to
+        the controller width (and bridged to its own LASMI port with
+        LASMIcon).
+
         This can only be called after ``register_sdram``.
         """
         if isinstance(self.sdram_controller, minicon.Minicon):
             bus = wishbone.Interface(len(self.sdram_controller.bus.dat_w))
             self._native_sdram_ifs.append(bus)
-            return bus
+            if data_width is None or data_width == len(bus.dat_w):
+                return bus
+            converted = wishbone.Interface(data_width)
+            self.submodules += wishbone.Converter(converted, bus)
+            return converted
         elif isinstance(self.sdram_controller, lasmicon.LASMIcon):
-            return self.lasmi_crossbar.get_master()
+            port = self.lasmi_crossbar.get_master()
+            if data_width is None or data_width == port.dw:
+                return port
+            converted = wishbone.Interface(data_width)
+            self.submodules += wishbone2lasmi.Bridge(converted, port)
+            return converted
         else:
             raise TypeError
 
-    def register_sdram(self, phy, sdram_controller_type, geom_settings, timing_settings):
+    def register_sdram(self, phy, sdram_controller_type, geom_settings, timing_settings,
+                       controller_settings=None):
         # register PHY
         assert not self._sdram_phy
         self._sdram_phy.append(phy)  # encapsulate in list to prevent CSR scanning
@@ -76,7 +95,7 @@ class SoCSDRAM(SoCCore):
         # create controller
         if sdram_controller_type == "minicon":
             self.submodules.sdram_controller = minicon.Minicon(
-                phy.settings, geom_settings, timing_settings)
+                phy.settings, geom_settings, timing_settings, controller_settings)
             self._native_sdram_ifs = []
 
             bridge_if = self.get_native_sdram_if()
@@ -97,7 +116,7 @@ class SoCSDRAM(SoCCore):
                     self._cpulevel_sdram_if_arbitrated, bridge_if)
         elif sdram_controller_type == "lasmicon":
             self.submodules.sdram_controller = lasmicon.LASMIcon(
-                phy.settings, geom_settings, timing_settings)
+                phy.settings, geom_settings, timing_settings, controller_settings)
             self.submodules.lasmi_crossbar = lasmi_bus.LASMIxbar(
                 [self.sdram_controller.lasmic],
                 self.sdram_controller.nrowbits)
@@ -116,10 +135,13 @@ class SoCSDRAM(SoCCore):
                     self.submodules.l2_cache = FullMemoryWE()(l2_cache)
                 else:
                     self.submodules.l2_cache = l2_cache
+                # refill L2 lines with back-to-back requests
+                line_words = max(len(l2_cache.master.dat_w)//bridge_if.dw, 1)
                 self.submodules.wishbone2lasmi = wishbone2lasmi.WB2LASMI(
-                    self.l2_cache.slave, bridge_if)
+                    self.l2_cache.slave, bridge_if, burst=line_words)
             else:
-                raise NotImplementedError
+                self.submodules.wishbone2lasmi = wishbone2lasmi.Bridge(
+                    self._cpulevel_sdram_if_arbitrated, bridge_if)
         else:
             raise ValueError("Incorrect SDRAM controller type specified")
         self.comb += self.sdram_controller.dfi.connect(self.dfii.slave)
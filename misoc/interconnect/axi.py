@@ -0,0 +1,419 @@
+"""
+AXI4 interconnect
+=================
+
+Interfaces and bridges to connect AXI4, AXI4-Lite and AXI4-Stream IP to the
+Wishbone, CSR and stream interconnects.
+
+Only INCR and FIXED bursts are supported, and all beats must use the full
+data width of the bus (``size`` is ignored).
+"""
+
+from migen import *
+from migen.genlib.record import *
+from migen.genlib.fsm import FSM, NextState, NextValue
+
+from misoc.interconnect import stream
+
+
+BURST_FIXED = 0b00
+BURST_INCR  = 0b01
+BURST_WRAP  = 0b10
+
+RESP_OKAY   = 0b00
+RESP_SLVERR = 0b10
+
+
+def _channel(payload, direction=DIR_M_TO_S):
+    reverse = DIR_S_TO_M if direction == DIR_M_TO_S else DIR_M_TO_S
+    return [
+        ("valid", 1, direction),
+        ("ready", 1, reverse)
+    ] + [(name, width, direction) for name, width in payload]
+
+
+class Interface(Record):
+    def __init__(self, data_width=32, address_width=32, id_width=1):
+        self.data_width = data_width
+        self.address_width = address_width
+        self.id_width = id_width
+        Record.__init__(self, [
+            ("aw", _channel([("addr", address_width), ("id", id_width),
+                             ("len", 8), ("size", 3), ("burst", 2)])),
+            ("w", _channel([("data", data_width), ("strb", data_width//8),
+                            ("last", 1)])),
+            ("b", _channel([("resp", 2), ("id", id_width)], DIR_S_TO_M)),
+            ("ar", _channel([("addr", address_width), ("id", id_width),
+                             ("len", 8), ("size", 3), ("burst", 2)])),
+            ("r", _channel([("data", data_width), ("resp", 2),
+                            ("id", id_width), ("last", 1)], DIR_S_TO_M))
+        ])
+
+    def write(self, addr, data, id=0, burst=BURST_INCR):
+        """Burst write method for simulation. ``data`` is a list of words."""
+        yield self.aw.addr.eq(addr)
+        yield self.aw.id.eq(id)
+        yield self.aw.len.eq(len(data) - 1)
+        yield self.aw.size.eq(log2_int(self.data_width//8))
+        yield self.aw.burst.eq(burst)
+        yield self.aw.valid.eq(1)
+        yield
+        while not (yield self.aw.ready):
+            yield
+        yield self.aw.valid.eq(0)
+        for i, word in enumerate(data):
+            yield self.w.data.eq(word)
+            yield self.w.strb.eq(2**(self.data_width//8) - 1)
+            yield self.w.last.eq(i == len(data) - 1)
+            yield self.w.valid.eq(1)
+            yield
+            while not (yield self.w.ready):
+                yield
+        yield self.w.valid.eq(0)
+        yield self.b.ready.eq(1)
+        yield
+        while not (yield self.b.valid):
+            yield
+        yield self.b.ready.eq(0)
+        return (yield self.b.resp)
+
+    def read(self, addr, length, id=0, burst=BURST_INCR):
+        """Burst read method for simulation. Returns a list of words."""
+        yield self.ar.addr.eq(addr)
+        yield self.ar.id.eq(id)
+        yield self.ar.len.eq(length - 1)
+        yield self.ar.size.eq(log2_int(self.data_width//8))
+        yield self.ar.burst.eq(burst)
+        yield self.ar.valid.eq(1)
+        yield
+        while not (yield self.ar.ready):
+            yield
+        yield self.ar.valid.eq(0)
+        yield self.r.ready.eq(1)
+        data = []
+        while True:
+            yield
+            if (yield self.r.valid):
+                data.append((yield self.r.data))
+                if (yield self.r.last):
+                    break
+        yield self.r.ready.eq(0)
+        return data
+
+
+class LiteInterface(Record):
+    def __init__(self, data_width=32, address_width=32):
+        self.data_width = data_width
+        self.address_width = address_width
+        Record.__init__(self, [
+            ("aw", _channel([("addr", address_width)])),
+            ("w", _channel([("data", data_width), ("strb", data_width//8)])),
+            ("b", _channel([("resp", 2)], DIR_S_TO_M)),
+            ("ar", _channel([("addr", address_width)])),
+            ("r", _channel([("data", data_width), ("resp", 2)], DIR_S_TO_M))
+        ])
+
+
+class StreamInterface(Record):
+    def __init__(self, data_width=32):
+        self.data_width = data_width
+        Record.__init__(self, _channel([("data", data_width), ("last", 1)]))
+
+
+class AXI2Wishbone(Module):
+    """AXI2Wishbone
+
+    This module bridges an AXI4 master to a Wishbone slave of the same data
+    width. Each beat of a burst is translated into a Wishbone access using
+    incrementing (INCR, WRAP) or constant address (FIXED) burst cycle types,
+    so that burst-aware slaves can stream.
+    Read and write bursts are served one at a time, reads first.
+    """
+    def __init__(self, axi, wishbone):
+        dw = len(wishbone.dat_w)
+        assert axi.data_width == dw
+        offset_bits = log2_int(dw//8)
+
+        # # #
+
+        adr = Signal(len(wishbone.adr))
+        count = Signal(8)
+        burst = Signal(2)
+        id = Signal(axi.id_width)
+        last = Signal()
+        next_beat = Signal()
+        self.comb += last.eq(count == 0)
+        load_ar = Signal()
+        load_aw = Signal()
+        self.sync += [
+            If(load_ar,
+                adr.eq(axi.ar.addr[offset_bits:]),
+                count.eq(axi.ar.len),
+                burst.eq(axi.ar.burst),
+                id.eq(axi.ar.id)
+            ).Elif(load_aw,
+                adr.eq(axi.aw.addr[offset_bits:]),
+                count.eq(axi.aw.len),
+                burst.eq(axi.aw.burst),
+                id.eq(axi.aw.id)
+            ).Elif(next_beat,
+                If(burst != BURST_FIXED, adr.eq(adr + 1)),
+                count.eq(count - 1)
+            )
+        ]
+
+        r_valid = Signal()
+        r_data = Signal(dw)
+        r_last = Signal()
+        r_load = Signal()
+        self.comb += [
+            axi.r.valid.eq(r_valid),
+            axi.r.data.eq(r_data),
+            axi.r.last.eq(r_last),
+            axi.r.id.eq(id),
+            axi.r.resp.eq(RESP_OKAY),
+            axi.b.id.eq(id),
+            axi.b.resp.eq(RESP_OKAY)
+        ]
+        self.sync += \
+            If(r_load,
+                r_valid.eq(1),
+                r_data.eq(wishbone.dat_r),
+                r_last.eq(last)
+            ).Elif(axi.r.ready,
+                r_valid.eq(0)
+            )
+
+        self.comb += [
+            wishbone.adr.eq(adr),
+            wishbone.dat_w.eq(axi.w.data),
+            If(last,
+                wishbone.cti.eq(7)
+            ).Elif(burst == BURST_FIXED,
+                wishbone.cti.eq(1)
+            ).Else(
+                wishbone.cti.eq(2)
+            )
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(axi.ar.valid,
+                axi.ar.ready.eq(1),
+                load_ar.eq(1),
+                NextState("READ")
+            ).Elif(axi.aw.valid,
+                axi.aw.ready.eq(1),
+                load_aw.eq(1),
+                NextState("WRITE")
+            )
+        )
+        fsm.act("READ",
+            wishbone.sel.eq(2**len(wishbone.sel) - 1),
+            If(~r_valid | axi.r.ready,
+                wishbone.cyc.eq(1),
+                wishbone.stb.eq(1),
+                If(wishbone.ack,
+                    next_beat.eq(1),
+                    r_load.eq(1),
+                    If(last,
+                        NextState("READ_DONE")
+                    )
+                )
+            )
+        )
+        fsm.act("READ_DONE",
+            If(~r_valid | axi.r.ready,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WRITE",
+            wishbone.sel.eq(axi.w.strb),
+            If(axi.w.valid,
+                wishbone.cyc.eq(1),
+                wishbone.stb.eq(1),
+                wishbone.we.eq(1),
+                If(wishbone.ack,
+                    axi.w.ready.eq(1),
+                    next_beat.eq(1),
+                    If(last,
+                        NextState("WRITE_RESPONSE")
+                    )
+                )
+            )
+        )
+        fsm.act("WRITE_RESPONSE",
+            axi.b.valid.eq(1),
+            If(axi.b.ready,
+                NextState("IDLE")
+            )
+        )
+
+
+class Wishbone2AXI(Module):
+    """Wishbone2AXI
+
+    This module bridges a Wishbone master to an AXI4 slave of the same data
+    width. Each Wishbone access becomes a single-beat AXI transaction; the
+    address and data of writes are presented simultaneously.
+    """
+    def __init__(self, wishbone, axi):
+        dw = len(wishbone.dat_w)
+        assert axi.data_width == dw
+        offset_bits = log2_int(dw//8)
+
+        # # #
+
+        aw_done = Signal()
+        w_done = Signal()
+
+        self.comb += [
+            axi.aw.addr.eq(wishbone.adr << offset_bits),
+            axi.aw.len.eq(0),
+            axi.aw.size.eq(offset_bits),
+            axi.aw.burst.eq(BURST_INCR),
+            axi.ar.addr.eq(wishbone.adr << offset_bits),
+            axi.ar.len.eq(0),
+            axi.ar.size.eq(offset_bits),
+            axi.ar.burst.eq(BURST_INCR),
+            axi.w.data.eq(wishbone.dat_w),
+            axi.w.strb.eq(wishbone.sel),
+            axi.w.last.eq(1),
+            wishbone.dat_r.eq(axi.r.data)
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            NextValue(aw_done, 0),
+            NextValue(w_done, 0),
+            If(wishbone.cyc & wishbone.stb,
+                If(wishbone.we,
+                    NextState("WRITE")
+                ).Else(
+                    NextState("READ")
+                )
+            )
+        )
+        fsm.act("WRITE",
+            axi.aw.valid.eq(~aw_done),
+            If(axi.aw.valid & axi.aw.ready,
+                NextValue(aw_done, 1)
+            ),
+            axi.w.valid.eq(~w_done),
+            If(axi.w.valid & axi.w.ready,
+                NextValue(w_done, 1)
+            ),
+            axi.b.ready.eq(aw_done & w_done),
+            If(axi.b.valid & axi.b.ready,
+                wishbone.ack.eq(1),
+                wishbone.err.eq(axi.b.resp != RESP_OKAY),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("READ",
+            axi.ar.valid.eq(1),
+            If(axi.ar.ready,
+                NextState("READ_DATA")
+            )
+        )
+        fsm.act("READ_DATA",
+            axi.r.ready.eq(1),
+            If(axi.r.valid,
+                wishbone.ack.eq(1),
+                wishbone.err.eq(axi.r.resp != RESP_OKAY),
+                NextState("IDLE")
+            )
+        )
+
+
+class AXILite2CSR(Module):
+    """AXILite2CSR
+
+    This module gives an AXI4-Lite master access to the CSR bus, one CSR
+    bus word per 32-bit AXI word, like ``wishbone2csr.WB2CSR``.
+    """
+    def __init__(self, axi_lite, csr):
+        offset_bits = log2_int(axi_lite.data_width//8)
+
+        # # #
+
+        self.comb += [
+            axi_lite.b.resp.eq(RESP_OKAY),
+            axi_lite.r.resp.eq(RESP_OKAY)
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(axi_lite.ar.valid,
+                axi_lite.ar.ready.eq(1),
+                NextValue(csr.adr, axi_lite.ar.addr[offset_bits:]),
+                NextState("READ")
+            ).Elif(axi_lite.aw.valid & axi_lite.w.valid,
+                axi_lite.aw.ready.eq(1),
+                axi_lite.w.ready.eq(1),
+                NextValue(csr.adr, axi_lite.aw.addr[offset_bits:]),
+                NextValue(csr.dat_w, axi_lite.w.data),
+                NextValue(csr.we, 1),
+                NextState("WRITE_RESPONSE")
+            )
+        )
+        fsm.act("READ",
+            NextState("READ_DATA")
+        )
+        fsm.act("READ_DATA",
+            NextValue(axi_lite.r.data, csr.dat_r),
+            NextState("READ_RESPONSE")
+        )
+        fsm.act("READ_RESPONSE",
+            axi_lite.r.valid.eq(1),
+            If(axi_lite.r.ready,
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WRITE_RESPONSE",
+            NextValue(csr.we, 0),
+            axi_lite.b.valid.eq(1),
+            If(axi_lite.b.ready,
+                NextState("IDLE")
+            )
+        )
+
+
+class AXIStream2Endpoint(Module):
+    """AXIStream2Endpoint
+
+    This module converts an AXI4-Stream into a stream endpoint with a
+    ``data`` field. ``tlast`` is mapped to ``eop``.
+    """
+    def __init__(self, data_width=32):
+        self.sink = sink = StreamInterface(data_width)
+        self.source = source = stream.Endpoint([("data", data_width)])
+
+        # # #
+
+        self.comb += [
+            source.stb.eq(sink.valid),
+            source.eop.eq(sink.last),
+            source.data.eq(sink.data),
+            sink.ready.eq(source.ack)
+        ]
+
+
+class Endpoint2AXIStream(Module):
+    """Endpoint2AXIStream
+
+    This module converts a stream endpoint with a ``data`` field into an
+    AXI4-Stream. ``eop`` is mapped to ``tlast``.
+    """
+    def __init__(self, data_width=32):
+        self.sink = sink = stream.Endpoint([("data", data_width)])
+        self.source = source = StreamInterface(data_width)
+
+        # # #
+
+        self.comb += [
+            source.valid.eq(sink.stb),
+            source.last.eq(sink.eop),
+            source.data.eq(sink.data),
+            sink.ack.eq(source.ready)
+        ]
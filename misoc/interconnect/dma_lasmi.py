@@ -1,11 +1,17 @@
+from functools import reduce
+from operator import or_
+
 from migen import *
 from migen.genlib.fifo import SyncFIFO
 
 from misoc.interconnect import stream
+from misoc.interconnect.csr import *
 
 
 class Reader(Module):
-    def __init__(self, lasmim, fifo_depth=None):
+    # urgent_level: when set, lasmim is an urgent crossbar port, asserted
+    # while less than urgent_level words are buffered or requested
+    def __init__(self, lasmim, fifo_depth=None, urgent_level=None):
         self.address = stream.Endpoint([("a", lasmim.aw)])
         self.data = stream.Endpoint([("d", lasmim.dw)])
         self.busy = Signal()
@@ -14,6 +20,7 @@ class Reader(Module):
 
         if fifo_depth is None:
             fifo_depth = lasmim.req_queue_size + lasmim.read_latency + 2
+        self.fifo_depth = fifo_depth
 
         # request issuance
         request_enable = Signal()
@@ -43,6 +50,8 @@ class Reader(Module):
             self.busy.eq(rsv_level != 0),
             request_enable.eq(rsv_level != fifo_depth)
         ]
+        if urgent_level is not None:
+            self.comb += lasmim.urgent.eq(rsv_level < urgent_level)
 
         # FIFO
         fifo = SyncFIFO(lasmim.dw, fifo_depth)
@@ -89,3 +98,126 @@ class Writer(Module):
             ),
             self.busy.eq(fifo.readable)
         ]
+
+
+class _TransferCounters(Module, AutoCSR):
+    # Counts the cycles a DMA engine is active and the words it transfers,
+    # software computes the achieved throughput as words*dw/8/cycles bytes
+    # per cycle. Both counts stop when cycles saturates, so that the ratio
+    # stays valid. Writing reset clears them.
+    def __init__(self, active, transfer, width):
+        self._reset = CSR()
+        self._cycles = CSRStatus(width)
+        self._words = CSRStatus(width)
+
+        ###
+
+        cycles = self._cycles.status
+        words = self._words.status
+        counting = Signal()
+        self.comb += counting.eq(cycles != 2**width - 1)
+        self.sync += \
+            If(self._reset.re,
+                cycles.eq(0),
+                words.eq(0)
+            ).Elif(counting,
+                If(active, cycles.eq(cycles + 1)),
+                If(transfer, words.eq(words + 1))
+            )
+
+
+class MultiReader(Module, AutoCSR):
+    # Reads through several LASMI masters ("lanes") to keep several banks
+    # busy: a single master cannot have requests pending in two banks.
+    # Each request goes to the lane selected by the address bits starting
+    # at lane_shift (typically the bank bits, i.e. the cba_shift of the
+    # crossbar), and data is returned in request order.
+    # with_counters adds CSRs counting the active cycles and the words read.
+    def __init__(self, lasmims, lane_shift, fifo_depth=None,
+                 with_counters=False, counter_width=32):
+        nlanes = len(lasmims)
+        lane_bits = log2_int(nlanes)
+        aw = lasmims[0].aw
+        dw = lasmims[0].dw
+        self.address = stream.Endpoint([("a", aw)])
+        self.data = stream.Endpoint([("d", dw)])
+        self.busy = Signal()
+
+        ###
+
+        lanes = [Reader(lasmim, fifo_depth) for lasmim in lasmims]
+        self.submodules += lanes
+
+        # lanes of the requests in flight, in request order
+        order = SyncFIFO(max(lane_bits, 1), sum(lane.fifo_depth for lane in lanes))
+        self.submodules += order
+
+        lane_sel = Signal(max(lane_bits, 1))
+        if lane_bits:
+            self.comb += lane_sel.eq(self.address.a[lane_shift:lane_shift+lane_bits])
+        for n, lane in enumerate(lanes):
+            self.comb += [
+                lane.address.stb.eq(self.address.stb & order.writable & (lane_sel == n)),
+                lane.address.a.eq(self.address.a)
+            ]
+        self.comb += [
+            self.address.ack.eq(Array(lane.address.ack for lane in lanes)[lane_sel] &
+                                order.writable),
+            order.din.eq(lane_sel),
+            order.we.eq(self.address.stb & self.address.ack)
+        ]
+
+        # reorder
+        data_lane = order.dout
+        for n, lane in enumerate(lanes):
+            self.comb += lane.data.ack.eq(order.readable & (data_lane == n) &
+                                          self.data.ack)
+        self.comb += [
+            self.data.stb.eq(order.readable &
+                             Array(lane.data.stb for lane in lanes)[data_lane]),
+            self.data.d.eq(Array(lane.data.d for lane in lanes)[data_lane]),
+            order.re.eq(self.data.stb & self.data.ack),
+            self.busy.eq(order.readable)
+        ]
+
+        if with_counters:
+            self.submodules.counters = _TransferCounters(
+                self.address.stb | self.busy,
+                self.data.stb & self.data.ack,
+                counter_width)
+
+
+class MultiWriter(Module, AutoCSR):
+    # Writes through several LASMI masters, see MultiReader.
+    def __init__(self, lasmims, lane_shift, fifo_depth=None,
+                 with_counters=False, counter_width=32):
+        nlanes = len(lasmims)
+        lane_bits = log2_int(nlanes)
+        aw = lasmims[0].aw
+        dw = lasmims[0].dw
+        self.address_data = stream.Endpoint([("a", aw), ("d", dw)])
+        self.busy = Signal()
+
+        ###
+
+        lanes = [Writer(lasmim, fifo_depth) for lasmim in lasmims]
+        self.submodules += lanes
+
+        lane_sel = Signal(max(lane_bits, 1))
+        if lane_bits:
+            self.comb += lane_sel.eq(self.address_data.a[lane_shift:lane_shift+lane_bits])
+        for n, lane in enumerate(lanes):
+            self.comb += [
+                lane.address_data.stb.eq(self.address_data.stb & (lane_sel == n)),
+                lane.address_data.payload.eq(self.address_data.payload)
+            ]
+        self.comb += [
+            self.address_data.ack.eq(Array(lane.address_data.ack for lane in lanes)[lane_sel]),
+            self.busy.eq(reduce(or_, [lane.busy for lane in lanes]))
+        ]
+
+        if with_counters:
+            self.submodules.counters = _TransferCounters(
+                self.address_data.stb | self.busy,
+                self.address_data.stb & self.address_data.ack,
+                counter_width)
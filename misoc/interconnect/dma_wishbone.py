@@ -0,0 +1,54 @@
+from migen import *
+from migen.genlib.fifo import SyncFIFO
+
+from misoc.interconnect import stream
+
+
+class Reader(Module):
+    def __init__(self, bus, fifo_depth=4):
+        self.address = stream.Endpoint([("a", len(bus.adr))])
+        self.data = stream.Endpoint([("d", len(bus.dat_r))])
+        self.busy = Signal()
+
+        ###
+
+        fifo = SyncFIFO(len(bus.dat_r), fifo_depth)
+        self.submodules += fifo
+
+        self.comb += [
+            bus.cyc.eq(self.address.stb & fifo.writable),
+            bus.stb.eq(self.address.stb & fifo.writable),
+            bus.we.eq(0),
+            bus.sel.eq(2**len(bus.sel)-1),
+            bus.adr.eq(self.address.a),
+            self.address.ack.eq(bus.ack),
+
+            fifo.din.eq(bus.dat_r),
+            fifo.we.eq(bus.cyc & bus.stb & bus.ack),
+
+            self.data.stb.eq(fifo.readable),
+            fifo.re.eq(self.data.ack),
+            self.data.d.eq(fifo.dout),
+
+            self.busy.eq(bus.cyc | fifo.readable)
+        ]
+
+
+class Writer(Module):
+    def __init__(self, bus):
+        self.address_data = stream.Endpoint([("a", len(bus.adr)), ("d", len(bus.dat_w))])
+        self.busy = Signal()
+
+        ###
+
+        self.comb += [
+            bus.cyc.eq(self.address_data.stb),
+            bus.stb.eq(self.address_data.stb),
+            bus.we.eq(1),
+            bus.sel.eq(2**len(bus.sel)-1),
+            bus.adr.eq(self.address_data.a),
+            bus.dat_w.eq(self.address_data.d),
+            self.address_data.ack.eq(bus.ack),
+
+            self.busy.eq(bus.cyc)
+        ]
@@ -7,13 +7,22 @@ from migen.genlib.record import *
 
 
 class Interface(Record):
-    def __init__(self, aw, dw, nbanks, req_queue_size, read_latency, write_latency):
+    # tagbits: controller banks that reorder requests (tagbits > 0) receive
+    # the crossbar master number with each request (tag), give the tag of
+    # the request being acknowledged (ack_tag), and have one lock bit per
+    # master.
+    # address_mapping: how the crossbar extracts the bank from master
+    # addresses, see ControllerSettings.
+    def __init__(self, aw, dw, nbanks, req_queue_size, read_latency, write_latency,
+                 tagbits=0, address_mapping="rbc"):
         self.aw = aw
         self.dw = dw
         self.nbanks = nbanks
         self.req_queue_size = req_queue_size
         self.read_latency = read_latency
         self.write_latency = write_latency
+        self.tagbits = tagbits
+        self.address_mapping = address_mapping
 
         bank_layout = [
             ("adr",      aw, DIR_M_TO_S),
@@ -22,8 +31,13 @@ class Interface(Record):
             ("req_ack",   1, DIR_S_TO_M),
             ("dat_w_ack", 1, DIR_S_TO_M),
             ("dat_r_ack", 1, DIR_S_TO_M),
-            ("lock",      1, DIR_S_TO_M)
+            ("lock", 2**tagbits, DIR_S_TO_M)
         ]
+        if tagbits:
+            bank_layout += [
+                ("tag",     tagbits, DIR_M_TO_S),
+                ("ack_tag", tagbits, DIR_S_TO_M)
+            ]
         if nbanks > 1:
             layout = [("bank"+str(i), bank_layout) for i in range(nbanks)]
         else:
@@ -46,7 +60,12 @@ def _getattr_all(l, attr):
 
 
 class LASMIxbar(Module):
-    def __init__(self, controllers, cba_shift):
+    # With several controllers, consecutive blocks of 2**interleave_shift
+    # words go to consecutive controllers. By default, the controller
+    # number is above the bank number.
+    # A master is served by one bank of one controller at a time, so that
+    # its data is returned in order.
+    def __init__(self, controllers, cba_shift, interleave_shift=None):
         self._controllers = controllers
         self._cba_shift = cba_shift
 
@@ -56,57 +75,170 @@ class LASMIxbar(Module):
         self._req_queue_size = _getattr_all(controllers, "req_queue_size")
         self._read_latency = _getattr_all(controllers, "read_latency")
         self._write_latency = _getattr_all(controllers, "write_latency")
+        self._tagbits = _getattr_all(controllers, "tagbits")
+        self._address_mapping = _getattr_all(controllers, "address_mapping")
 
         self._bank_bits = log2_int(self._nbanks, False)
         self._controller_bits = log2_int(len(self._controllers), False)
+        if interleave_shift is None:
+            interleave_shift = cba_shift + self._bank_bits
+        self._interleave_shift = interleave_shift
 
         self._masters = []
+        self._qos = []
+
+    def get_master(self, priority=0, urgent=False, max_wait=256, rate=None, rate_burst=8):
+        """Creates a master port.
 
-    def get_master(self):
+        Banks serve the requesting masters of the highest ``priority`` first.
+        With ``urgent``, the port has an ``urgent`` input that gives it
+        precedence over all priorities while asserted, e.g. driven from the
+        FIFO level of a video DMA (see ``dma_lasmi.Reader``).
+        When priorities are in use, a master that has been waiting for
+        ``max_wait`` cycles is escalated like an urgent one for a bank queue
+        of requests, so that lower priority masters are not starved.
+        ``rate`` is an optional (requests, cycles) tuple: the port then issues
+        at most ``requests`` requests every ``cycles`` cycles on average, and
+        at most ``rate_burst`` requests back-to-back.
+        """
         if self.finalized:
             raise FinalizeError
         lasmi_master = Interface(self._rca_bits + self._bank_bits + self._controller_bits,
             self._dw, 1, self._req_queue_size, self._read_latency, self._write_latency)
+        if urgent:
+            lasmi_master.urgent = Signal()
         self._masters.append(lasmi_master)
+        self._qos.append((priority, max_wait, rate, rate_burst))
         return lasmi_master
 
+    def _rate_limit(self, master, rate, rate_burst):
+        # token bucket, a request costs cycles and requests are earned per cycle
+        requests, cycles = rate
+        credit_max = rate_burst*cycles
+        credit = Signal(min=-cycles, max=credit_max + requests + 1, reset=credit_max)
+        credit_next = Signal.like(credit)
+        self.comb += credit_next.eq(credit + requests -
+                                    Mux(master.stb & master.req_ack, cycles, 0))
+        self.sync += If(credit_next > credit_max,
+                credit.eq(credit_max)
+            ).Else(
+                credit.eq(credit_next)
+            )
+        return credit >= 0
+
+    def _effective_priorities(self, m_allowed):
+        # urgent and starving masters are above all priority levels
+        urgent_priority = max(qos[0] for qos in self._qos) + 1
+        priorities = []
+        for master, allowed, (priority, max_wait, rate, rate_burst) \
+                in zip(self._masters, m_allowed, self._qos):
+            # a master escalated after waiting is served for a bank queue of
+            # requests before returning to its priority
+            wait = Signal(max=max_wait)
+            turn = Signal(max=self._req_queue_size+1)
+            escalated = turn != 0
+            self.sync += If(escalated,
+                    wait.eq(0),
+                    If(~master.stb,
+                        turn.eq(0)
+                    ).Elif(master.req_ack,
+                        turn.eq(turn - 1)
+                    )
+                ).Elif(master.stb & allowed & ~master.req_ack,
+                    If(wait == max_wait - 1,
+                        turn.eq(self._req_queue_size)
+                    ).Else(
+                        wait.eq(wait + 1)
+                    )
+                ).Else(
+                    wait.eq(0)
+                )
+            if hasattr(master, "urgent"):
+                escalated = escalated | master.urgent
+            priorities.append(Mux(escalated, urgent_priority, priority))
+        return priorities
+
     def do_finalize(self):
         nmasters = len(self._masters)
+        if self._tagbits and nmasters > 2**self._tagbits:
+            raise ValueError("Controllers support at most {} masters".format(2**self._tagbits))
 
         m_ca, m_ba, m_rca = self._split_master_addresses(self._controller_bits,
             self._bank_bits, self._rca_bits, self._cba_shift)
 
+        # QoS
+        m_allowed = [1 if rate is None else self._rate_limit(master, rate, rate_burst)
+            for master, (priority, max_wait, rate, rate_burst) in zip(self._masters, self._qos)]
+        with_priorities = (len(set(qos[0] for qos in self._qos)) > 1
+                           or any(hasattr(master, "urgent") for master in self._masters))
+        if with_priorities:
+            m_priority = self._effective_priorities(m_allowed)
+
+        rrs = [[roundrobin.RoundRobin(nmasters, roundrobin.SP_CE) for n in range(self._nbanks)]
+            for controller in self._controllers]
+        self.submodules += sum(rrs, [])
+        banks = [[getattr(controller, "bank"+str(nb)) for nb in range(self._nbanks)]
+            for controller in self._controllers]
+
+        # for each master and bank, whether the bank holds requests of the master
+        def holds(nc, nb, nm):
+            bank = banks[nc][nb]
+            if self._tagbits:
+                return bank.lock[nm]
+            else:
+                return bank.lock & (rrs[nc][nb].grant == nm)
+
+        # per master: acks from all controllers, and undelayed data acks from
+        # each controller
+        master_req_acks = [0]*nmasters
+        master_dat_w_acks = [0]*nmasters
+        master_dat_r_acks = [0]*nmasters
+        controller_dat_w_acks = []
+        controller_dat_r_acks = []
+
         for nc, controller in enumerate(self._controllers):
             if self._controller_bits:
                 controller_selected = [ca == nc for ca in m_ca]
             else:
                 controller_selected = [1]*nmasters
-            master_req_acks = [0]*nmasters
-            master_dat_w_acks = [0]*nmasters
-            master_dat_r_acks = [0]*nmasters
+            dat_w_acks = [0]*nmasters
+            dat_r_acks = [0]*nmasters
 
-            rrs = [roundrobin.RoundRobin(nmasters, roundrobin.SP_CE) for n in range(self._nbanks)]
-            self.submodules += rrs
-            for nb, rr in enumerate(rrs):
-                bank = getattr(controller, "bank"+str(nb))
+            for nb, rr in enumerate(rrs[nc]):
+                bank = banks[nc][nb]
 
                 # for each master, determine if another bank locks it
                 master_locked = []
                 for nm, master in enumerate(self._masters):
                     locked = 0
-                    for other_nb, other_rr in enumerate(rrs):
-                        if other_nb != nb:
-                            other_bank = getattr(controller, "bank"+str(other_nb))
-                            locked = locked | (other_bank.lock & (other_rr.grant == nm))
+                    for other_nc in range(len(self._controllers)):
+                        for other_nb in range(self._nbanks):
+                            if (other_nc, other_nb) != (nc, nb):
+                                locked = locked | holds(other_nc, other_nb, nm)
                     master_locked.append(locked)
 
                 # arbitrate
-                bank_selected = [cs & (ba == nb) & ~locked for cs, ba, locked in zip(controller_selected, m_ba, master_locked)]
+                bank_selected = [cs & (ba == nb) & ~locked & allowed
+                    for cs, ba, locked, allowed in zip(controller_selected, m_ba, master_locked, m_allowed)]
+                if with_priorities:
+                    # requests of lower priority masters are held back, which
+                    # also lets a bank locked by such a master drain
+                    candidates = [bs & master.stb for bs, master in zip(bank_selected, self._masters)]
+                    bank_selected = [bs & ~reduce(or_, [c & (p > priority)
+                            for c, p in zip(candidates, m_priority)])
+                        for bs, priority in zip(bank_selected, m_priority)]
                 bank_requested = [bs & master.stb for bs, master in zip(bank_selected, self._masters)]
-                self.comb += [
-                    rr.request.eq(Cat(*bank_requested)),
-                    rr.ce.eq(~bank.stb & ~bank.lock)
-                ]
+                self.comb += rr.request.eq(Cat(*bank_requested))
+                if self._tagbits:
+                    # requests from several masters can be pending in the bank
+                    self.comb += [
+                        rr.ce.eq(~bank.stb),
+                        bank.tag.eq(rr.grant)
+                    ]
+                    ack_master = bank.ack_tag
+                else:
+                    self.comb += rr.ce.eq(~bank.stb & ~bank.lock)
+                    ack_master = rr.grant
 
                 # route requests
                 self.comb += [
@@ -116,40 +248,40 @@ class LASMIxbar(Module):
                 ]
                 master_req_acks = [master_req_ack | ((rr.grant == nm) & bank_selected[nm] & bank.req_ack)
                     for nm, master_req_ack in enumerate(master_req_acks)]
-                master_dat_w_acks = [master_dat_w_ack | ((rr.grant == nm) & bank.dat_w_ack)
-                    for nm, master_dat_w_ack in enumerate(master_dat_w_acks)]
-                master_dat_r_acks = [master_dat_r_ack | ((rr.grant == nm) & bank.dat_r_ack)
-                    for nm, master_dat_r_ack in enumerate(master_dat_r_acks)]
-
-            for nm, master_dat_w_ack in enumerate(master_dat_w_acks):
-                    for i in range(self._write_latency):
-                        new_master_dat_w_ack = Signal()
-                        self.sync += new_master_dat_w_ack.eq(master_dat_w_ack)
-                        master_dat_w_ack = new_master_dat_w_ack
-                    master_dat_w_acks[nm] = master_dat_w_ack
-
-            for nm, master_dat_r_ack in enumerate(master_dat_r_acks):
-                    for i in range(self._read_latency):
-                        new_master_dat_r_ack = Signal()
-                        self.sync += new_master_dat_r_ack.eq(master_dat_r_ack)
-                        master_dat_r_ack = new_master_dat_r_ack
-                    master_dat_r_acks[nm] = master_dat_r_ack
-
-            self.comb += [master.req_ack.eq(master_req_ack) for master, master_req_ack in zip(self._masters, master_req_acks)]
-            self.comb += [master.dat_w_ack.eq(master_dat_w_ack) for master, master_dat_w_ack in zip(self._masters, master_dat_w_acks)]
-            self.comb += [master.dat_r_ack.eq(master_dat_r_ack) for master, master_dat_r_ack in zip(self._masters, master_dat_r_acks)]
-
-            # route data writes
-            controller_selected_wl = controller_selected
-            for i in range(self._write_latency):
-                n_controller_selected_wl = [Signal() for i in range(nmasters)]
-                self.sync += [n.eq(o) for n, o in zip(n_controller_selected_wl, controller_selected_wl)]
-                controller_selected_wl = n_controller_selected_wl
+                dat_w_acks = [dat_w_ack | ((ack_master == nm) & bank.dat_w_ack)
+                    for nm, dat_w_ack in enumerate(dat_w_acks)]
+                dat_r_acks = [dat_r_ack | ((ack_master == nm) & bank.dat_r_ack)
+                    for nm, dat_r_ack in enumerate(dat_r_acks)]
+
+            master_dat_w_acks = [a | b for a, b in zip(master_dat_w_acks, dat_w_acks)]
+            master_dat_r_acks = [a | b for a, b in zip(master_dat_r_acks, dat_r_acks)]
+            controller_dat_w_acks.append(dat_w_acks)
+            controller_dat_r_acks.append(dat_r_acks)
+
+        def delay(signal, n):
+            for i in range(n):
+                new_signal = Signal(len(signal))
+                self.sync += new_signal.eq(signal)
+                signal = new_signal
+            return signal
+
+        master_dat_w_acks = [delay(ack, self._write_latency) for ack in master_dat_w_acks]
+        master_dat_r_acks = [delay(ack, self._read_latency) for ack in master_dat_r_acks]
+        self.comb += [master.req_ack.eq(master_req_ack) for master, master_req_ack in zip(self._masters, master_req_acks)]
+        self.comb += [master.dat_w_ack.eq(master_dat_w_ack) for master, master_dat_w_ack in zip(self._masters, master_dat_w_acks)]
+        self.comb += [master.dat_r_ack.eq(master_dat_r_ack) for master, master_dat_r_ack in zip(self._masters, master_dat_r_acks)]
+
+        # route data writes
+        for nc, controller in enumerate(self._controllers):
             dat_w_maskselect = []
             dat_we_maskselect = []
-            for master, selected in zip(self._masters, controller_selected_wl):
+            for nm, master in enumerate(self._masters):
                 o_dat_w = Signal(self._dw)
                 o_dat_we = Signal(self._dw//8)
+                if self._controller_bits:
+                    selected = delay(controller_dat_w_acks[nc][nm], self._write_latency)
+                else:
+                    selected = 1
                 self.comb += If(selected,
                         o_dat_w.eq(master.dat_w),
                         o_dat_we.eq(master.dat_we)
@@ -163,17 +295,12 @@ class LASMIxbar(Module):
 
         # route data reads
         if self._controller_bits:
-            for master in self._masters:
+            for nm, master in enumerate(self._masters):
                 controller_sel = Signal(self._controller_bits)
-                for nc, controller in enumerate(self._controllers):
-                    for nb in range(nbanks):
-                        bank = getattr(controller, "bank"+str(nb))
-                        self.comb += If(bank.stb & bank.ack, controller_sel.eq(nc))
-                for i in range(self._read_latency):
-                    n_controller_sel = Signal(self._controller_bits)
-                    self.sync += n_controller_sel.eq(controller_sel)
-                    controller_sel = n_controller_sel
-                self.comb += master.dat_r.eq(Array(self._controllers)[controller_sel].dat_r)
+                for nc in range(len(self._controllers)):
+                    self.comb += If(controller_dat_r_acks[nc][nm], controller_sel.eq(nc))
+                controller_sel = delay(controller_sel, self._read_latency)
+                self.comb += master.dat_r.eq(Array(c.dat_r for c in self._controllers)[controller_sel])
         else:
             self.comb += [master.dat_r.eq(self._controllers[0].dat_r) for master in self._masters]
 
@@ -182,25 +309,43 @@ class LASMIxbar(Module):
         m_ba = []    # bank address
         m_rca = []    # row and column address
         for master in self._masters:
-            cba = Signal(self._controller_bits + self._bank_bits)
-            rca = Signal(self._rca_bits)
-            cba_upper = cba_shift + controller_bits + bank_bits
-            self.comb += cba.eq(master.adr[cba_shift:cba_upper])
-            if cba_shift < self._rca_bits:
-                if cba_shift:
-                    self.comb += rca.eq(Cat(master.adr[:cba_shift], master.adr[cba_upper:]))
+            # remove the controller address
+            if controller_bits:
+                ca = Signal(controller_bits)
+                adr = Signal(len(master.adr) - controller_bits)
+                ca_shift = self._interleave_shift
+                ca_upper = ca_shift + controller_bits
+                self.comb += ca.eq(master.adr[ca_shift:ca_upper])
+                if ca_shift:
+                    self.comb += adr.eq(Cat(master.adr[:ca_shift], master.adr[ca_upper:]))
                 else:
-                    self.comb += rca.eq(master.adr[cba_upper:])
+                    self.comb += adr.eq(master.adr[ca_upper:])
             else:
-                self.comb += rca.eq(master.adr[:cba_shift])
+                ca = None
+                adr = master.adr
 
-            if self._controller_bits:
-                ca = Signal(self._controller_bits)
-                ba = Signal(self._bank_bits)
-                self.comb += Cat(ba, ca).eq(cba)
+            ba = Signal(self._bank_bits)
+            rca = Signal(self._rca_bits)
+            if self._address_mapping == "brc":
+                self.comb += [
+                    ba.eq(adr[rca_bits:rca_bits+bank_bits]),
+                    rca.eq(adr[:rca_bits])
+                ]
             else:
-                ca = None
-                ba = cba
+                ba_upper = cba_shift + bank_bits
+                bank = adr[cba_shift:ba_upper]
+                if self._address_mapping == "bank_xor":
+                    # XOR with the low row bits
+                    row = adr[ba_upper:]
+                    bank = bank ^ row[:min(bank_bits, len(row))]
+                self.comb += ba.eq(bank)
+                if cba_shift < self._rca_bits:
+                    if cba_shift:
+                        self.comb += rca.eq(Cat(adr[:cba_shift], adr[ba_upper:]))
+                    else:
+                        self.comb += rca.eq(adr[ba_upper:])
+                else:
+                    self.comb += rca.eq(adr[:cba_shift])
 
             m_ca.append(ca)
             m_ba.append(ba)
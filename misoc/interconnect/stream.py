@@ -1,6 +1,10 @@
+from collections import OrderedDict
+
 from migen import *
 from migen.genlib.record import *
 from migen.genlib import fifo
+from migen.genlib.cdc import MultiReg, GrayCounter, GrayDecoder
+from migen.genlib.roundrobin import RoundRobin, SP_CE
 
 
 def _make_m2s(layout):
@@ -79,17 +83,311 @@ class _FIFOWrapper(Module):
         ]
 
 
+def _add_thresholds(module, depth, almost_full, almost_empty, level_w, level_r):
+    # Thresholds are signals reset to the given values, so that they can be
+    # left constant or driven (e.g. by a CSR).
+    if almost_full is not None:
+        module.almost_full_threshold = Signal(max=depth+2, reset=almost_full)
+        module.almost_full = Signal()
+        module.comb += module.almost_full.eq(level_w >= module.almost_full_threshold)
+    if almost_empty is not None:
+        module.almost_empty_threshold = Signal(max=depth+2, reset=almost_empty)
+        module.almost_empty = Signal()
+        module.comb += module.almost_empty.eq(level_r <= module.almost_empty_threshold)
+
+
 class SyncFIFO(_FIFOWrapper):
-    def __init__(self, layout, depth, buffered=False):
+    # buffered: registered output (one more cycle of latency, one more entry).
+    # almost_full is asserted when level >= almost_full, almost_empty when
+    # level <= almost_empty.
+    def __init__(self, layout, depth, buffered=False,
+                 almost_full=None, almost_empty=None):
         _FIFOWrapper.__init__(
             self,
             fifo.SyncFIFOBuffered if buffered else fifo.SyncFIFO,
             layout, depth)
+        self.level = self.fifo.level
+        _add_thresholds(self, depth, almost_full, almost_empty,
+                        self.level, self.level)
 
 
 class AsyncFIFO(_FIFOWrapper):
+    # With with_levels, or the corresponding threshold, the FIFO has
+    # level_write, the level seen from the "write" domain, that may be
+    # higher than the actual level, and level_read, the level seen from the
+    # "read" domain, that may be lower. almost_full (computed from
+    # level_write) and almost_empty (from level_read) are therefore
+    # conservative, e.g. a burst of almost_empty + 1 beats can always be
+    # read once almost_empty is deasserted.
+    def __init__(self, layout, depth, buffered=False, with_levels=False,
+                 almost_full=None, almost_empty=None):
+        _FIFOWrapper.__init__(
+            self,
+            fifo.AsyncFIFOBuffered if buffered else fifo.AsyncFIFO,
+            layout, depth)
+        with_level_write = with_levels or almost_full is not None
+        with_level_read = with_levels or almost_empty is not None
+        if with_level_write:
+            self.level_write = Signal(max=depth+2)
+        if with_level_read:
+            self.level_read = Signal(max=depth+2)
+
+        # # #
+
+        if not with_level_write and not with_level_read:
+            return
+
+        inner = self.fifo.fifo if buffered else self.fifo
+        depth_bits = log2_int(depth, True)
+        produce = ClockDomainsRenamer("write")(GrayCounter(depth_bits+1))
+        consume = ClockDomainsRenamer("read")(GrayCounter(depth_bits+1))
+        self.submodules += produce, consume
+        self.comb += [
+            produce.ce.eq(inner.writable & inner.we),
+            consume.ce.eq(inner.readable & inner.re)
+        ]
+
+        if with_level_write:
+            consume_wdomain = Signal(depth_bits+1)
+            self.specials += MultiReg(consume.q, consume_wdomain, "write")
+            consume_decoder = ClockDomainsRenamer("write")(GrayDecoder(depth_bits+1))
+            self.submodules += consume_decoder
+            level_write = Signal(depth_bits+1)
+            self.comb += [
+                consume_decoder.i.eq(consume_wdomain),
+                level_write.eq(produce.q_binary - consume_decoder.o),
+                self.level_write.eq(level_write)
+            ]
+        if with_level_read:
+            produce_rdomain = Signal(depth_bits+1)
+            self.specials += MultiReg(produce.q, produce_rdomain, "read")
+            produce_decoder = ClockDomainsRenamer("read")(GrayDecoder(depth_bits+1))
+            self.submodules += produce_decoder
+            level_read = Signal(depth_bits+1)
+            self.comb += [
+                produce_decoder.i.eq(produce_rdomain),
+                level_read.eq(produce_decoder.o - consume.q_binary)
+            ]
+            if buffered:
+                self.comb += self.level_read.eq(level_read + self.fifo.readable)
+            else:
+                self.comb += self.level_read.eq(level_read)
+        _add_thresholds(self, depth, almost_full, almost_empty,
+                        getattr(self, "level_write", None),
+                        getattr(self, "level_read", None))
+
+
+class SyncPacketFIFO(Module):
+    # Store-and-forward FIFO: a packet is presented on the source only after
+    # its eop beat has been written. The packet being written is discarded
+    # if drop is asserted on any of its beats, or if it does not fit.
     def __init__(self, layout, depth):
-        _FIFOWrapper.__init__(self, fifo.AsyncFIFO, layout, depth)
+        self.sink = sink = Endpoint(layout)
+        self.source = source = Endpoint(layout)
+        self.drop = Signal()
+
+        self.packets = Signal(max=depth+1)  # complete packets stored
+        self.level = Signal(max=depth+1)    # words stored (incl. partial packet)
+        self.dropped = Signal(16)           # number of discarded packets
+
+        # # #
+
+        description = sink.description
+        fifo_layout = [("payload", description.payload_layout), ("eop", 1)]
+        fifo_in = Record(fifo_layout)
+        fifo_out = Record(fifo_layout)
+
+        storage = Memory(layout_len(fifo_layout), depth)
+        wrport = storage.get_port(write_capable=True)
+        rdport = storage.get_port(async_read=True)
+        self.specials += storage, wrport, rdport
+
+        def inc(pointer):
+            return Mux(pointer == depth - 1, 0, pointer + 1)
+
+        produce = Signal(max=depth)
+        commit = Signal(max=depth)
+        consume = Signal(max=depth)
+        uncommitted = Signal(max=depth+1)
+        committed_level = Signal(max=depth+1)
+        dropping = Signal()
+
+        # write
+        do_write = Signal()
+        do_commit = Signal()
+        do_discard = Signal()
+        discard = Signal()
+        self.comb += [
+            sink.ack.eq(1),
+            discard.eq(dropping | self.drop | (self.level == depth)),
+            do_write.eq(sink.stb & ~discard),
+            do_commit.eq(do_write & sink.eop),
+            do_discard.eq(sink.stb & sink.eop & discard),
+
+            fifo_in.payload.eq(sink.payload),
+            fifo_in.eop.eq(sink.eop),
+            wrport.adr.eq(produce),
+            wrport.dat_w.eq(fifo_in.raw_bits()),
+            wrport.we.eq(do_write)
+        ]
+        self.sync += [
+            If(do_commit,
+                produce.eq(inc(produce)),
+                commit.eq(inc(produce)),
+                uncommitted.eq(0)
+            ).Elif(do_discard,
+                produce.eq(commit),
+                uncommitted.eq(0)
+            ).Elif(do_write,
+                produce.eq(inc(produce)),
+                uncommitted.eq(uncommitted + 1)
+            ),
+            If(sink.stb,
+                If(sink.eop,
+                    dropping.eq(0)
+                ).Elif(discard,
+                    dropping.eq(1)
+                )
+            ),
+            If(do_discard,
+                self.dropped.eq(self.dropped + 1)
+            )
+        ]
+
+        # read
+        do_read = Signal()
+        self.comb += [
+            rdport.adr.eq(consume),
+            fifo_out.raw_bits().eq(rdport.dat_r),
+            source.stb.eq(self.packets != 0),
+            source.eop.eq(fifo_out.eop),
+            source.payload.eq(fifo_out.payload),
+            do_read.eq(source.stb & source.ack)
+        ]
+        self.sync += If(do_read, consume.eq(inc(consume)))
+
+        # levels
+        self.sync += [
+            committed_level.eq(committed_level
+                               + Mux(do_commit, uncommitted + 1, 0)
+                               - do_read),
+            self.packets.eq(self.packets + do_commit - (do_read & source.eop))
+        ]
+        self.comb += self.level.eq(committed_level + uncommitted)
+
+
+class AsyncPacketFIFO(Module):
+    # Packets are stored in the "write" domain, then cross to the "read"
+    # domain through a small asynchronous FIFO once complete.
+    def __init__(self, layout, depth, cdc_depth=8):
+        packet_fifo = ClockDomainsRenamer("write")(SyncPacketFIFO(layout, depth))
+        cdc_fifo = AsyncFIFO(layout, cdc_depth)
+        self.submodules += packet_fifo, cdc_fifo
+        self.comb += packet_fifo.source.connect(cdc_fifo.sink)
+
+        self.sink = packet_fifo.sink
+        self.source = cdc_fifo.source
+        self.drop = packet_fifo.drop
+        self.packets = packet_fifo.packets
+        self.level = packet_fifo.level
+        self.dropped = packet_fifo.dropped
+
+
+class Buffer(Module):
+    # Registers stb/eop/payload, keeps one beat per cycle.
+    def __init__(self, layout):
+        self.sink = sink = Endpoint(layout)
+        self.source = source = Endpoint(layout)
+
+        # # #
+
+        self.comb += sink.ack.eq(~source.stb | source.ack)
+        self.sync += \
+            If(sink.ack,
+                source.stb.eq(sink.stb),
+                source.eop.eq(sink.eop),
+                source.payload.eq(sink.payload)
+            )
+
+
+class Pipeline(Module):
+    # Connects stages (modules, or (name, module) pairs) in order. Stages are
+    # not added as submodules, so that the caller can place them in other
+    # clock domains. buffered: True, or names of the stages to be followed
+    # by a (sys domain) Buffer.
+    # The sink of the first stage and the source of the last stage are the
+    # sink and source of the pipeline, unless disabled with sink=False or
+    # source=False, e.g. when the end stage is a PHY whose sink and source
+    # belong to different directions. Missing or disabled ends are None.
+    # In simulation, run measure() and call report() to get the ratio of
+    # cycles each connection between stages transfers, stalls (stb & ~ack)
+    # or is idle.
+    def __init__(self, *stages, buffered=False, sink=True, source=True):
+        self.stages = OrderedDict()
+        for i, stage in enumerate(stages):
+            if isinstance(stage, tuple):
+                name, stage = stage
+            else:
+                name = "stage" + str(i)
+            self.stages[name] = stage
+        if buffered is True:
+            buffered = list(self.stages.keys())[:-1]
+        elif buffered is False:
+            buffered = []
+
+        # # #
+
+        if sink:
+            self.sink = getattr(next(iter(self.stages.values())), "sink", None)
+        else:
+            self.sink = None
+        self.buffers = OrderedDict()
+        # sources of the stages connected to a next stage (or its buffer)
+        self.connections = OrderedDict()
+        previous = None
+        previous_name = None
+        for name, stage in self.stages.items():
+            if previous is not None:
+                self.comb += previous.connect(stage.sink)
+                self.connections[previous_name] = self.stages[previous_name].source
+            previous = getattr(stage, "source", None)
+            previous_name = name
+            if name in buffered:
+                buf = Buffer(previous.description)
+                self.submodules += buf
+                self.buffers[name] = buf
+                self.comb += previous.connect(buf.sink)
+                previous = buf.source
+        if source:
+            self.source = previous
+        else:
+            self.source = None
+
+        self.statistics = OrderedDict((name, [0, 0, 0])
+                                      for name in self.connections.keys())
+
+    @passive
+    def measure(self):
+        while True:
+            for name, stats in self.statistics.items():
+                source = self.connections[name]
+                stb = yield source.stb
+                ack = yield source.ack
+                if stb and ack:
+                    stats[0] += 1
+                elif stb:
+                    stats[1] += 1
+                else:
+                    stats[2] += 1
+            yield
+
+    def report(self):
+        r = ""
+        for name, (transfers, stalls, idles) in self.statistics.items():
+            total = max(transfers + stalls + idles, 1)
+            r += "{}: {:.1%} active, {:.1%} stalled, {:.1%} idle\n".format(
+                name, transfers/total, stalls/total, idles/total)
+        return r
 
 
 class Multiplexer(Module):
@@ -128,6 +426,97 @@ class Demultiplexer(Module):
         self.comb += Case(self.sel, cases)
 
 
+class Arbiter(Module):
+    # Grants per packet, until the eop beat is transferred.
+    # policy: "roundrobin" or "priority" (sink0 has the highest priority)
+    def __init__(self, layout, n, policy="roundrobin"):
+        self.source = Endpoint(layout)
+        sinks = []
+        for i in range(n):
+            sink = Endpoint(layout)
+            setattr(self, "sink"+str(i), sink)
+            sinks.append(sink)
+
+        # # #
+
+        in_packet = Signal()
+        transfer = Signal()
+        self.comb += transfer.eq(self.source.stb & self.source.ack)
+        self.sync += \
+            If(transfer,
+                in_packet.eq(~self.source.eop)
+            )
+
+        requests = Cat(*[sink.stb for sink in sinks])
+        if policy == "roundrobin":
+            rr = RoundRobin(n, SP_CE)
+            self.submodules += rr
+            grant = rr.grant
+            self.comb += [
+                rr.request.eq(requests),
+                rr.ce.eq((transfer & self.source.eop) |
+                         (~in_packet & ~Array(requests)[grant]))
+            ]
+        elif policy == "priority":
+            grant = Signal(max=max(2, n))
+            grant_r = Signal(max=max(2, n))
+            self.sync += If(transfer, grant_r.eq(grant))
+            choice = grant_r
+            for i in reversed(range(n)):
+                choice = Mux(sinks[i].stb, i, choice)
+            self.comb += \
+                If(in_packet,
+                    grant.eq(grant_r)
+                ).Else(
+                    grant.eq(choice)
+                )
+        else:
+            raise ValueError("Unknown arbitration policy: " + policy)
+
+        cases = {}
+        for i, sink in enumerate(sinks):
+            cases[i] = sink.connect(self.source)
+        self.comb += Case(grant, cases)
+
+
+class Dispatcher(Module):
+    # The destination is given by sel (or the sel_field payload field) on
+    # the first beat of each packet, and held until the eop beat.
+    def __init__(self, layout, n, sel_field=None):
+        self.sink = Endpoint(layout)
+        sources = []
+        for i in range(n):
+            source = Endpoint(layout)
+            setattr(self, "source"+str(i), source)
+            sources.append(source)
+        self.sel = Signal(max=n)
+
+        # # #
+
+        if sel_field is not None:
+            self.comb += self.sel.eq(getattr(self.sink, sel_field))
+
+        in_packet = Signal()
+        sel = Signal(max=n)
+        sel_r = Signal(max=n)
+        self.comb += \
+            If(in_packet,
+                sel.eq(sel_r)
+            ).Else(
+                sel.eq(self.sel)
+            )
+        self.sync += \
+            If(self.sink.stb & self.sink.ack,
+                in_packet.eq(~self.sink.eop),
+                sel_r.eq(sel)
+            )
+
+        cases = {}
+        for i, source in enumerate(sources):
+            cases[i] = self.sink.connect(source)
+        self.comb += Case(sel, cases)
+
+
 class _UpConverter(Module):
     def __init__(self, nbits_from, nbits_to, ratio, reverse,
                  report_valid_token_count):
@@ -316,3 +705,62 @@ class StrideConverter(Module):
                     j += width
         else:
             self.comb += source.payload.raw_bits().eq(converter.source.data)
+
+
+class Gearbox(Module):
+    # Converts between arbitrary data widths (LSB first). At the end of a
+    # packet, the remaining bits are flushed in a last word padded with
+    # zeros.
+    def __init__(self, nbits_from, nbits_to):
+        self.sink = sink = Endpoint([("data", nbits_from)])
+        self.source = source = Endpoint([("data", nbits_to)])
+
+        # # #
+
+        size = nbits_from + nbits_to
+        buf = Signal(size)
+        level = Signal(max=size+1)
+        eop_pending = Signal()
+
+        self.comb += [
+            source.stb.eq((level >= nbits_to) | (eop_pending & (level != 0))),
+            source.eop.eq(eop_pending & (level <= nbits_to)),
+            source.data.eq(buf[:nbits_to])
+        ]
+
+        output = Signal()
+        flush = Signal()
+        buf_after = Signal(size)
+        level_after = Signal(max=size+1)
+        self.comb += [
+            output.eq(source.stb & source.ack),
+            flush.eq(output & source.eop),
+            If(flush,
+                buf_after.eq(0),
+                level_after.eq(0)
+            ).Elif(output,
+                buf_after.eq(buf[nbits_to:]),
+                level_after.eq(level - nbits_to)
+            ).Else(
+                buf_after.eq(buf),
+                level_after.eq(level)
+            ),
+            sink.ack.eq((~eop_pending | flush) &
+                        (level_after <= size - nbits_from))
+        ]
+
+        cases = {}
+        for i in range(size - nbits_from + 1):
+            cases[i] = buf[i:i+nbits_from].eq(sink.data)
+        self.sync += [
+            buf.eq(buf_after),
+            level.eq(level_after),
+            If(flush,
+                eop_pending.eq(0)
+            ),
+            If(sink.stb & sink.ack,
+                Case(level_after, cases),
+                level.eq(level_after + nbits_from),
+                eop_pending.eq(sink.eop)
+            )
+        ]
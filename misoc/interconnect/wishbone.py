@@ -9,8 +9,6 @@ from migen.genlib.fsm import FSM, NextState
 
 from misoc.interconnect import csr
 
-# TODO: rewrite without FlipFlop
-
 
 _layout = [
     ("adr",             30, DIR_M_TO_S),
@@ -270,20 +268,23 @@ class DownConverter(Module):
 class UpConverter(Module):
     """UpConverter
 
-    This module up-converts wishbone accesses and bursts from a master interface
-    to a wider slave interface. This allows efficient use wishbone bursts.
+    This module up-converts Wishbone accesses from a master interface to a
+    wider slave interface, on the part of the slave word selected by the
+    low bits of the master address (lowest address in the least significant
+    bits).
 
     Writes:
-        Wishbone writes are cached before being written to the slave. Access to
-        the slave is done at the end of a burst or when address reach end of burst
-        addressing.
+        Each write is done as a single slave write, with the byte selects of
+        the addressed part of the slave word.
 
     Reads:
-        Cache is refilled only at the beginning of each burst, the subsequent
-        reads of a burst use the cached data.
+        The slave word read is cached for the rest of an incrementing burst
+        (cti=2), and the subsequent reads of the burst within that word are
+        served from the cache without a slave access. The cache is dropped at
+        the end of the burst and on writes.
 
     TODO:
-        Manage err signal? (Not implemented since we generally don't use it on Migen/MiSoC modules)
+        Merge the writes of a burst into fewer slave accesses.
     """
     def __init__(self, master, slave):
         dw_from = len(master.dat_r)
@@ -293,142 +294,51 @@ class UpConverter(Module):
 
         # # #
 
-        write = Signal()
-        evict = Signal()
-        refill = Signal()
-        read = Signal()
-
-        address = FlipFlop(30)
-        self.submodules += address
-        self.comb += address.d.eq(master.adr)
-
-        counter = Signal(max=ratio)
-        counter_ce = Signal()
-        counter_reset = Signal()
-        self.sync += \
-            If(counter_reset,
-                counter.eq(0)
-            ).Elif(counter_ce,
-                counter.eq(counter + 1)
-            )
-        counter_offset = Signal(max=ratio)
-        counter_done = Signal()
-        self.comb += [
-            counter_offset.eq(address.q),
-            counter_done.eq((counter + counter_offset) == ratio-1)
-        ]
+        offset = master.adr[:ratiobits]
+        slave_adr = master.adr[ratiobits:]
 
         cached_data = Signal(dw_to)
-        cached_sel = Signal(dw_to//8)
+        cached_adr = Signal(len(slave.adr))
+        cached_valid = Signal()
+        hit = Signal()
+        self.comb += hit.eq(cached_valid & (cached_adr == slave_adr) & ~master.we)
 
-        end_of_burst = Signal()
-        self.comb += end_of_burst.eq(~master.cyc |
-                                     (master.stb & master.cyc & master.ack & ((master.cti == 7) | counter_done)))
-
-
-        need_refill = FlipFlop(reset=1)
-        self.submodules += need_refill
         self.comb += [
-            need_refill.reset.eq(end_of_burst),
-            need_refill.d.eq(0)
-        ]
-
-        # Main FSM
-        self.submodules.fsm = fsm = FSM()
-        fsm.act("IDLE",
-            counter_reset.eq(1),
-            If(master.stb & master.cyc,
-                address.ce.eq(1),
-                If(master.we,
-                    NextState("WRITE")
-                ).Else(
-                    If(need_refill.q,
-                        NextState("REFILL")
-                    ).Else(
-                        NextState("READ")
-                    )
-                )
+            slave.adr.eq(slave_adr),
+            slave.cyc.eq(master.cyc),
+            slave.stb.eq(master.stb & ~hit),
+            slave.we.eq(master.we),
+            slave.dat_w.eq(Replicate(master.dat_w, ratio)),
+            If(hit,
+                master.ack.eq(master.cyc & master.stb)
+            ).Else(
+                master.ack.eq(slave.ack),
+                master.err.eq(slave.err)
             )
-        )
-        fsm.act("WRITE",
-            If(master.stb & master.cyc,
-                write.eq(1),
-                counter_ce.eq(1),
-                master.ack.eq(1),
-                If(counter_done,
-                    NextState("EVICT")
+        ]
+        self.sync += \
+            If(~master.cyc,
+                cached_valid.eq(0)
+            ).Elif(master.stb & master.ack,
+                If(master.we | (master.cti != 2),
+                    cached_valid.eq(0)
+                ).Elif(~hit,
+                    cached_valid.eq(1),
+                    cached_data.eq(slave.dat_r),
+                    cached_adr.eq(slave_adr)
                 )
-            ).Elif(~master.cyc,
-                NextState("EVICT")
             )
-        )
-        fsm.act("EVICT",
-            evict.eq(1),
-            slave.stb.eq(1),
-            slave.we.eq(1),
-            slave.cyc.eq(1),
-            slave.dat_w.eq(cached_data),
-            slave.sel.eq(cached_sel),
-            If(slave.ack,
-                NextState("IDLE")
-            )
-        )
-        fsm.act("REFILL",
-            refill.eq(1),
-            slave.stb.eq(1),
-            slave.cyc.eq(1),
-            If(slave.ack,
-                need_refill.ce.eq(1),
-                NextState("READ")
-            )
-        )
-        fsm.act("READ",
-            read.eq(1),
-            If(master.stb & master.cyc,
-                master.ack.eq(1)
-            ),
-            NextState("IDLE")
-        )
-
-        # Address
-        self.comb += [
-            slave.cti.eq(7), # we are not able to generate bursts since up-converting
-            slave.adr.eq(address.q[ratiobits:])
-        ]
 
         # Datapath
-        cached_datas = [FlipFlop(dw_from) for i in range(ratio)]
-        cached_sels = [FlipFlop(dw_from//8) for i in range(ratio)]
-        self.submodules += cached_datas, cached_sels
-
+        data = Signal(dw_to)
+        self.comb += data.eq(Mux(hit, cached_data, slave.dat_r))
         cases = {}
         for i in range(ratio):
-            write_sel = Signal()
-            cases[i] = write_sel.eq(1)
-            self.comb += [
-                cached_sels[i].reset.eq(counter_reset),
-                If(write,
-                    cached_datas[i].d.eq(master.dat_w),
-                ).Else(
-                    cached_datas[i].d.eq(slave.dat_r[dw_from*i:dw_from*(i+1)])
-                ),
-                cached_sels[i].d.eq(master.sel),
-                If((write & write_sel) | refill,
-                    cached_datas[i].ce.eq(1),
-                    cached_sels[i].ce.eq(1)
-                )
+            cases[i] = [
+                slave.sel[i*dw_from//8:(i+1)*dw_from//8].eq(master.sel),
+                master.dat_r.eq(data[i*dw_from:(i+1)*dw_from])
             ]
-        self.comb += Case(counter + counter_offset, cases)
-
-        cases = {}
-        for i in range(ratio):
-            cases[i] = master.dat_r.eq(cached_datas[i].q)
-        self.comb += Case(address.q[:ratiobits], cases)
-
-        self.comb += [
-            cached_data.eq(Cat([cached_data.q for cached_data in cached_datas])),
-            cached_sel.eq(Cat([cached_sel.q for cached_sel in cached_sels]))
-        ]
+        self.comb += Case(offset, cases)
 
 
 class Converter(Module):
@@ -453,7 +363,7 @@ class Converter(Module):
             upconverter = UpConverter(master, slave)
             self.submodules += upconverter
         else:
-            master.connect(slave)
+            self.comb += master.connect(slave)
 
 
 class Cache(Module):
@@ -651,6 +561,76 @@ class SRAM(Module):
         ]
 
 
+class InterleavedSRAM(Module):
+    """InterleavedSRAM
+
+    This module spreads a memory over several independent block RAM banks.
+    Consecutive groups of ``granularity`` words are stored in consecutive
+    banks, and each bank has its own slave interface in ``buses``.
+
+    When the banks are registered as separate slaves of a ``Crossbar``,
+    masters accessing different banks are served in parallel instead of
+    being serialized.
+
+    Addresses presented on each bank interface are global word addresses;
+    the bank selection bits are removed before reaching the block RAM.
+    """
+    def __init__(self, size, nbanks, granularity=1, init=None, data_width=32):
+        self.nbanks = nbanks
+        self.granularity = granularity
+        self.bank_bits = log2_int(nbanks)
+        self.granularity_bits = log2_int(granularity)
+        self.buses = [Interface(data_width) for i in range(nbanks)]
+
+        word_bytes = data_width//8
+        bank_size = size//nbanks
+        if bank_size*nbanks != size or bank_size % (granularity*word_bytes):
+            raise ValueError("Size must be a multiple of nbanks*granularity words")
+
+        # # #
+
+        self.banks = []
+        for i, bus in enumerate(self.buses):
+            bank_init = None
+            if init is not None:
+                bank_init = [w for n, w in enumerate(init)
+                    if (n >> self.granularity_bits) % nbanks == i]
+            bank = SRAM(bank_size, init=bank_init, bus=Interface(data_width))
+            self.submodules += bank
+            self.banks.append(bank)
+
+            self.comb += [
+                bank.bus.adr.eq(Cat(bus.adr[:self.granularity_bits],
+                                    bus.adr[self.granularity_bits+self.bank_bits:])),
+                bank.bus.dat_w.eq(bus.dat_w),
+                bank.bus.sel.eq(bus.sel),
+                bank.bus.cyc.eq(bus.cyc),
+                bank.bus.stb.eq(bus.stb),
+                bank.bus.we.eq(bus.we),
+                bank.bus.cti.eq(bus.cti),
+                bank.bus.bte.eq(bus.bte),
+                bus.dat_r.eq(bank.bus.dat_r),
+                bus.ack.eq(bank.bus.ack),
+                bus.err.eq(bank.bus.err)
+            ]
+
+    def bank_decoder(self, n, address_decoder=None):
+        """Returns an address decoder selecting bank ``n``, optionally
+        restricted to the region matched by ``address_decoder``."""
+        lo = self.granularity_bits
+        hi = self.granularity_bits + self.bank_bits
+        if address_decoder is None:
+            return lambda a: a[lo:hi] == n
+        else:
+            return lambda a: address_decoder(a) & (a[lo:hi] == n)
+
+    def get_slaves(self, address_decoder=None):
+        """Returns a list of (address decoder, interface) pairs, one per bank,
+        suitable for ``Crossbar`` or ``InterconnectShared``."""
+        return [(self.bank_decoder(i, address_decoder), bus)
+            for i, bus in enumerate(self.buses)]
+
+
 class CSRBank(csr.GenericBank):
     def __init__(self, description, bus=None):
         if bus is None:
@@ -1,49 +1,143 @@
 from migen import *
-from migen.genlib.fsm import FSM, NextState
+from migen.genlib.fifo import SyncFIFO
+
+from misoc.interconnect import wishbone
 
 
 class WB2LASMI(Module):
-    def __init__(self, wishbone, lasmim):
+    # Writes are posted: they are acked as soon as they are queued, and
+    # issued to LASMI in order with reads.
+    # A read requests all the words up to the end of its aligned block of
+    # burst words back-to-back (e.g. a L2 cache line refill), and the
+    # following reads of the block are served as their data arrives.
+    def __init__(self, wishbone, lasmim, burst=1):
+        aw = len(lasmim.adr)
+        adr = wishbone.adr[:aw]
 
         ###
 
-        # Control FSM
-        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
-        fsm.act("IDLE",
-            If(wishbone.cyc & wishbone.stb,
-                NextState("REQUEST")
-            )
-        )
-        fsm.act("REQUEST",
-            lasmim.stb.eq(1),
-            lasmim.we.eq(wishbone.we),
-            If(lasmim.req_ack,
-                If(wishbone.we,
-                    NextState("WRITE_DATA")
-                ).Else(
-                    NextState("READ_DATA")
-                )
-            )
-        )
-        fsm.act("WRITE_DATA",
+        # Requests
+        cmd = SyncFIFO(1 + aw, lasmim.req_queue_size)
+        wdata = SyncFIFO(lasmim.dw + lasmim.dw//8, lasmim.req_queue_size)
+        rdata = SyncFIFO(lasmim.dw, max(burst, 2))
+        self.submodules += cmd, wdata, rdata
+
+        cmd_we = Signal()
+        cmd_adr = Signal(aw)
+        self.comb += [
+            cmd.din.eq(Cat(cmd_we, cmd_adr)),
+            lasmim.stb.eq(cmd.readable),
+            Cat(lasmim.we, lasmim.adr).eq(cmd.dout),
+            cmd.re.eq(lasmim.stb & lasmim.req_ack),
+
+            wdata.din.eq(Cat(wishbone.dat_w, wishbone.sel)),
             If(lasmim.dat_w_ack,
-                lasmim.dat_we.eq(wishbone.sel),
-                wishbone.ack.eq(1),
-                NextState("IDLE")
+                Cat(lasmim.dat_w, lasmim.dat_we).eq(wdata.dout)
+            ),
+            wdata.re.eq(lasmim.dat_w_ack),
+
+        ]
+
+        # Read data, bypassing the FIFO when it is empty
+        bypass = Signal()
+        self.comb += [
+            rdata.din.eq(lasmim.dat_r),
+            rdata.we.eq(lasmim.dat_r_ack & ~bypass),
+            If(rdata.readable,
+                wishbone.dat_r.eq(rdata.dout)
+            ).Else(
+                wishbone.dat_r.eq(lasmim.dat_r)
             )
-        )
-        fsm.act("READ_DATA",
-            If(lasmim.dat_r_ack,
-                wishbone.ack.eq(1),
-                NextState("IDLE")
+        ]
+
+        # Read stream: words head to end-1 are requested and returned in order,
+        # words issue to end-1 remain to be requested.
+        stream = Signal()
+        head = Signal(aw+1)
+        issue = Signal(aw+1)
+        end = Signal(aw+1)
+        read_issued = Signal()
+        read_done = Signal()
+        # reads requested and not yet dequeued
+        level = Signal(max=burst+1)
+        self.sync += If(read_issued & ~read_done,
+                level.eq(level + 1)
+            ).Elif(~read_issued & read_done,
+                level.eq(level - 1)
             )
-        )
 
-        # Address / Datapath
+        stream_hit = Signal()
+        stream_start = Signal()
+        stream_stop = Signal()
+        self.comb += stream_hit.eq(stream & (adr == head) & (head != end))
+        self.sync += [
+            If(stream_start,
+                stream.eq(1),
+                head.eq(adr),
+                issue.eq(adr + read_issued),
+                end.eq((adr | (burst - 1)) + 1)
+            ).Else(
+                If(stream_stop, stream.eq(0)),
+                If(read_issued, issue.eq(issue + 1)),
+                If(read_done & stream_hit, head.eq(head + 1))
+            )
+        ]
+
         self.comb += [
-            lasmim.adr.eq(wishbone.adr),
-            If(lasmim.dat_w_ack,
-                lasmim.dat_w.eq(wishbone.dat_w),
+            If(wishbone.cyc & wishbone.stb & wishbone.we,
+                # posted write, cancels the stream
+                stream_stop.eq(1),
+                If(cmd.writable & wdata.writable,
+                    wishbone.ack.eq(1),
+                    cmd.we.eq(1),
+                    cmd_we.eq(1),
+                    cmd_adr.eq(adr),
+                    wdata.we.eq(1)
+                )
+            ).Elif(stream & (issue != end) & (level != burst),
+                read_issued.eq(cmd.writable),
+                cmd.we.eq(1),
+                cmd_adr.eq(issue)
             ),
-            wishbone.dat_r.eq(lasmim.dat_r)
+
+            If(wishbone.cyc & wishbone.stb & ~wishbone.we,
+                If(stream_hit,
+                    If(rdata.readable,
+                        wishbone.ack.eq(1),
+                        rdata.re.eq(1)
+                    ).Elif(lasmim.dat_r_ack,
+                        wishbone.ack.eq(1),
+                        bypass.eq(1)
+                    )
+                ).Elif(level != 0,
+                    # drop the data of the previous stream
+                    stream_stop.eq(1),
+                    If(rdata.readable,
+                        rdata.re.eq(1)
+                    ).Elif(lasmim.dat_r_ack,
+                        bypass.eq(1)
+                    )
+                ).Else(
+                    # request the first word right away
+                    stream_start.eq(1),
+                    read_issued.eq(cmd.writable),
+                    cmd.we.eq(1),
+                    cmd_adr.eq(adr)
+                )
+            ),
+            read_done.eq((rdata.re & rdata.readable) | bypass)
         ]
+
+
+class Bridge(Module):
+    # Bridges a Wishbone bus of any width to a LASMI port, through a
+    # wishbone.Converter when the widths differ. The port words of each
+    # access of a wider bus are requested back-to-back.
+    def __init__(self, bus, lasmim):
+        burst = max(len(bus.dat_w)//lasmim.dw, 1)
+        if len(bus.dat_w) == lasmim.dw:
+            wb = bus
+        else:
+            wb = wishbone.Interface(lasmim.dw)
+            self.submodules.converter = wishbone.Converter(bus, wb)
+        self.submodules.wb2lasmi = WB2LASMI(wb, lasmim, burst)
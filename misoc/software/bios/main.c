@@ -7,6 +7,7 @@
 #include <id.h>
 #include <irq.h>
 #include <crc.h>
+#include <dma.h>
 
 #include <generated/csr.h>
 #include <generated/mem.h>
@@ -123,7 +124,6 @@ static void mc(char *dstaddr, char *srcaddr, char *count)
 	unsigned int *dstaddr2;
 	unsigned int *srcaddr2;
 	unsigned int count2;
-	unsigned int i;
 
 	if((*dstaddr == 0) || (*srcaddr == 0)) {
 		printf("mc <dst> <src> [count]\n");
@@ -148,7 +148,7 @@ static void mc(char *dstaddr, char *srcaddr, char *count)
 			return;
 		}
 	}
-	for (i=0;i<count2;i++) *dstaddr2++ = *srcaddr2++;
+	dma_memcpy(dstaddr2, srcaddr2, 4*count2);
 }
 
 static void crc(char *startaddr, char *len)
@@ -0,0 +1,17 @@
+#ifndef __DMA_H
+#define __DMA_H
+
+#include <stddef.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+void *dma_memcpy(void *dest, const void *src, size_t n);
+void *dma_memset32(void *dest, unsigned int pattern, size_t n);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif /* __DMA_H */
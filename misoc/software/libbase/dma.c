@@ -0,0 +1,51 @@
+#include <generated/csr.h>
+#include <string.h>
+#include <system.h>
+#include <dma.h>
+
+#ifdef CSR_MEMCOPY_BASE
+static void dma_run(void)
+{
+	memcopy_chain_write(0);
+	memcopy_start_write(1);
+	while(memcopy_busy_read());
+	flush_cpu_dcache();
+}
+#endif
+
+void *dma_memcpy(void *dest, const void *src, size_t n)
+{
+#ifdef CSR_MEMCOPY_BASE
+	if(((((unsigned int)dest) | ((unsigned int)src) | n) & 3) == 0) {
+		memcopy_source_write((unsigned int)src);
+		memcopy_destination_write((unsigned int)dest);
+		memcopy_length_write(n);
+		memcopy_fill_write(0);
+		dma_run();
+		return dest;
+	}
+#endif
+	return memcpy(dest, src, n);
+}
+
+void *dma_memset32(void *dest, unsigned int pattern, size_t n)
+{
+#ifdef CSR_MEMCOPY_BASE
+	if(((((unsigned int)dest) | n) & 3) == 0) {
+		memcopy_pattern_write(pattern);
+		memcopy_destination_write((unsigned int)dest);
+		memcopy_length_write(n);
+		memcopy_fill_write(1);
+		dma_run();
+		return dest;
+	}
+#endif
+	{
+		unsigned int *d = dest;
+		size_t i;
+
+		for(i=0;i<n/4;i++)
+			*d++ = pattern;
+	}
+	return dest;
+}
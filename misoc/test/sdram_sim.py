@@ -0,0 +1,264 @@
+from migen import *
+
+from misoc.cores import sdram_settings
+from misoc.cores.sdram_model import SDRAMPHYSim
+from misoc.cores.lasmicon.core import LASMIcon
+from misoc.cores.minicon.core import Minicon
+from misoc.interconnect import lasmi_bus
+
+
+# small SDR module, so that the simulation model remains fast
+class SimModule:
+    geom_settings = sdram_settings.GeomSettingsT(bankbits=2, rowbits=5, colbits=6,
+                                                 addressbits=13)
+    timing_settings = sdram_settings.TimingSettings(tRP=2, tRCD=2, tWR=2, tWTR=2,
+                                                    tREFI=640, tRFC=6,
+                                                    tRRD=2, tFAW=8, tRTP=2)
+
+
+phy_settings = sdram_settings.PhySettings(
+    memtype="SDR",
+    dfi_databits=16,
+    nphases=1,
+    rdphase=0,
+    wrphase=0,
+    rdcmdphase=0,
+    wrcmdphase=0,
+    cl=2,
+    read_latency=4,
+    write_latency=0
+)
+
+
+# DDR3 at 1:4, same geometry. The model writes data along with the
+# command, hence write_latency=0.
+class SimModuleDDR3(SimModule):
+    timing_settings = sdram_settings.TimingSettings(tRP=2, tRCD=2, tWR=2, tWTR=2,
+                                                    tREFI=640, tRFC=6,
+                                                    tRRD=1, tFAW=4, tCCD=1, tRTP=1)
+
+
+phy_settings_ddr3 = sdram_settings.PhySettings(
+    memtype="DDR3",
+    dfi_databits=32,
+    nphases=4,
+    rdphase=0,
+    wrphase=2,
+    rdcmdphase=1,
+    wrcmdphase=0,
+    cl=7,
+    cwl=6,
+    read_latency=6,
+    write_latency=0
+)
+
+
+class LASMISim(Module):
+    # controller and phy are the first of the ncontrollers channels
+    def __init__(self, controller_settings=None, module=SimModule,
+                 phy_settings=phy_settings, ncontrollers=1, interleave_shift=None):
+        self.phys = [SDRAMPHYSim(module, phy_settings) for i in range(ncontrollers)]
+        self.controllers = [LASMIcon(phy_settings, module.geom_settings,
+                                     module.timing_settings, controller_settings)
+                            for i in range(ncontrollers)]
+        self.submodules += self.phys, self.controllers
+        self.comb += [controller.dfi.connect(phy.dfi)
+                      for controller, phy in zip(self.controllers, self.phys)]
+        self.phy = self.phys[0]
+        self.controller = self.controllers[0]
+        self.submodules.crossbar = lasmi_bus.LASMIxbar(
+            [controller.lasmic for controller in self.controllers],
+            self.controller.nrowbits, interleave_shift)
+        # row of crossbar master addresses, with the default address mapping
+        # and a single controller
+        self.row_shift = self.controller.nrowbits + module.geom_settings.bankbits
+
+
+class MiniconSim(Module):
+    def __init__(self, controller_settings=None, module=SimModule):
+        self.submodules.phy = SDRAMPHYSim(module, phy_settings)
+        self.submodules.controller = Minicon(phy_settings,
+            module.geom_settings, module.timing_settings, controller_settings)
+        self.comb += self.controller.dfi.connect(self.phy.dfi)
+        self.bus = self.controller.bus
+
+
+def dma_write(writer, addresses, data=None, written=None):
+    # Writes data (defaults to the addresses) with a dma_lasmi.Writer,
+    # appends the accepted addresses to written, and returns once the
+    # writes are complete.
+    if data is None:
+        data = addresses
+    for a, d in zip(addresses, data):
+        yield writer.address_data.stb.eq(1)
+        yield writer.address_data.a.eq(a)
+        yield writer.address_data.d.eq(d)
+        yield
+        while not (yield writer.address_data.ack):
+            yield
+        if written is not None:
+            written.append(a)
+    yield writer.address_data.stb.eq(0)
+    yield
+    while (yield writer.busy):
+        yield
+
+
+def dma_read(reader, addresses, received, issue=None, limit=None):
+    # Reads addresses with a dma_lasmi.Reader and appends the data to
+    # received. issue(issued), if given, is called while no request is
+    # pending and returns whether to request the next address. Returns the
+    # number of cycles, or None if the reads did not complete within limit
+    # cycles.
+    yield reader.data.ack.eq(1)
+    issued = 0
+    stb = False
+    n = 0
+    count = 0
+    while count < len(addresses):
+        if n == limit:
+            return None
+        if not stb and issued < len(addresses):
+            stb = issue is None or issue(issued)
+        yield reader.address.stb.eq(stb)
+        yield reader.address.a.eq(addresses[issued % len(addresses)])
+        yield
+        n += 1
+        if stb and (yield reader.address.ack):
+            issued += 1
+            stb = False
+        if (yield reader.data.stb):
+            received.append((yield reader.data.d))
+            count += 1
+    yield reader.address.stb.eq(0)
+    return n
+
+
+class DFITimingChecker:
+    # Checks the commands issued on a DFI interface against timing settings
+    # expressed in controller cycles. Run generator() in the simulation,
+    # violations are collected as (cycle, description) in violations.
+    # The refresh debt is the number of tREFI periods elapsed minus the
+    # number of refreshes issued. min_read_to_write is the shortest read to
+    # write command spacing seen, in memory clocks.
+    def __init__(self, dfi, timing_settings, phy_settings, nbanks):
+        self.dfi = dfi
+        self.t = timing_settings
+        self.phy_settings = phy_settings
+        self.nbanks = nbanks
+        self.violations = []
+        self.commands = 0
+        self.refreshes = []
+        self.refresh_debt = 0
+        self.max_refresh_debt = 0
+        # read to write command spacing, in memory clocks. SDR: write data
+        # after the clock following read data. DDR: the JEDEC
+        # tRTW = RL + BL/2 + 2 - WL, with BL8 for DDR3 and BL4 otherwise.
+        if phy_settings.memtype == "SDR":
+            self.tRTW = phy_settings.cl + 2
+        else:
+            burst_clocks = 4 if phy_settings.memtype == "DDR3" else 2
+            wl = {"DDR": 1, "LPDDR": 1, "DDR2": phy_settings.cl - 1,
+                  "DDR3": phy_settings.cwl}[phy_settings.memtype]
+            self.tRTW = phy_settings.cl + burst_clocks + 2 - wl
+        self.min_read_to_write = None
+
+    def check(self, cycle, ok, description):
+        if not ok:
+            self.violations.append((cycle, description))
+
+    def since(self, cycle, last, t, description):
+        if t is not None and last is not None:
+            self.check(cycle, cycle - last >= t,
+                       "{} ({} < {})".format(description, cycle - last, t))
+
+    @passive
+    def generator(self):
+        t = self.t
+        ps = self.phy_settings
+        never = None
+        opened = [False]*self.nbanks
+        last_act = [never]*self.nbanks
+        last_pre = [never]*self.nbanks
+        last_read = [never]*self.nbanks
+        last_write = [never]*self.nbanks
+        acts = []
+        last_cas = never
+        last_ref = never
+        last_read_clock = never
+        last_write_any = never
+
+        cycle = 0
+        while True:
+            yield
+            cycle += 1
+            self.refresh_debt = cycle//t.tREFI - len(self.refreshes)
+            self.max_refresh_debt = max(self.max_refresh_debt, self.refresh_debt)
+            for n, phase in enumerate(self.dfi.phases):
+                if (yield phase.cs_n):
+                    continue
+                ras_n = yield phase.ras_n
+                cas_n = yield phase.cas_n
+                we_n = yield phase.we_n
+                if ras_n and cas_n:
+                    continue
+                self.commands += 1
+                b = yield phase.bank
+                a10 = (yield phase.address) & 2**10
+                clock = cycle*ps.nphases + n
+                if not ras_n and cas_n and we_n:
+                    # activate
+                    self.check(cycle, not opened[b], "activate of open bank")
+                    self.since(cycle, last_pre[b], t.tRP, "tRP")
+                    self.since(cycle, last_ref, t.tRFC, "tRFC")
+                    if acts:
+                        self.since(cycle, acts[-1], t.tRRD, "tRRD")
+                    if t.tFAW is not None:
+                        self.check(cycle, len([c for c in acts if cycle - c < t.tFAW]) < 4,
+                                   "tFAW")
+                    acts = acts[-3:] + [cycle]
+                    opened[b] = True
+                    last_act[b] = cycle
+                elif not ras_n and cas_n and not we_n:
+                    # precharge
+                    for pb in range(self.nbanks) if a10 else [b]:
+                        self.since(cycle, last_write[pb], t.tWR, "tWR")
+                        self.since(cycle, last_read[pb], t.tRTP, "tRTP")
+                        if opened[pb]:
+                            last_pre[pb] = cycle
+                        opened[pb] = False
+                elif not ras_n and not cas_n and we_n:
+                    # refresh
+                    self.check(cycle, not any(opened), "refresh with open banks")
+                    self.since(cycle, last_ref, t.tRFC, "tRFC between refreshes")
+                    for pb in range(self.nbanks):
+                        self.since(cycle, last_pre[pb], t.tRP, "tRP before refresh")
+                    last_ref = cycle
+                    self.refreshes.append(cycle)
+                elif ras_n and not cas_n:
+                    # read/write
+                    write = not we_n
+                    self.check(cycle, opened[b], "access to closed bank")
+                    self.since(cycle, last_act[b], t.tRCD, "tRCD")
+                    self.since(cycle, last_cas, t.tCCD, "tCCD")
+                    last_cas = cycle
+                    if write:
+                        if last_read_clock is not None:
+                            spacing = clock - last_read_clock
+                            self.check(cycle, spacing >= self.tRTW,
+                                       "tRTW ({} < {})".format(spacing, self.tRTW))
+                            self.min_read_to_write = min(spacing,
+                                self.min_read_to_write or spacing)
+                        last_write[b] = cycle
+                        last_write_any = cycle
+                    else:
+                        self.since(cycle, last_write_any, t.tWTR, "tWTR")
+                        last_read_clock = clock
+                        last_read[b] = cycle
+                    if a10:
+                        # auto-precharge
+                        if write:
+                            last_pre[b] = cycle + t.tWR
+                        else:
+                            last_pre[b] = cycle + (t.tRTP or 0)
+                        opened[b] = False
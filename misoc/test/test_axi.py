@@ -0,0 +1,190 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import axi, wishbone, csr_bus
+
+
+class AXI2WishboneDUT(Module):
+    def __init__(self):
+        self.axi = axi.Interface()
+        self.submodules.sram = wishbone.SRAM(4096)
+        self.submodules.bridge = axi.AXI2Wishbone(self.axi, self.sram.bus)
+
+
+class Wishbone2AXIDUT(Module):
+    def __init__(self):
+        self.wishbone = wishbone.Interface()
+        axi_bus = axi.Interface()
+        self.submodules.sram = wishbone.SRAM(4096)
+        self.submodules.wb2axi = axi.Wishbone2AXI(self.wishbone, axi_bus)
+        self.submodules.axi2wb = axi.AXI2Wishbone(axi_bus, self.sram.bus)
+
+
+class AXILite2CSRDUT(Module):
+    def __init__(self):
+        self.axi_lite = axi.LiteInterface()
+        self.mem = Memory(8, 16)
+        self.submodules.sram = csr_bus.SRAM(self.mem, 0)
+        self.submodules.bridge = axi.AXILite2CSR(self.axi_lite, self.sram.bus)
+
+
+class StreamDUT(Module):
+    def __init__(self):
+        self.submodules.to_axis = axi.Endpoint2AXIStream(32)
+        self.submodules.from_axis = axi.AXIStream2Endpoint(32)
+        self.comb += [
+            self.from_axis.sink.valid.eq(self.to_axis.source.valid),
+            self.from_axis.sink.last.eq(self.to_axis.source.last),
+            self.from_axis.sink.data.eq(self.to_axis.source.data),
+            self.to_axis.source.ready.eq(self.from_axis.sink.ready)
+        ]
+        self.sink = self.to_axis.sink
+        self.source = self.from_axis.source
+
+
+class TestAXI(unittest.TestCase):
+    def test_axi2wishbone_burst(self):
+        dut = AXI2WishboneDUT()
+        length = 256
+        data = [(0x1234 + 7*i) & 0xffffffff for i in range(length)]
+
+        def gen():
+            cycles = 0
+            resp = yield from dut.axi.write(0x100, data)
+            self.assertEqual(resp, axi.RESP_OKAY)
+            for i, word in enumerate(data):
+                self.assertEqual((yield dut.sram.mem[0x40 + i]), word)
+            yield dut.axi.w.strb.eq(0)
+            yield dut.axi.ar.addr.eq(0x100)
+            yield dut.axi.ar.len.eq(length - 1)
+            yield dut.axi.ar.burst.eq(axi.BURST_INCR)
+            yield dut.axi.ar.valid.eq(1)
+            yield dut.axi.r.ready.eq(1)
+            yield
+            yield dut.axi.ar.valid.eq(0)
+            received = []
+            while len(received) < length:
+                if (yield dut.sram.bus.stb):
+                    # reads are not masked by the idle W channel
+                    self.assertEqual((yield dut.sram.bus.sel), 0xf)
+                if (yield dut.axi.r.valid):
+                    received.append((yield dut.axi.r.data))
+                    self.assertEqual((yield dut.axi.r.last),
+                                     len(received) == length)
+                cycles += 1
+                yield
+            self.assertEqual(received, data)
+            throughput = length/cycles
+            # wishbone.SRAM acks every other cycle
+            self.assertGreater(throughput, 0.45)
+
+        run_simulation(dut, gen())
+
+    def test_axi2wishbone_fixed(self):
+        dut = AXI2WishboneDUT()
+        data = [0x11, 0x22, 0x33, 0x44]
+        cti = []
+
+        def gen():
+            resp = yield from dut.axi.write(0x200, data,
+                                            burst=axi.BURST_FIXED)
+            self.assertEqual(resp, axi.RESP_OKAY)
+            # all beats go to the same word
+            self.assertEqual((yield dut.sram.mem[0x80]), data[-1])
+            self.assertEqual((yield dut.sram.mem[0x81]), 0)
+            received = yield from dut.axi.read(0x200, len(data),
+                                               burst=axi.BURST_FIXED)
+            self.assertEqual(received, [data[-1]]*len(data))
+
+        @passive
+        def monitor():
+            while True:
+                if (yield dut.sram.bus.stb) and (yield dut.sram.bus.ack):
+                    cti.append((yield dut.sram.bus.cti))
+                yield
+
+        run_simulation(dut, [gen(), monitor()])
+        # constant address bursts, ended on the last beat of each
+        self.assertEqual(cti, 2*([1]*(len(data) - 1) + [7]))
+
+    def test_wishbone2axi(self):
+        dut = Wishbone2AXIDUT()
+
+        def gen():
+            for i in range(8):
+                yield from dut.wishbone.write(i, 0x100 + i)
+            for i in range(8):
+                self.assertEqual((yield from dut.wishbone.read(i)), 0x100 + i)
+
+        run_simulation(dut, gen())
+
+    def test_axilite2csr(self):
+        dut = AXILite2CSRDUT()
+
+        def write(adr, dat):
+            yield dut.axi_lite.aw.addr.eq(adr)
+            yield dut.axi_lite.w.data.eq(dat)
+            yield dut.axi_lite.aw.valid.eq(1)
+            yield dut.axi_lite.w.valid.eq(1)
+            yield dut.axi_lite.b.ready.eq(1)
+            yield
+            while not (yield dut.axi_lite.aw.ready):
+                yield
+            yield dut.axi_lite.aw.valid.eq(0)
+            yield dut.axi_lite.w.valid.eq(0)
+            while not (yield dut.axi_lite.b.valid):
+                yield
+            yield
+
+        def read(adr):
+            yield dut.axi_lite.ar.addr.eq(adr)
+            yield dut.axi_lite.ar.valid.eq(1)
+            yield dut.axi_lite.r.ready.eq(1)
+            yield
+            while not (yield dut.axi_lite.ar.ready):
+                yield
+            yield dut.axi_lite.ar.valid.eq(0)
+            while not (yield dut.axi_lite.r.valid):
+                yield
+            value = yield dut.axi_lite.r.data
+            yield
+            return value
+
+        def gen():
+            for i in range(4):
+                yield from write(4*i, 0x10 + i)
+            for i in range(4):
+                self.assertEqual((yield from read(4*i)), 0x10 + i)
+
+        run_simulation(dut, gen())
+
+    def test_stream(self):
+        dut = StreamDUT()
+        length = 64
+
+        def source():
+            for i in range(length):
+                yield dut.sink.stb.eq(1)
+                yield dut.sink.data.eq(i)
+                yield dut.sink.eop.eq(i % 16 == 15)
+                yield
+                while not (yield dut.sink.ack):
+                    yield
+            yield dut.sink.stb.eq(0)
+
+        def sink():
+            cycles = 0
+            received = []
+            yield dut.source.ack.eq(1)
+            while len(received) < length:
+                yield
+                cycles += 1
+                if (yield dut.source.stb):
+                    received.append(((yield dut.source.data),
+                                     (yield dut.source.eop)))
+            self.assertEqual(received, [(i, i % 16 == 15)
+                                        for i in range(length)])
+            self.assertEqual(cycles, length)
+
+        run_simulation(dut, [source(), sink()])
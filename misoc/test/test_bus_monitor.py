@@ -0,0 +1,59 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.bus_monitor import WishboneMonitor
+from misoc.interconnect import wishbone
+
+
+class MonitorDUT(Module):
+    def __init__(self):
+        self.submodules.sram = wishbone.SRAM(1024)
+        self.submodules.monitor = WishboneMonitor(self.sram.bus, period_bits=8)
+        self.bus = self.sram.bus
+
+
+class TestBusMonitor(unittest.TestCase):
+    def test_counters(self):
+        dut = MonitorDUT()
+
+        def gen():
+            for i in range(10):
+                yield from dut.bus.write(i, i)
+            for i in range(5):
+                yield from dut.bus.read(i)
+            # burst of 4 beats
+            for i in range(4):
+                yield dut.bus.cti.eq(7 if i == 3 else 2)
+                yield from dut.bus.read(0x10 + i)
+            yield dut.bus.cti.eq(0)
+            # wait for the end of the window
+            for i in range(256):
+                yield
+            yield from dut.monitor._update.write(1)
+            yield
+            self.assertEqual((yield dut.monitor._transactions.status), 16)
+            self.assertEqual((yield dut.monitor._reads.status), 6)
+            self.assertEqual((yield dut.monitor._writes.status), 10)
+            self.assertEqual((yield dut.monitor._beats.status), 19)
+            # wishbone.SRAM inserts one wait cycle per access
+            self.assertEqual((yield dut.monitor._wait_cycles.status), 19)
+            self.assertEqual((yield dut.monitor._errors.status), 0)
+
+        run_simulation(dut, gen())
+
+    def test_full_window(self):
+        # a master waiting during a whole window, with no slave
+        bus = wishbone.Interface()
+        monitor = WishboneMonitor(bus, period_bits=4)
+
+        def gen():
+            yield bus.cyc.eq(1)
+            yield bus.stb.eq(1)
+            for i in range(40):
+                yield
+            yield from monitor._update.write(1)
+            yield
+            self.assertEqual((yield monitor._wait_cycles.status), 16)
+
+        run_simulation(monitor, gen())
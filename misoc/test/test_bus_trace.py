@@ -0,0 +1,128 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.bus_trace import BusTrace
+from misoc.interconnect import wishbone
+from misoc.tools import bustrace
+
+
+class TraceDUT(Module):
+    def __init__(self):
+        self.submodules.sram0 = wishbone.SRAM(1024)
+        self.submodules.sram1 = wishbone.SRAM(1024)
+        self.buses = [self.sram0.bus, self.sram1.bus]
+        self.submodules.trace = BusTrace(self.buses, depth=16)
+
+
+class TestBusTrace(unittest.TestCase):
+    def test_trace(self):
+        dut = TraceDUT()
+        dump = []
+
+        def master0():
+            yield from dut.trace._trigger_address.write(0x20)
+            yield from dut.trace._trigger_mask.write(0xffffffff)
+            yield from dut.trace._trigger_type.write(0b10)
+            yield from dut.trace._arm.write(1)
+            # before trigger (read of the trigger address does not match)
+            yield from dut.buses[0].write(0x10, 1)
+            yield from dut.buses[0].read(0x20)
+            # trigger
+            yield from dut.buses[0].write(0x20, 2)
+            for i in range(20):
+                yield from dut.buses[0].read(i)
+            for i in range(10):
+                yield
+            self.assertTrue((yield dut.trace._triggered.status))
+            self.assertEqual((yield dut.trace._count.status), 16)
+            for i in range(16):
+                dump.append((yield dut.trace.mem[i]))
+
+        def master1():
+            for i in range(12):
+                yield
+            for i in range(5):
+                yield from dut.buses[1].write(0x100 + i, i)
+
+        run_simulation(dut, [master0(), master1()])
+
+        data = b"".join(entry.to_bytes(16, "big") for entry in dump)
+        entries = bustrace.decode(data)
+        self.assertEqual(entries[0]["master"], 0)
+        self.assertEqual(entries[0]["address"], 0x20)
+        self.assertEqual(entries[0]["we"], 1)
+        self.assertEqual([e["timestamp"] for e in entries],
+                         sorted(e["timestamp"] for e in entries))
+        master1 = [e for e in entries if e["master"] == 1]
+        self.assertTrue(master1)
+        self.assertEqual([e["address"] for e in master1],
+                         [0x100 + i for i in range(len(master1))])
+        self.assertTrue(all(e["we"] for e in master1))
+        master0 = [e for e in entries if e["master"] == 0]
+        self.assertEqual([e["address"] for e in master0[1:]],
+                         list(range(len(master0) - 1)))
+        # wishbone.SRAM acks in the second cycle of each access
+        self.assertTrue(all(e["latency"] == 2 for e in entries))
+        stats = bustrace.master_statistics(entries)
+        self.assertEqual(stats[0]["accesses"] + stats[1]["accesses"], 16)
+
+    def test_concurrent(self):
+        # both buses busy at the same time, filling the buffer with accesses
+        # still queued
+        dut = TraceDUT()
+        dump = []
+
+        def master(n):
+            if n == 0:
+                yield from dut.trace._trigger_mask.write(0)
+                yield from dut.trace._arm.write(1)
+            else:
+                for i in range(8):
+                    yield
+            for i in range(20):
+                yield from dut.buses[n].write(i, i)
+            if n == 0:
+                for i in range(10):
+                    yield
+                self.assertEqual((yield dut.trace._count.status), 16)
+                self.assertGreater((yield dut.trace._dropped.status), 0)
+                for i in range(16):
+                    dump.append((yield dut.trace.mem[i]))
+
+        run_simulation(dut, [master(0), master(1)])
+
+        data = b"".join(entry.to_bytes(16, "big") for entry in dump)
+        entries = bustrace.decode(data)
+        self.assertEqual([e["timestamp"] for e in entries],
+                         sorted(e["timestamp"] for e in entries))
+        self.assertEqual({e["master"] for e in entries}, {0, 1})
+        self.assertEqual(bustrace.entries_per_page(8), 32)
+
+    def test_dropped(self):
+        # three buses completing an access in every cycle, while only one
+        # entry is stored per cycle: two are dropped in the same cycle
+        layout = [("stb", 1), ("req_ack", 1), ("adr", 16), ("we", 1)]
+        buses = [Record(layout) for i in range(3)]
+        dut = BusTrace(buses, depth=64, fifo_depth=2)
+        accesses = 8
+
+        def gen():
+            yield from dut._trigger_mask.write(0)
+            yield from dut._arm.write(1)
+            yield
+            for bus in buses:
+                yield bus.stb.eq(1)
+                yield bus.req_ack.eq(1)
+            for i in range(accesses):
+                yield
+            for bus in buses:
+                yield bus.stb.eq(0)
+            for i in range(10):
+                yield
+            count = yield dut._count.status
+            dropped = yield dut._dropped.status
+            self.assertLess(count, 3*accesses)
+            self.assertEqual(count + dropped, 3*accesses)
+
+        run_simulation(dut, gen())
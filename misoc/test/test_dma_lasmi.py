@@ -0,0 +1,85 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import dma_lasmi
+from misoc.test.sdram_sim import LASMISim
+
+
+class DMADUT(Module):
+    def __init__(self, nlanes):
+        self.submodules.sdram = LASMISim()
+        crossbar = self.sdram.crossbar
+        lane_shift = self.sdram.controller.nrowbits
+        self.submodules.writer = dma_lasmi.MultiWriter(
+            [crossbar.get_master() for i in range(4)], lane_shift,
+            with_counters=True)
+        if nlanes > 1:
+            self.submodules.reader = dma_lasmi.MultiReader(
+                [crossbar.get_master() for i in range(nlanes)], lane_shift,
+                with_counters=True)
+        else:
+            self.submodules.reader = dma_lasmi.Reader(crossbar.get_master())
+        self.lane_shift = lane_shift
+
+
+def _bank_interleaved(dut, n):
+    # consecutive requests go to different banks
+    return [((i % 4) << dut.lane_shift) | (i//4) for i in range(n)]
+
+
+class TestMultiLane(unittest.TestCase):
+    def run_dut(self, nlanes):
+        dut = DMADUT(nlanes)
+        addresses = _bank_interleaved(dut, 128)
+        received = []
+        result = []
+
+        def write():
+            for a in addresses:
+                yield dut.writer.address_data.stb.eq(1)
+                yield dut.writer.address_data.a.eq(a)
+                yield dut.writer.address_data.d.eq(a ^ 0x5555)
+                yield
+                while not (yield dut.writer.address_data.ack):
+                    yield
+            yield dut.writer.address_data.stb.eq(0)
+            yield
+            while (yield dut.writer.busy):
+                yield
+            self.assertEqual((yield dut.writer.counters._words.status),
+                             len(addresses))
+
+            # read back
+            cycles = 0
+            issued = 0
+            yield dut.reader.data.ack.eq(1)
+            while len(received) < len(addresses):
+                if issued < len(addresses):
+                    yield dut.reader.address.stb.eq(1)
+                    yield dut.reader.address.a.eq(addresses[issued])
+                else:
+                    yield dut.reader.address.stb.eq(0)
+                yield
+                cycles += 1
+                if issued < len(addresses) and (yield dut.reader.address.ack):
+                    issued += 1
+                if (yield dut.reader.data.stb):
+                    received.append((yield dut.reader.data.d))
+            result.append(cycles)
+            if nlanes > 1:
+                counters = dut.reader.counters
+                yield
+                self.assertEqual((yield counters._words.status),
+                                 len(addresses))
+                # active from the first request to the last word
+                self.assertEqual((yield counters._cycles.status), cycles)
+
+        run_simulation(dut, write())
+        self.assertEqual(received, [a ^ 0x5555 for a in addresses])
+        return result[0]
+
+    def test_throughput(self):
+        single = self.run_dut(1)
+        multi = self.run_dut(4)
+        self.assertLess(multi, single)
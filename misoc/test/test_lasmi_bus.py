@@ -0,0 +1,137 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import dma_lasmi
+from misoc.test.sdram_sim import LASMISim, dma_write, dma_read
+
+
+class MultiControllerDUT(Module):
+    def __init__(self, ncontrollers, nmasters):
+        # consecutive blocks of 16 words go to consecutive controllers
+        self.submodules.sdram = LASMISim(ncontrollers=ncontrollers, interleave_shift=4)
+        crossbar = self.sdram.crossbar
+        self.submodules.writer = dma_lasmi.Writer(crossbar.get_master())
+        self.readers = [dma_lasmi.Reader(crossbar.get_master()) for i in range(nmasters)]
+        self.submodules += self.readers
+
+
+def _run_multi(ncontrollers, nmasters=4, nblocks=2):
+    # master m reads blocks m, m + nmasters, ... of 16 words
+    dut = MultiControllerDUT(ncontrollers, nmasters)
+    addresses = [[16*(m + nmasters*j) + i for j in range(nblocks) for i in range(16)]
+                 for m in range(nmasters)]
+    received = [[] for m in range(nmasters)]
+    start = []
+    cycles = []
+
+    def write():
+        all_addresses = sorted(sum(addresses, []))
+        yield from dma_write(dut.writer, all_addresses, [a ^ 0x3c3c for a in all_addresses])
+        start.append(True)
+
+    def read(reader, addresses, received):
+        while not start:
+            yield
+        cycles.append((yield from dma_read(reader, addresses, received)))
+
+    generators = [write()]
+    generators += [read(r, a, d) for r, a, d in zip(dut.readers, addresses, received)]
+    run_simulation(dut, generators)
+    expected = [[a ^ 0x3c3c for a in m_addresses] for m_addresses in addresses]
+    return received, expected, sum(len(a) for a in addresses)/max(cycles)
+
+
+class TestMultiController(unittest.TestCase):
+    def test_scaling(self):
+        bandwidth = dict()
+        for ncontrollers in 1, 2, 4:
+            received, expected, bandwidth[ncontrollers] = _run_multi(ncontrollers)
+            self.assertEqual(received, expected)
+        self.assertGreater(bandwidth[2], 1.5*bandwidth[1])
+        self.assertGreater(bandwidth[4], 1.5*bandwidth[2])
+
+
+class QoSDUT(Module):
+    def __init__(self, video_qos, bulk_qos, urgent_level=None):
+        # a video reader and two bulk readers, with the given get_master
+        # arguments
+        self.submodules.sdram = LASMISim()
+        crossbar = self.sdram.crossbar
+        self.submodules.writer = dma_lasmi.Writer(crossbar.get_master())
+        self.readers = [dma_lasmi.Reader(crossbar.get_master(**video_qos),
+                                         urgent_level=urgent_level)]
+        self.readers += [dma_lasmi.Reader(crossbar.get_master(**bulk_qos))
+                         for i in range(2)]
+        self.submodules += self.readers
+
+
+def _run_qos(video_qos, bulk_qos=dict(), urgent_level=None,
+             video_length=16, bulk_length=32, video_delay=8, limit=2000):
+    # all readers stream different rows of the same bank, reader cycles are
+    # None if the reads did not complete within limit cycles
+    dut = QoSDUT(video_qos, bulk_qos, urgent_level)
+    addresses = [[((m + 1) << dut.sdram.row_shift) | i for i in range(length)]
+                 for m, length in enumerate([video_length, bulk_length, bulk_length])]
+    received = [[] for reader in dut.readers]
+    start = []
+    # cycles each reader took, and bulk words received while the video
+    # reader was running
+    cycles = [None]*len(dut.readers)
+    bulk_during_video = []
+
+    def write():
+        yield from dma_write(dut.writer, sum(addresses, []))
+        start.append(True)
+
+    def read(n):
+        while not start:
+            yield
+        if n == 0:
+            # start once the bulk readers have taken the bank
+            for i in range(video_delay):
+                yield
+        cycles[n] = yield from dma_read(dut.readers[n], addresses[n], received[n],
+                                        limit=limit)
+        if n == 0:
+            bulk_during_video.append(len(received[1]) + len(received[2]))
+
+    run_simulation(dut, [write()] + [read(n) for n in range(len(dut.readers))])
+    return received, addresses, cycles, bulk_during_video[0]
+
+
+class TestQoS(unittest.TestCase):
+    def test_priority(self):
+        cycles = dict()
+        for name, video_qos, urgent_level in [
+                ("none", dict(), None),
+                ("priority", dict(priority=1), None),
+                ("urgent", dict(urgent=True), 4)]:
+            received, addresses, reader_cycles, bulk = _run_qos(video_qos, urgent_level=urgent_level)
+            # all the readers complete within the cycle limit
+            self.assertNotIn(None, reader_cycles)
+            self.assertEqual(received, addresses)
+            cycles[name] = reader_cycles[0]
+        self.assertLess(cycles["priority"], cycles["none"])
+        self.assertLess(cycles["urgent"], cycles["none"])
+
+    def test_starvation(self):
+        # a long video stream does not starve the lower priority readers
+        bulk = dict()
+        for max_wait in 16, 256:
+            received, addresses, cycles, bulk[max_wait] = _run_qos(
+                dict(priority=1), dict(max_wait=max_wait), video_length=48)
+            self.assertNotIn(None, cycles)
+            self.assertEqual(received, addresses)
+        self.assertGreater(bulk[16], bulk[256])
+
+    def test_rate(self):
+        bandwidth = dict()
+        for rate in None, (1, 8):
+            received, addresses, cycles, bulk = _run_qos(dict(), dict(rate=rate), video_length=0)
+            self.assertNotIn(None, cycles)
+            self.assertEqual(received, addresses)
+            bandwidth[rate] = 2*len(addresses[1])/max(cycles[1:])
+        # 2 readers, each bursting 8 requests at most
+        self.assertLessEqual(bandwidth[(1, 8)], 2/8*len(addresses[1])/(len(addresses[1]) - 8))
+        self.assertLess(bandwidth[(1, 8)], bandwidth[None])
@@ -0,0 +1,318 @@
+import unittest
+import random
+
+from migen import *
+
+from misoc.cores.lasmicon import ControllerSettings
+from misoc.cores.lasmicon.refresher import Refresher
+from misoc.interconnect import dma_lasmi, dfi
+from misoc.test.sdram_sim import (LASMISim, SimModule, phy_settings,
+                                 SimModuleDDR3, phy_settings_ddr3,
+                                 DFITimingChecker, dma_write, dma_read)
+
+
+class MixedDUT(Module):
+    def __init__(self, controller_settings=None, nmasters=2):
+        self.submodules.sdram = LASMISim(controller_settings)
+        crossbar = self.sdram.crossbar
+        self.submodules.writer = dma_lasmi.Writer(crossbar.get_master())
+        self.readers = [dma_lasmi.Reader(crossbar.get_master())
+                        for i in range(nmasters)]
+        self.submodules += self.readers
+        self.row_shift = self.sdram.row_shift
+
+
+@passive
+def _count_activates(dfi, counts):
+    while True:
+        yield
+        phase = dfi.phases[0]
+        if (not (yield phase.ras_n) and (yield phase.cas_n)
+                and (yield phase.we_n) and not (yield phase.cs_n)):
+            counts.append((yield phase.bank))
+
+
+def _run_mixed(controller_settings, length=32, issue_probability=0.25):
+    # each master reads a different row of the same bank, issuing requests
+    # at random times
+    prng = random.Random(42)
+    dut = MixedDUT(controller_settings)
+    addresses = [[((m + 1) << dut.row_shift) | i for i in range(length)]
+                 for m in range(len(dut.readers))]
+    received = [[] for reader in dut.readers]
+    activates = []
+    start = []
+    cycles = []
+
+    def write():
+        yield from dma_write(dut.writer, sum(addresses, []))
+        for i in range(32):
+            yield
+        del activates[:]
+        start.append(True)
+
+    def read(reader, addresses, received):
+        while not start:
+            yield
+        n = yield from dma_read(reader, addresses, received,
+                                lambda issued: prng.random() < issue_probability)
+        cycles.append(n)
+
+    generators = [write(), _count_activates(dut.sdram.controller.dfi, activates)]
+    generators += [read(r, a, d) for r, a, d in zip(dut.readers, addresses, received)]
+    run_simulation(dut, generators)
+    return addresses, received, len(activates), max(cycles)
+
+
+class TestLookahead(unittest.TestCase):
+    def test_mixed_streams(self):
+        results = dict()
+        for lookahead in 1, 8:
+            settings = ControllerSettings(lookahead=lookahead)
+            addresses, received, activates, cycles = _run_mixed(settings)
+            self.assertEqual(received, addresses)
+            accesses = sum(len(a) for a in addresses)
+            results[lookahead] = activates, cycles
+        self.assertLessEqual(results[8][0], results[1][0])
+        self.assertLess(results[8][1], results[1][1])
+
+
+def _random_addresses(n, row_shift, seed=0, ncols=64):
+    prng = random.Random(seed)
+    return [(prng.randrange(8) << row_shift) | prng.randrange(ncols) for i in range(n)]
+
+
+class PolicyDUT(Module):
+    def __init__(self, controller_settings, module=SimModule):
+        self.submodules.sdram = LASMISim(controller_settings, module)
+        self.submodules.reader = dma_lasmi.Reader(self.sdram.crossbar.get_master())
+        self.row_shift = self.sdram.row_shift
+
+
+def _run_policy(page_policy, trace):
+    # sequential: streams reads
+    # random: reads one word at a time, and waits 8 cycles after each one
+    dut = PolicyDUT(ControllerSettings(page_policy=page_policy, page_timeout=4))
+    if trace == "sequential":
+        addresses = list(range(64))
+    else:
+        addresses = _random_addresses(32, dut.row_shift)
+    cycles = []
+
+    def gen():
+        yield dut.reader.data.ack.eq(1)
+        n = 0
+        received = 0
+        issued = 0
+        while received < len(addresses):
+            stb = issued < len(addresses) and (trace == "sequential" or issued == received)
+            yield dut.reader.address.stb.eq(stb)
+            yield dut.reader.address.a.eq(addresses[issued % len(addresses)])
+            yield
+            n += 1
+            if stb and (yield dut.reader.address.ack):
+                issued += 1
+            if (yield dut.reader.data.stb):
+                received += 1
+                if trace == "random":
+                    yield dut.reader.address.stb.eq(0)
+                    for i in range(8):
+                        yield
+                    n += 8
+        cycles.append(n)
+
+    run_simulation(dut, gen())
+    return cycles[0]
+
+
+class TestPagePolicy(unittest.TestCase):
+    def test_policies(self):
+        results = dict()
+        for trace in "sequential", "random":
+            for page_policy in "open", "closed", "adaptive":
+                cycles = _run_policy(page_policy, trace)
+                results[(trace, page_policy)] = cycles
+        self.assertLess(results[("sequential", "open")], results[("sequential", "closed")])
+        self.assertLess(results[("random", "closed")], results[("random", "open")])
+        self.assertLess(results[("sequential", "adaptive")], results[("sequential", "closed")])
+        self.assertLess(results[("random", "adaptive")], results[("random", "open")])
+
+
+class TimingDUT(Module):
+    def __init__(self, module, phy_settings):
+        self.submodules.sdram = LASMISim(module=module, phy_settings=phy_settings)
+        crossbar = self.sdram.crossbar
+        self.submodules.writer = dma_lasmi.Writer(crossbar.get_master())
+        self.submodules.reader = dma_lasmi.Reader(crossbar.get_master())
+        self.ncols = 2**self.sdram.controller.nrowbits
+        self.row_shift = self.sdram.row_shift
+
+
+def _run_timing(module, phy_settings, checked_timings=None):
+    # random reads and writes to all banks, checked against the timings
+    dut = TimingDUT(module, phy_settings)
+    checker = DFITimingChecker(dut.sdram.controller.dfi,
+                               checked_timings or module.timing_settings,
+                               phy_settings, 4)
+    addresses = _random_addresses(64, dut.row_shift, seed=1, ncols=dut.ncols)
+    written = []
+    received = []
+    cycles = []
+
+    def write():
+        # the second half is written while the first is read back, so that
+        # reads are followed by writes
+        half = len(addresses)//2
+        yield from dma_write(dut.writer, addresses[:half], written=written)
+        while len(received) < half//4:
+            yield
+        yield from dma_write(dut.writer, addresses[half:], written=written)
+
+    def read():
+        # only read back words that have been written
+        n = yield from dma_read(dut.reader, addresses, received,
+                                lambda issued: addresses[issued] in written)
+        cycles.append(n)
+
+    run_simulation(dut, [write(), read(), checker.generator()])
+    return addresses, received, checker, cycles[0]
+
+
+class TestTimings(unittest.TestCase):
+    def test_sdr(self):
+        addresses, received, checker, cycles = _run_timing(SimModule, phy_settings)
+        self.assertEqual(received, addresses)
+        self.assertGreater(checker.commands, 0)
+        self.assertEqual(checker.violations, [])
+
+    def test_ddr3(self):
+        addresses, received, checker, cycles = _run_timing(SimModuleDDR3, phy_settings_ddr3)
+        self.assertEqual(received, addresses)
+        self.assertEqual(checker.violations, [])
+        # CL=7 + BL8/2 + 2 - CWL=6
+        self.assertEqual(checker.tRTW, 7)
+        self.assertGreaterEqual(checker.min_read_to_write, 7)
+
+    def test_checker(self):
+        # the checker flags commands issued with looser timings
+        stricter = SimModule.timing_settings._replace(tRRD=4, tRTP=4)
+        addresses, received, checker, cycles = _run_timing(SimModule, phy_settings, stricter)
+        self.assertNotEqual(checker.violations, [])
+
+
+class FastRefreshModule(SimModule):
+    timing_settings = SimModule.timing_settings._replace(tREFI=64)
+
+
+def _run_refresh(refresh_postpone, nbursts=4, burst_length=128, gap=256):
+    # bursts of sequential reads separated by idle periods
+    dut = PolicyDUT(ControllerSettings(refresh_postpone=refresh_postpone),
+                    FastRefreshModule)
+    checker = DFITimingChecker(dut.sdram.controller.dfi,
+                               FastRefreshModule.timing_settings, phy_settings, 4)
+    durations = []
+
+    def gen():
+        for burst in range(nbursts):
+            n = yield from dma_read(dut.reader, list(range(burst_length)), [])
+            durations.append(n)
+            for i in range(gap):
+                yield
+
+    run_simulation(dut, [gen(), checker.generator()])
+    return durations, checker
+
+
+class RefresherDUT(Module):
+    # refresher alone, with its grant driven by the test
+    def __init__(self, postpone):
+        g = FastRefreshModule.geom_settings
+        t = FastRefreshModule.timing_settings
+        self.submodules.refresher = Refresher(g.addressbits, g.bankbits,
+                                              t.tRP, t.tREFI, t.tRFC, postpone)
+        self.dfi = dfi.Interface(g.addressbits, g.bankbits,
+                                 phy_settings.dfi_databits)
+        cmd = self.refresher.cmd
+        self.comb += [
+            self.dfi.p0.cs_n.eq(0),
+            self.dfi.p0.cas_n.eq(cmd.cas_n),
+            self.dfi.p0.ras_n.eq(cmd.ras_n),
+            self.dfi.p0.we_n.eq(cmd.we_n),
+            self.dfi.p0.bank.eq(cmd.ba),
+            self.dfi.p0.address.eq(cmd.a)
+        ]
+
+
+class TestRefresh(unittest.TestCase):
+    def test_postpone(self):
+        results = dict()
+        for postpone in 0, 8:
+            durations, checker = _run_refresh(postpone)
+            self.assertEqual(checker.violations, [])
+            self.assertLessEqual(checker.max_refresh_debt, postpone + 1)
+            self.assertLessEqual(checker.refresh_debt, 1)
+            results[postpone] = max(durations)
+        self.assertLess(results[8], results[0])
+
+    def test_delayed_grant(self):
+        # the grant is held back for two more tREFI periods after the
+        # refresh became urgent. The refreshes due saturate at postpone + 2
+        # instead of wrapping, and are issued as a batch once granted.
+        postpone = 2
+        tREFI = FastRefreshModule.timing_settings.tREFI
+        dut = RefresherDUT(postpone)
+        checker = DFITimingChecker(dut.dfi, FastRefreshModule.timing_settings,
+                                   phy_settings, 4)
+        granted = []
+
+        def gen():
+            for i in range((postpone + 3)*tREFI - 16):
+                yield
+            self.assertTrue((yield dut.refresher.req))
+            granted.append(len(checker.refreshes))
+            yield dut.refresher.idle.eq(1)
+            for i in range(tREFI//2):
+                yield dut.refresher.ack.eq((yield dut.refresher.req))
+                yield
+            granted.append(len(checker.refreshes))
+
+        run_simulation(dut, [gen(), checker.generator()])
+        self.assertEqual(checker.violations, [])
+        self.assertEqual(granted, [0, postpone + 2])
+
+
+def _run_strided(address_mapping):
+    # column-major walk of a 16x4 tile in a frame buffer whose pitch is a
+    # multiple of the bank span
+    dut = MixedDUT(ControllerSettings(address_mapping=address_mapping), nmasters=1)
+    pitch = 1 << dut.row_shift
+    addresses = [y*pitch + x for x in range(16) for y in range(4)]
+    reader = dut.readers[0]
+    received = []
+    activates = []
+    start = []
+
+    def write():
+        yield from dma_write(dut.writer, addresses)
+        for i in range(32):
+            yield
+        del activates[:]
+        start.append(True)
+
+    def read():
+        while not start:
+            yield
+        yield from dma_read(reader, addresses, received)
+
+    run_simulation(dut, [write(), read(),
+                         _count_activates(dut.sdram.controller.dfi, activates)])
+    return addresses, received, len(activates)
+
+
+class TestAddressMapping(unittest.TestCase):
+    def test_strided(self):
+        activates = dict()
+        for address_mapping in "rbc", "brc", "bank_xor":
+            addresses, received, activates[address_mapping] = _run_strided(address_mapping)
+            self.assertEqual(received, addresses)
+        self.assertLess(activates["bank_xor"], activates["rbc"])
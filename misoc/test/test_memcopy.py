@@ -0,0 +1,83 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.memcopy import MemCopy
+from misoc.interconnect import wishbone
+
+
+class MemCopyDUT(Module):
+    def __init__(self):
+        self.submodules.memcopy = MemCopy()
+        init = [0x10000 + i for i in range(1024)]
+        self.submodules.sram = wishbone.SRAM(4096, init=init,
+                                             bus=self.memcopy.bus)
+
+
+def _program(dut, **kwargs):
+    for name, value in kwargs.items():
+        csr = getattr(dut.memcopy, name)
+        yield csr.storage.eq(value >> csr.alignment_bits)
+    yield from dut.memcopy.start.write(1)
+
+
+def _wait(dut):
+    cycles = 0
+    yield
+    while (yield dut.memcopy.busy.status):
+        cycles += 1
+        assert cycles < 10000
+        yield
+    return cycles
+
+
+class TestMemCopy(unittest.TestCase):
+    def test_copy(self):
+        dut = MemCopyDUT()
+
+        def gen():
+            yield from _program(dut, source=0, destination=0x400,
+                                length=4*100, fill=0, chain=0)
+            yield from _wait(dut)
+            for i in range(256, 256+100):
+                self.assertEqual((yield dut.sram.mem[i]), 0x10000 + i - 256)
+            self.assertEqual((yield dut.sram.mem[256+100]), 0x10000 + 256+100)
+            self.assertTrue((yield dut.memcopy.ev.done.pending))
+
+        run_simulation(dut, gen())
+
+    def test_fill(self):
+        dut = MemCopyDUT()
+
+        def gen():
+            yield from _program(dut, destination=0x100, length=4*20,
+                                pattern=0xdeadbeef, fill=1, chain=0)
+            yield from _wait(dut)
+            self.assertEqual((yield dut.sram.mem[63]), 0x10000 + 63)
+            for i in range(64, 84):
+                self.assertEqual((yield dut.sram.mem[i]), 0xdeadbeef)
+            self.assertEqual((yield dut.sram.mem[84]), 0x10000 + 84)
+
+        run_simulation(dut, gen())
+
+    def test_chain(self):
+        dut = MemCopyDUT()
+        descriptors = [
+            # next, source/pattern, destination, length|fill
+            (0x810, 0x000, 0x600, 4*10),
+            (0x000, 0x55aa55aa, 0x700, 4*5 | 2**31)
+        ]
+        for i, descriptor in enumerate(descriptors):
+            for j, word in enumerate(descriptor):
+                dut.sram.mem.init[0x800//4 + 4*i + j] = word
+
+        def gen():
+            yield from _program(dut, descriptor=0x800, chain=1)
+            yield from _wait(dut)
+            for i in range(10):
+                self.assertEqual((yield dut.sram.mem[0x600//4 + i]), 0x10000 + i)
+            for i in range(5):
+                self.assertEqual((yield dut.sram.mem[0x700//4 + i]), 0x55aa55aa)
+            self.assertEqual((yield dut.sram.mem[0x700//4 + 5]), 0x10000 + 0x700//4 + 5)
+
+        run_simulation(dut, gen())
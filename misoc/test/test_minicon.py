@@ -0,0 +1,135 @@
+import unittest
+import random
+
+from migen import *
+
+from misoc.cores.sdram_settings import ControllerSettings
+from misoc.test.sdram_sim import MiniconSim, SimModule, phy_settings, DFITimingChecker
+
+
+class TestPagePolicy(unittest.TestCase):
+    def run_policy(self, page_policy, trace):
+        # sequential: back-to-back reads
+        # random: reads in any row and bank, waiting 8 cycles after each one
+        dut = MiniconSim(ControllerSettings(page_policy=page_policy, page_timeout=4))
+        prng = random.Random(0)
+        if trace == "sequential":
+            addresses = list(range(64))
+        else:
+            addresses = [prng.randrange(2**11) for i in range(32)]
+        measuring = []
+        cycles = [0]
+
+        def master():
+            for a in addresses:
+                yield from dut.bus.write(a, a ^ 0x5a5a)
+            measuring.append(True)
+            for a in addresses:
+                data = yield from dut.bus.read(a)
+                self.assertEqual(data, a ^ 0x5a5a)
+                if trace == "random":
+                    for i in range(8):
+                        yield
+            measuring.append(False)
+
+        def counter():
+            while measuring != [True, False]:
+                if measuring:
+                    cycles[0] += 1
+                yield
+
+        run_simulation(dut, [master(), counter()])
+        return cycles[0]
+
+    def test_policies(self):
+        results = dict()
+        for trace in "sequential", "random":
+            for page_policy in "open", "closed", "adaptive":
+                cycles = self.run_policy(page_policy, trace)
+                results[(trace, page_policy)] = cycles
+        self.assertLess(results[("sequential", "open")], results[("sequential", "closed")])
+        self.assertLess(results[("sequential", "adaptive")], results[("sequential", "closed")])
+        self.assertLess(results[("random", "closed")], results[("random", "open")])
+        self.assertLess(results[("random", "adaptive")], results[("random", "open")])
+
+
+class TestPipelined(unittest.TestCase):
+    def run_accesses(self, pipelined, accesses):
+        # accesses: list of (address, write), data is checked against a model
+        dut = MiniconSim(ControllerSettings(pipelined=pipelined))
+        checker = DFITimingChecker(dut.controller.dfi, SimModule.timing_settings,
+                                   phy_settings, 4)
+        done = []
+        cycles = []
+
+        def master():
+            mem = dict()
+            for n, (a, write) in enumerate(accesses):
+                if write:
+                    mem[a] = (a*7 + n) & 0xffff
+                    yield from dut.bus.write(a, mem[a])
+                else:
+                    data = yield from dut.bus.read(a)
+                    self.assertEqual(data, mem.get(a, 0))
+            done.append(True)
+
+        def count():
+            n = 0
+            while not done:
+                n += 1
+                yield
+            cycles.append(n)
+
+        run_simulation(dut, [master(), count(), checker.generator()])
+        self.assertEqual(checker.violations, [])
+        return cycles[0]
+
+    def test_sequential(self):
+        # fill memory, then read it back in sequence, crossing rows and banks
+        accesses = [(a, True) for a in range(256)] + [(a, False) for a in range(256)]
+        normal = self.run_accesses(False, accesses)
+        pipelined = self.run_accesses(True, accesses)
+        self.assertLess(pipelined, normal)
+
+    def test_random(self):
+        prng = random.Random(7)
+        accesses = [(a, True) for a in range(64)]
+        for i in range(256):
+            a = prng.randrange(2**10) if prng.random() < 0.1 else prng.randrange(64)
+            accesses.append((a, prng.random() < 0.3))
+        self.run_accesses(True, accesses)
+
+
+class TestAddressMapping(unittest.TestCase):
+    def run_strided(self, address_mapping):
+        # column-major walk of a 16x4 tile in a frame buffer whose pitch is a
+        # multiple of the bank span
+        dut = MiniconSim(ControllerSettings(address_mapping=address_mapping))
+        pitch = 1 << (SimModule.geom_settings.colbits + SimModule.geom_settings.bankbits)
+        addresses = [y*pitch + x for x in range(16) for y in range(4)]
+        activates = []
+
+        def master():
+            for a in addresses:
+                yield from dut.bus.write(a, a)
+            del activates[:]
+            for a in addresses:
+                self.assertEqual((yield from dut.bus.read(a)), a)
+
+        @passive
+        def count():
+            phase = dut.controller.dfi.phases[0]
+            while True:
+                yield
+                if (not (yield phase.ras_n) and (yield phase.cas_n)
+                        and (yield phase.we_n) and not (yield phase.cs_n)):
+                    activates.append(True)
+
+        run_simulation(dut, [master(), count()])
+        return len(activates)
+
+    def test_strided(self):
+        activates = dict()
+        for address_mapping in "rbc", "brc", "bank_xor":
+            activates[address_mapping] = self.run_strided(address_mapping)
+        self.assertLess(activates["bank_xor"], activates["rbc"])
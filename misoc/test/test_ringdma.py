@@ -0,0 +1,63 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.ringdma import RingWriter, RingReader
+from misoc.test.sdram_sim import LASMISim
+
+
+class RingDUT(Module):
+    def __init__(self):
+        self.submodules.sdram = LASMISim()
+        self.submodules.writer = RingWriter(self.sdram.crossbar.get_master())
+        self.submodules.reader = RingReader(self.sdram.crossbar.get_master())
+
+
+class TestRingDMA(unittest.TestCase):
+    def test_loopback(self):
+        # The writer stores a stream into a ring, and the reader reads it
+        # back. The test plays the role of software, moving the pointers of
+        # each engine once per batch, when the threshold event fires.
+        dut = RingDUT()
+        length = 200
+        received = []
+
+        done = []
+
+        def source():
+            for i in range(length):
+                yield dut.writer.sink.stb.eq(1)
+                yield dut.writer.sink.data.eq(0x1000 + i)
+                yield
+                while not (yield dut.writer.sink.ack):
+                    yield
+            yield dut.writer.sink.stb.eq(0)
+            done.append(True)
+
+        def sink():
+            yield dut.reader.source.ack.eq(1)
+            while len(received) < length:
+                yield
+                if (yield dut.reader.source.stb):
+                    received.append((yield dut.reader.source.data))
+
+        def software():
+            for engine in dut.writer, dut.reader:
+                yield from engine.base.write(0x100*2)
+                yield from engine.size.write(32*2)
+                yield from engine.threshold.write(8*2)
+                yield from engine.enable.write(1)
+            while len(received) < length:
+                # the last words may stay below the threshold
+                flush = done and (yield dut.writer.level.status)
+                if (yield dut.writer.ev.threshold.trigger) or flush:
+                    # hand the data written by the writer to the reader,
+                    # and the space freed by the reader back to the writer
+                    hw_ptr = yield dut.writer.hw_ptr.status
+                    yield from dut.reader.sw_ptr.write(hw_ptr)
+                    hw_ptr = yield dut.reader.hw_ptr.status
+                    yield from dut.writer.sw_ptr.write(hw_ptr)
+                yield
+
+        run_simulation(dut, [source(), sink(), software()])
+        self.assertEqual(received, [0x1000 + i for i in range(length)])
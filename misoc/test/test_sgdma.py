@@ -0,0 +1,81 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.sgdma import SGReader, SGWriter, FLAG_LAST, FLAG_IRQ, FLAG_EOP
+from misoc.interconnect import wishbone, dma_wishbone
+
+
+def _decoder(address):
+    return lambda a: a[26:29] == (address >> 28)
+
+
+class SGDMADUT(Module):
+    def __init__(self):
+        self.buses = [wishbone.Interface() for i in range(3)]
+        self.submodules.sgreader = SGReader(dma_wishbone.Reader(self.buses[0]))
+        self.submodules.sgwriter = SGWriter(dma_wishbone.Reader(self.buses[1]),
+                                            dma_wishbone.Writer(self.buses[2]))
+        self.comb += self.sgreader.source.connect(self.sgwriter.sink)
+
+        self.submodules.sram = wishbone.SRAM(4*1024)
+        self.submodules.interconnect = wishbone.InterconnectShared(
+            self.buses, [(_decoder(0), self.sram.bus)])
+
+    def write_descriptors(self, address, descriptors):
+        for i, descriptor in enumerate(descriptors):
+            for j, word in enumerate(descriptor):
+                self.sram.mem.init[address//4 + 4*i + j] = word
+
+
+class TestSGDMA(unittest.TestCase):
+    def test_chain(self):
+        dut = SGDMADUT()
+        dut.sram.mem.init = [0]*1024
+        for i in range(64):
+            dut.sram.mem.init[i] = 0x1000 + i
+        # gather 3 buffers into one packet, then a second packet
+        dut.write_descriptors(0x800, [
+            (0x000, 4*8,  0x810, 0),
+            (0x100, 4*4,  0x820, FLAG_IRQ),
+            (0x040, 4*2,  0x830, FLAG_EOP),
+            (0x080, 4*5,  0,     FLAG_EOP | FLAG_IRQ | FLAG_LAST)
+        ])
+        # scatter the first packet into two buffers, the second into another
+        dut.write_descriptors(0xa00, [
+            (0x400, 4*10, 0xa10, 0),
+            (0x500, 4*16, 0xa20, FLAG_EOP),
+            (0x600, 4*16, 0,     FLAG_EOP | FLAG_LAST)
+        ])
+        source = [0x1000 + i for i in range(8)] + [0]*4 + \
+                 [0x1000 + 0x10 + i for i in range(2)]
+
+        def gen():
+            yield from dut.sgwriter.descriptor.write(0xa00)
+            yield from dut.sgwriter.start.write(1)
+            yield from dut.sgreader.descriptor.write(0x800)
+            yield from dut.sgreader.start.write(1)
+            yield
+            cycles = 0
+            while (yield dut.sgreader.busy.status) or (yield dut.sgwriter.busy.status):
+                cycles += 1
+                self.assertLess(cycles, 2000)
+                yield
+            self.assertEqual((yield dut.sgreader.completed.status), 4)
+            self.assertEqual((yield dut.sgwriter.completed.status), 3)
+            self.assertTrue((yield dut.sgreader.ev.descriptor.pending))
+            self.assertTrue((yield dut.sgreader.ev.done.pending))
+            self.assertTrue((yield dut.sgwriter.ev.done.pending))
+            # second packet was written into a 16-word buffer
+            self.assertEqual((yield dut.sgwriter.length.status), 4*5)
+
+            for i in range(10):
+                self.assertEqual((yield dut.sram.mem[0x400//4 + i]), source[i])
+            for i in range(4):
+                self.assertEqual((yield dut.sram.mem[0x500//4 + i]), source[10 + i])
+            self.assertEqual((yield dut.sram.mem[0x500//4 + 4]), 0)
+            for i in range(5):
+                self.assertEqual((yield dut.sram.mem[0x600//4 + i]), 0x1000 + 0x20 + i)
+            self.assertEqual((yield dut.sram.mem[0x600//4 + 5]), 0)
+
+        run_simulation(dut, gen())
@@ -0,0 +1,42 @@
+import unittest
+import inspect
+
+from migen import *
+from migen.build.generic_platform import GenericPlatform
+from migen.fhdl.verilog import convert
+from migen.genlib.record import Record
+
+from misoc.cores.sdram_model import SDRAMPHYSim
+from misoc.integration.soc_sdram import SoCSDRAM
+from misoc.test.sdram_sim import SimModule, phy_settings
+
+
+class _Platform(GenericPlatform):
+    def __init__(self):
+        GenericPlatform.__init__(self, "", [])
+
+
+# the SoC core uses Record.connect(leave_out=...)
+_connect_leave_out = "leave_out" in inspect.signature(Record.connect).parameters
+
+
+@unittest.skipUnless(_connect_leave_out, "Migen without Record.connect(leave_out)")
+class TestSoCSDRAM(unittest.TestCase):
+    def elaborate(self, sdram_controller_type):
+        # no L2 cache, and an 8-bit native interface narrower than the
+        # controller
+        soc = SoCSDRAM(_Platform(), 50e6, cpu_type="or1k",
+                       integrated_rom_size=0x1000, l2_size=0,
+                       with_uart=False, with_timer=False)
+        soc.submodules.sdrphy = SDRAMPHYSim(SimModule, phy_settings)
+        soc.register_sdram(soc.sdrphy, sdram_controller_type,
+                           SimModule.geom_settings, SimModule.timing_settings)
+        native = soc.get_native_sdram_if(8)
+        self.assertEqual(len(native.dat_w), 8)
+        convert(soc, ios=set())
+
+    def test_lasmicon(self):
+        self.elaborate("lasmicon")
+
+    def test_minicon(self):
+        self.elaborate("minicon")
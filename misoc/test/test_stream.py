@@ -0,0 +1,321 @@
+import unittest
+import random
+
+from migen import *
+
+from misoc.interconnect import stream
+
+
+def _send(endpoint, packets, **fields):
+    for packet in packets:
+        for i, data in enumerate(packet):
+            yield endpoint.stb.eq(1)
+            yield endpoint.eop.eq(i == len(packet) - 1)
+            yield endpoint.data.eq(data)
+            for name, value in fields.items():
+                yield getattr(endpoint, name).eq(value)
+            yield
+            while not (yield endpoint.ack):
+                yield
+        yield endpoint.stb.eq(0)
+
+
+def _receive(endpoint, npackets, packets, ack_probability=1.0, beats=None):
+    packet = []
+    while len(packets) < npackets:
+        ack = random.random() < ack_probability
+        yield endpoint.ack.eq(ack)
+        yield
+        if ack and (yield endpoint.stb):
+            packet.append((yield endpoint.data))
+            if beats is not None:
+                beats.append(True)
+            if (yield endpoint.eop):
+                packets.append(packet)
+                packet = []
+        elif beats is not None:
+            beats.append(False)
+
+
+class TestArbiter(unittest.TestCase):
+    def run_arbiter(self, policy):
+        dut = stream.Arbiter([("data", 16)], 3, policy)
+        sent = [[[256*n + 16*p + i for i in range(1 + (n+p) % 5)]
+                 for p in range(6)] for n in range(3)]
+        received = []
+        beats = []
+        generators = [_send(getattr(dut, "sink"+str(n)), sent[n])
+                      for n in range(3)]
+        generators.append(_receive(dut.source, 18, received, beats=beats))
+        run_simulation(dut, generators)
+
+        # packets are not interleaved, and ordered per sink
+        for n in range(3):
+            self.assertEqual([p for p in received if p[0]//256 == n], sent[n])
+        # one beat per cycle while all sinks have data
+        total = sum(len(p) for s in sent for p in s)
+        first = beats.index(True)
+        self.assertTrue(all(beats[first:first + total]))
+        return received
+
+    def test_roundrobin(self):
+        received = self.run_arbiter("roundrobin")
+        self.assertEqual([p[0]//256 for p in received[:6]], [0, 1, 2, 0, 1, 2])
+
+    def test_priority(self):
+        received = self.run_arbiter("priority")
+        self.assertEqual([p[0]//256 for p in received[:6]], [0]*6)
+
+
+class TestDispatcher(unittest.TestCase):
+    def test_dispatcher(self):
+        dut = stream.Dispatcher([("data", 16), ("dst", 2)], 3, sel_field="dst")
+        prng = random.Random(42)
+        destinations = [prng.randrange(3) for i in range(12)]
+        packets = [[16*p + i for i in range(1 + p % 4)] for p in range(12)]
+        received = [[], [], []]
+
+        def send():
+            for dst, packet in zip(destinations, packets):
+                yield from _send(dut.sink, [packet], dst=dst)
+
+        generators = [send()]
+        for n in range(3):
+            generators.append(_receive(getattr(dut, "source"+str(n)),
+                                       destinations.count(n), received[n],
+                                       ack_probability=0.5))
+        run_simulation(dut, generators)
+
+        for n in range(3):
+            self.assertEqual(received[n],
+                [p for d, p in zip(destinations, packets) if d == n])
+
+
+class TestPacketFIFO(unittest.TestCase):
+    def test_sync(self):
+        dut = stream.SyncPacketFIFO([("data", 16)], 16)
+        packets = [[16*p + i for i in range(1 + p % 6)] for p in range(10)]
+        # packet 3 is marked bad, packet 4 does not fit in the FIFO
+        packets[4] = list(range(40))
+        received = []
+
+        def send():
+            for p, packet in enumerate(packets):
+                for i, data in enumerate(packet):
+                    yield dut.sink.stb.eq(1)
+                    yield dut.sink.eop.eq(i == len(packet) - 1)
+                    yield dut.sink.data.eq(data)
+                    yield dut.drop.eq(p == 3 and i == 1)
+                    yield
+                    # the packet is not visible until its end
+                    if i != len(packet) - 1 and p < 4:
+                        self.assertEqual((yield dut.packets), 0)
+                        self.assertEqual((yield dut.source.stb), 0)
+                yield dut.sink.stb.eq(0)
+                yield dut.drop.eq(0)
+                if p < 4:
+                    # let the receiver empty the FIFO
+                    for i in range(10):
+                        yield
+            yield
+            self.assertEqual((yield dut.dropped), 2)
+
+        def receive():
+            yield from _receive(dut.source, 8, received)
+
+        run_simulation(dut, [send(), receive()])
+        self.assertEqual(received, [p for n, p in enumerate(packets)
+                                    if n not in (3, 4)])
+
+    def test_level(self):
+        dut = stream.SyncPacketFIFO([("data", 16)], 16)
+
+        def gen():
+            yield from _send(dut.sink, [[1, 2, 3], [4, 5]])
+            yield dut.sink.data.eq(6)
+            yield dut.sink.eop.eq(0)
+            yield dut.sink.stb.eq(1)
+            yield
+            yield dut.sink.stb.eq(0)
+            yield
+            self.assertEqual((yield dut.packets), 2)
+            self.assertEqual((yield dut.level), 6)
+
+        run_simulation(dut, gen())
+
+    def test_async(self):
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_write = ClockDomain()
+                self.clock_domains.cd_read = ClockDomain()
+                self.submodules.fifo = stream.AsyncPacketFIFO([("data", 16)], 32)
+
+        dut = DUT()
+        packets = [[16*p + i for i in range(1 + p % 6)] for p in range(10)]
+        received = []
+        run_simulation(dut, {
+                "write": _send(dut.fifo.sink, packets),
+                "read": _receive(dut.fifo.source, len(packets), received)
+            }, clocks={"write": 10, "read": 7})
+        self.assertEqual(received, packets)
+
+
+class TestFIFOThresholds(unittest.TestCase):
+    def test_sync(self):
+        dut = stream.SyncFIFO([("data", 8)], 8, almost_full=6, almost_empty=1)
+
+        def gen():
+            for i in range(1, 9):
+                yield dut.sink.stb.eq(1)
+                yield dut.sink.data.eq(i)
+                yield
+                yield dut.sink.stb.eq(0)
+                yield
+                self.assertEqual((yield dut.level), i)
+                self.assertEqual((yield dut.almost_full), i >= 6)
+                self.assertEqual((yield dut.almost_empty), i <= 1)
+            self.assertFalse((yield dut.sink.ack))
+
+        run_simulation(dut, gen())
+
+    def run_async(self, buffered):
+        class DUT(Module):
+            def __init__(self):
+                self.clock_domains.cd_write = ClockDomain()
+                self.clock_domains.cd_read = ClockDomain()
+                self.submodules.fifo = stream.AsyncFIFO([("data", 16)], 16,
+                    buffered=buffered, almost_full=12, almost_empty=3)
+
+        dut = DUT()
+        fifo = dut.fifo
+        length = 64
+        received = []
+
+        def write():
+            for i in range(length):
+                while (yield fifo.almost_full):
+                    yield fifo.sink.stb.eq(0)
+                    yield
+                yield fifo.sink.stb.eq(1)
+                yield fifo.sink.data.eq(i)
+                yield
+                self.assertTrue((yield fifo.sink.ack))
+            yield fifo.sink.stb.eq(0)
+
+        def read():
+            # bursts of 4 words, started only when the data is available
+            while len(received) < length:
+                if (yield fifo.almost_empty):
+                    yield
+                    continue
+                for i in range(4):
+                    yield fifo.source.ack.eq(1)
+                    yield
+                    self.assertTrue((yield fifo.source.stb))
+                    received.append((yield fifo.source.data))
+                yield fifo.source.ack.eq(0)
+
+        run_simulation(dut, {"write": write(), "read": read()},
+                       clocks={"write": 7, "read": 10})
+        self.assertEqual(received, list(range(length)))
+
+    def test_async(self):
+        self.run_async(False)
+
+    def test_async_buffered(self):
+        self.run_async(True)
+
+    def test_async_levels(self):
+        # level logic is only generated when requested
+        fifo = stream.AsyncFIFO([("data", 16)], 16)
+        self.assertFalse(hasattr(fifo, "level_write"))
+        self.assertFalse(hasattr(fifo, "level_read"))
+        fifo = stream.AsyncFIFO([("data", 16)], 16, almost_full=12)
+        self.assertTrue(hasattr(fifo, "level_write"))
+        self.assertFalse(hasattr(fifo, "level_read"))
+        fifo = stream.AsyncFIFO([("data", 16)], 16, with_levels=True)
+        self.assertTrue(hasattr(fifo, "level_write"))
+        self.assertTrue(hasattr(fifo, "level_read"))
+
+
+class TestGearbox(unittest.TestCase):
+    def check(self, nbits_from, nbits_to):
+        prng = random.Random(nbits_from*nbits_to)
+        packets = [[prng.randrange(2**nbits_from) for i in range(prng.randrange(1, 20))]
+                   for p in range(8)]
+        expected = []
+        for packet in packets:
+            value = sum(data << (i*nbits_from) for i, data in enumerate(packet))
+            nwords = (len(packet)*nbits_from + nbits_to - 1)//nbits_to
+            expected.append([(value >> (i*nbits_to)) & (2**nbits_to - 1)
+                             for i in range(nwords)])
+
+        dut = stream.Gearbox(nbits_from, nbits_to)
+        received = []
+        run_simulation(dut, [_send(dut.sink, packets),
+                             _receive(dut.source, len(packets), received,
+                                      ack_probability=0.7)])
+        self.assertEqual(received, expected)
+
+    def test_widths(self):
+        for nbits_from, nbits_to in [(24, 32), (32, 24), (10, 8), (8, 10),
+                                     (66, 64), (64, 66), (16, 16)]:
+            with self.subTest(nbits_from=nbits_from, nbits_to=nbits_to):
+                self.check(nbits_from, nbits_to)
+
+    def test_throughput(self):
+        for nbits_from, nbits_to in [(24, 32), (32, 24), (66, 64)]:
+            dut = stream.Gearbox(nbits_from, nbits_to)
+            n = 96
+            packet = list(range(n))
+            received = []
+            beats = []
+            run_simulation(dut, [_send(dut.sink, [packet]),
+                                 _receive(dut.source, 1, received, beats=beats)])
+            first = beats.index(True)
+            cycles = len(beats) - first
+            # the slower side of the gearbox runs at one word per cycle
+            words = max(n, (n*nbits_from + nbits_to - 1)//nbits_to)
+            self.assertLessEqual(cycles, words + 2)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_pipeline(self):
+        class DUT(Module):
+            def __init__(self):
+                self.submodules.up = stream.Gearbox(8, 24)
+                self.submodules.down = stream.Gearbox(24, 8)
+                self.submodules.fifo = stream.SyncFIFO([("data", 8)], 4)
+                self.submodules.pipeline = stream.Pipeline(
+                    ("up", self.up), ("down", self.down), ("fifo", self.fifo),
+                    buffered=["up"])
+
+        dut = DUT()
+        packets = [list(range(p, p + 3*(p + 1))) for p in range(5)]
+        received = []
+        run_simulation(dut, [_send(dut.pipeline.sink, packets),
+                             _receive(dut.pipeline.source, len(packets), received,
+                                      ack_probability=0.5),
+                             dut.pipeline.measure()])
+        self.assertEqual(received, packets)
+        self.assertEqual(list(dut.pipeline.statistics.keys()), ["up", "down"])
+        # the 24-bit stage transfers at most one beat every 3 cycles
+        transfers, stalls, idles = dut.pipeline.statistics["up"]
+        self.assertEqual(transfers, sum(len(p) for p in packets)//3)
+        self.assertGreater(idles, 2*transfers)
+        self.assertIn("down:", dut.pipeline.report())
+
+    def test_bidirectional_end(self):
+        class PHY(Module):
+            def __init__(self):
+                self.sink = stream.Endpoint([("data", 8)])
+                self.source = stream.Endpoint([("data", 8)])
+
+        phy = PHY()
+        fifo = stream.SyncFIFO([("data", 8)], 4)
+        rx = stream.Pipeline(("phy", phy), ("fifo", fifo), sink=False)
+        self.assertIsNone(rx.sink)
+        self.assertIs(rx.source, fifo.source)
+        tx = stream.Pipeline(("fifo", fifo), ("phy", phy), source=False)
+        self.assertIs(tx.sink, fifo.sink)
+        self.assertIsNone(tx.source)
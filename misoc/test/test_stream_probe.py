@@ -0,0 +1,62 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.stream_probe import PipelineProbes
+from misoc.interconnect import stream
+
+
+class ProbeDUT(Module):
+    def __init__(self):
+        layout = [("data", 8)]
+        self.submodules.first = stream.Buffer(layout)
+        self.submodules.second = stream.Buffer(layout)
+        self.submodules.third = stream.Buffer(layout)
+        self.submodules.pipeline = stream.Pipeline(("first", self.first),
+                                                   ("second", self.second),
+                                                   ("third", self.third))
+        self.submodules.probes = PipelineProbes(self.pipeline, period_bits=6)
+
+
+class TestStreamProbe(unittest.TestCase):
+    def test_pipeline(self):
+        dut = ProbeDUT()
+        self.assertEqual([csr.name for csr in dut.probes.get_csrs()],
+                         ["first_update", "first_transfers", "first_stalls",
+                          "first_idles", "first_packets",
+                          "second_update", "second_transfers", "second_stalls",
+                          "second_idles", "second_packets"])
+
+        def source():
+            for i in range(8):
+                yield dut.pipeline.sink.stb.eq(1)
+                yield dut.pipeline.sink.eop.eq(i % 4 == 3)
+                yield
+                while not (yield dut.pipeline.sink.ack):
+                    yield
+            yield dut.pipeline.sink.stb.eq(0)
+
+        def sink():
+            # accept one beat every other cycle
+            for i in range(64):
+                yield dut.pipeline.source.ack.eq(i % 2)
+                yield
+            yield dut.pipeline.source.ack.eq(1)
+
+        def software():
+            # wait for the end of the first window
+            for i in range(80):
+                yield
+            yield from dut.probes.second._update.write(1)
+            yield
+            self.assertEqual((yield dut.probes.second._transfers.status), 8)
+            self.assertEqual((yield dut.probes.second._packets.status), 2)
+            stalls = yield dut.probes.second._stalls.status
+            idles = yield dut.probes.second._idles.status
+            self.assertEqual(8 + stalls + idles, 64)
+            # the third stage buffers one beat
+            self.assertGreaterEqual(stalls, 6)
+            # the last stage is not connected to another stage
+            self.assertFalse(hasattr(dut.probes, "third"))
+
+        run_simulation(dut, [source(), sink(), software()])
@@ -0,0 +1,74 @@
+import unittest
+
+from migen import *
+
+from misoc.cores.tcm import TCM
+from misoc.interconnect import wishbone
+
+
+def _decoder(address):
+    return lambda a: a[26:29] == (address >> 28)
+
+
+class TCMDUT(Module):
+    def __init__(self, with_tcm):
+        self.dbus = wishbone.Interface()
+        self.ibus = wishbone.Interface()
+
+        self.submodules.sram = wishbone.SRAM(1024)
+        self.submodules.main_ram = wishbone.SRAM(1024)
+        slaves = [
+            (_decoder(0x10000000), self.sram.bus),
+            (_decoder(0x40000000), self.main_ram.bus)
+        ]
+        if with_tcm:
+            self.submodules.tcm = TCM(1024, _decoder(0x10000000), self.dbus)
+            masters = [self.ibus, self.tcm.dbus_output]
+        else:
+            masters = [self.ibus, self.dbus]
+        self.submodules.interconnect = wishbone.InterconnectShared(
+            masters, slaves, register=True)
+
+
+class TestTCM(unittest.TestCase):
+    def run_dut(self, with_tcm):
+        dut = TCMDUT(with_tcm)
+        cycles = [0]
+        result = []
+
+        @passive
+        def counter():
+            while True:
+                cycles[0] += 1
+                yield
+
+        @passive
+        def instruction_fetch():
+            # keep the shared interconnect busy
+            while True:
+                yield from dut.ibus.read(0x40000000 >> 2)
+                yield
+
+        def data_access():
+            sram = 0x10000000 >> 2
+            main_ram = 0x40000000 >> 2
+            start = cycles[0]
+            for i in range(16):
+                yield from dut.dbus.write(sram + i, i)
+            for i in range(16):
+                self.assertEqual((yield from dut.dbus.read(sram + i)), i)
+            result.append(cycles[0] - start)
+            # accesses outside the TCM window still reach the interconnect
+            yield from dut.dbus.write(main_ram + 3, 0x1234)
+            self.assertEqual((yield from dut.dbus.read(main_ram + 3)), 0x1234)
+            self.assertEqual((yield dut.main_ram.mem[3]), 0x1234)
+
+        run_simulation(dut, [counter(), instruction_fetch(), data_access()])
+        return result[0]
+
+    def test_cycle_count(self):
+        shared = self.run_dut(False)
+        tcm = self.run_dut(True)
+        self.assertLess(tcm, shared)
+        # one cycle to issue, one cycle to ack
+        self.assertEqual(tcm, 32*2)
@@ -0,0 +1,126 @@
+import unittest
+
+from migen import *
+
+from misoc.interconnect import wishbone
+
+
+class InterleavedSRAMDUT(Module):
+    def __init__(self, nmasters, nbanks, granularity=1):
+        self.masters = [wishbone.Interface() for i in range(nmasters)]
+        self.submodules.sram = wishbone.InterleavedSRAM(
+            1024, nbanks, granularity)
+        self.submodules.crossbar = wishbone.Crossbar(
+            self.masters, self.sram.get_slaves(), register=True)
+
+
+class TestInterleavedSRAM(unittest.TestCase):
+    def test_write_read(self):
+        dut = InterleavedSRAMDUT(1, 4, granularity=2)
+
+        def gen():
+            bus = dut.masters[0]
+            for i in range(32):
+                yield from bus.write(i, 0x1000 + i)
+            for i in reversed(range(32)):
+                self.assertEqual((yield from bus.read(i)), 0x1000 + i)
+            for n, bank in enumerate(dut.sram.banks):
+                for i in range(4):
+                    word = yield bank.mem[i]
+                    adr = (i//2)*8 + n*2 + i % 2
+                    self.assertEqual(word, 0x1000 + adr)
+
+        run_simulation(dut, gen())
+
+    def test_init(self):
+        init = list(range(256))
+        sram = wishbone.InterleavedSRAM(1024, 2, init=init)
+        self.assertEqual(sram.banks[0].mem.init, init[0::2])
+        self.assertEqual(sram.banks[1].mem.init, init[1::2])
+
+    def test_parallel_access(self):
+        def run(addresses):
+            dut = InterleavedSRAMDUT(2, 2)
+            cycles = [0]
+            done = []
+
+            def master(n):
+                bus = dut.masters[n]
+                for a in addresses[n]:
+                    yield from bus.write(a, a)
+                for a in addresses[n]:
+                    self.assertEqual((yield from bus.read(a)), a)
+                done.append(cycles[0])
+
+            @passive
+            def counter():
+                while True:
+                    cycles[0] += 1
+                    yield
+
+            run_simulation(dut, [master(0), master(1), counter()])
+            return max(done)
+
+        n = 16
+        # masters in different banks
+        parallel = run([range(0, 2*n, 2), range(1, 2*n, 2)])
+        # masters in the same bank
+        serialized = run([range(0, 2*n, 2), range(2*n, 4*n, 2)])
+        self.assertLess(parallel*1.5, serialized)
+
+
+class UpConverterDUT(Module):
+    def __init__(self):
+        self.bus = wishbone.Interface(8)
+        self.submodules.sram = wishbone.SRAM(64)
+        self.submodules.converter = wishbone.Converter(self.bus, self.sram.bus)
+
+
+class TestUpConverter(unittest.TestCase):
+    def test_write_read(self):
+        dut = UpConverterDUT()
+
+        def gen():
+            for a in range(16):
+                yield from dut.bus.write(a, 0x10 + a, sel=1)
+            for a in reversed(range(16)):
+                self.assertEqual((yield from dut.bus.read(a)), 0x10 + a)
+            # lowest address in the least significant byte
+            self.assertEqual((yield dut.sram.mem[1]), 0x17161514)
+
+        run_simulation(dut, gen())
+
+    def test_burst_read(self):
+        dut = UpConverterDUT()
+        slave_reads = []
+
+        def gen():
+            for a in range(16):
+                yield from dut.bus.write(a, 0x20 + a, sel=1)
+            received = []
+            yield dut.bus.cyc.eq(1)
+            yield dut.bus.stb.eq(1)
+            yield dut.bus.we.eq(0)
+            for a in range(4, 12):
+                yield dut.bus.adr.eq(a)
+                yield dut.bus.cti.eq(7 if a == 11 else 2)
+                yield
+                while not (yield dut.bus.ack):
+                    yield
+                received.append((yield dut.bus.dat_r))
+            yield dut.bus.cyc.eq(0)
+            yield dut.bus.stb.eq(0)
+            yield
+            self.assertEqual(received, [0x20 + a for a in range(4, 12)])
+
+        @passive
+        def monitor():
+            while True:
+                if ((yield dut.sram.bus.stb) and (yield dut.sram.bus.ack)
+                        and not (yield dut.sram.bus.we)):
+                    slave_reads.append((yield dut.sram.bus.adr))
+                yield
+
+        run_simulation(dut, [gen(), monitor()])
+        # one slave read per 32-bit word of the burst
+        self.assertEqual(slave_reads, [1, 2])
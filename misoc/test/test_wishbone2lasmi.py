@@ -0,0 +1,135 @@
+import unittest
+import random
+
+from migen import *
+
+from misoc.interconnect import wishbone, wishbone2lasmi
+from misoc.test.sdram_sim import LASMISim
+
+
+class L2DUT(Module):
+    def __init__(self, burst):
+        self.submodules.sdram = LASMISim()
+        lasmim = self.sdram.crossbar.get_master()
+        self.bus = wishbone.Interface()
+        self.submodules.l2_cache = wishbone.Cache(16, self.bus,
+                                                  wishbone.Interface(lasmim.dw))
+        self.submodules.bridge = wishbone2lasmi.WB2LASMI(self.l2_cache.slave,
+                                                         lasmim, burst)
+
+
+class TestWB2LASMI(unittest.TestCase):
+    def run_l2(self, burst):
+        # random accesses through a small L2 cache, causing refills and
+        # evictions
+        dut = L2DUT(burst)
+        prng = random.Random(3)
+        accesses = [(prng.randrange(128), prng.random() < 0.5) for i in range(128)]
+        cycles = []
+
+        def gen():
+            mem = dict()
+            for i, (a, write) in enumerate(accesses):
+                if write:
+                    mem[a] = (i << 8) | a
+                    yield from dut.bus.write(a, mem[a])
+                else:
+                    self.assertEqual((yield from dut.bus.read(a)), mem.get(a, 0))
+            cycles.append(n_cycles[0])
+
+        n_cycles = [0]
+
+        @passive
+        def counter():
+            while True:
+                yield
+                n_cycles[0] += 1
+
+        run_simulation(dut, [gen(), counter()])
+        return cycles[0]
+
+    def test_l2(self):
+        single = self.run_l2(1)
+        burst = self.run_l2(2)
+        self.assertLess(burst, single)
+
+
+class ConverterDUT(Module):
+    def __init__(self, data_width=32):
+        self.submodules.sdram = LASMISim()
+        self.bus = wishbone.Interface(data_width)
+        self.submodules.bridge = wishbone2lasmi.Bridge(
+            self.bus, self.sdram.crossbar.get_master())
+
+
+class SharedDUT(Module):
+    # as SoCSDRAM with LASMIcon and l2_size=0: the 32-bit CPU bus and an
+    # 8-bit native interface on their own crossbar ports
+    def __init__(self):
+        self.submodules.sdram = LASMISim()
+        crossbar = self.sdram.crossbar
+        self.cpu = wishbone.Interface()
+        self.native = wishbone.Interface(8)
+        self.submodules.cpu_bridge = wishbone2lasmi.Bridge(
+            self.cpu, crossbar.get_master())
+        self.submodules.native_bridge = wishbone2lasmi.Bridge(
+            self.native, crossbar.get_master())
+
+
+class TestConverter(unittest.TestCase):
+    def test_write_read(self):
+        # 32-bit accesses without L2 cache, as from a cacheless CPU
+        dut = ConverterDUT()
+
+        def gen():
+            for a in range(16):
+                yield from dut.bus.write(a, 0x01000001*a + 0x5a5a)
+            yield from dut.bus.write(3, 0x12345678, sel=0b0110)
+            for a in reversed(range(16)):
+                expected = 0x01000001*a + 0x5a5a
+                if a == 3:
+                    expected = (expected & 0xff0000ff) | 0x00345600
+                self.assertEqual((yield from dut.bus.read(a)), expected)
+
+        run_simulation(dut, gen())
+
+    def test_narrow(self):
+        # 8-bit accesses, narrower than the controller
+        dut = ConverterDUT(8)
+
+        def gen():
+            for a in range(16):
+                yield from dut.bus.write(a, 0x30 + a, sel=1)
+            for a in reversed(range(16)):
+                self.assertEqual((yield from dut.bus.read(a)), 0x30 + a)
+
+        run_simulation(dut, gen())
+
+    def test_shared(self):
+        # each bus writes its half of the memory concurrently with the
+        # other, then reads back the half of the other
+        dut = SharedDUT()
+        done = []
+
+        def cpu():
+            for a in range(8):
+                yield from dut.cpu.write(a, 0x04030201*a + 0x80706050)
+            done.append("cpu")
+            while "native" not in done:
+                yield
+            for a in range(8, 16):
+                expected = sum((4*a + i) << 8*i for i in range(4))
+                self.assertEqual((yield from dut.cpu.read(a)), expected)
+
+        def native():
+            for a in range(32, 64):
+                yield from dut.native.write(a, a, sel=1)
+            done.append("native")
+            while "cpu" not in done:
+                yield
+            for a in range(32):
+                expected = ((0x04030201*(a//4) + 0x80706050) >> 8*(a % 4)) & 0xff
+                self.assertEqual((yield from dut.native.read(a)), expected)
+
+        run_simulation(dut, [cpu(), native()])
+        self.assertEqual(len(done), 2)
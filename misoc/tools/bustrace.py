@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import OrderedDict
+
+from misoc.cores.bus_trace import entry_layout
+
+
+def decode_entry(value):
+    r = dict()
+    offset = 0
+    for name, width in entry_layout:
+        r[name] = (value >> offset) & (2**width - 1)
+        offset += width
+    return r
+
+
+def entries_per_page(csr_data_width=8):
+    """Number of entries in each page of the trace memory CSR window,
+    selected by the ``mem_page`` CSR."""
+    entry_bits = sum(width for name, width in entry_layout)
+    return 512*csr_data_width//entry_bits
+
+
+def decode(data, count=None):
+    """Decode a dump of the trace memory, as read from its CSR window
+    (most significant byte of each entry first), with the pages of deep
+    buffers concatenated in order. Addresses are bus word addresses."""
+    entry_bytes = sum(width for name, width in entry_layout)//8
+    if count is None:
+        count = len(data)//entry_bytes
+    entries = []
+    for i in range(count):
+        chunk = data[i*entry_bytes:(i+1)*entry_bytes]
+        entries.append(decode_entry(int.from_bytes(chunk, "big")))
+    return entries
+
+
+def master_statistics(entries):
+    if not entries:
+        return OrderedDict()
+    start = entries[0]["timestamp"]
+    span = entries[-1]["timestamp"] - start + 1
+    stats = OrderedDict()
+    for entry in sorted(entries, key=lambda e: e["master"]):
+        s = stats.setdefault(entry["master"], {
+            "accesses": 0, "reads": 0, "writes": 0, "errors": 0,
+            "total_latency": 0, "max_latency": 0})
+        s["accesses"] += 1
+        if entry["we"]:
+            s["writes"] += 1
+        else:
+            s["reads"] += 1
+        s["errors"] += entry["err"]
+        s["total_latency"] += entry["latency"]
+        s["max_latency"] = max(s["max_latency"], entry["latency"])
+    for s in stats.values():
+        s["average_latency"] = s["total_latency"]/s["accesses"]
+        s["bandwidth"] = s["accesses"]/span
+    return stats
+
+
+def timeline(entries, window):
+    """Return a list of (start timestamp, {master: accesses}) for each window
+    of ``window`` cycles."""
+    if not entries:
+        return []
+    start = entries[0]["timestamp"]
+    r = []
+    for entry in entries:
+        n = (entry["timestamp"] - start)//window
+        while len(r) <= n:
+            r.append((start + len(r)*window, dict()))
+        accesses = r[n][1]
+        accesses[entry["master"]] = accesses.get(entry["master"], 0) + 1
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MiSoC bus trace decoder")
+    parser.add_argument("dump", help="binary dump of the trace memory, "
+                        "with its pages (mem_page CSR) concatenated in order")
+    parser.add_argument("-n", "--count", default=None, type=int,
+                        help="number of valid entries (value of the count CSR)")
+    parser.add_argument("-w", "--window", default=256, type=int,
+                        help="timeline window, in cycles")
+    parser.add_argument("-l", "--list", default=False, action="store_true",
+                        help="list individual accesses (with bus word addresses)")
+    args = parser.parse_args()
+
+    with open(args.dump, "rb") as f:
+        entries = decode(f.read(), args.count)
+
+    if args.list:
+        for e in entries:
+            print("{:10d} master {:2d} {} 0x{:08x} latency {:5d}{}".format(
+                e["timestamp"], e["master"], "W" if e["we"] else "R",
+                e["address"], e["latency"], " ERR" if e["err"] else ""))
+        print()
+
+    print("master  accesses  reads  writes  errors  avg lat  max lat  accesses/cycle")
+    for master, s in master_statistics(entries).items():
+        print("{:6d}  {:8d}  {:5d}  {:6d}  {:6d}  {:7.2f}  {:7d}  {:14.3f}".format(
+            master, s["accesses"], s["reads"], s["writes"], s["errors"],
+            s["average_latency"], s["max_latency"], s["bandwidth"]))
+    print()
+
+    print("timeline ({} cycle windows, accesses per master):".format(args.window))
+    for start, accesses in timeline(entries, args.window):
+        print("{:10d}  ".format(start) + "  ".join(
+            "{}:{}".format(master, n) for master, n in sorted(accesses.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,7 @@ setup(
         "console_scripts": [
             "flterm=misoc.tools.flterm:main",
             "mkmscimg=misoc.tools.mkmscimg:main",
+            "bustrace=misoc.tools.bustrace:main",
         ],
     },
 )